@@ -24,6 +24,20 @@ Database backend base class.
 
 
 import abc
+import time
+
+import requests
+import requests.adapters
+import urllib3.exceptions
+
+from ipam_migrator.db.extra import ExtraTable
+
+from ipam_migrator.exception import PlanError
+
+from ipam_migrator.metrics import Metrics
+from ipam_migrator.progress import Progress
+from ipam_migrator.ratelimit import RateLimiter
+from ipam_migrator.trace import ObjectTrace
 
 
 class BaseBackend(abc.ABC):
@@ -32,7 +46,29 @@ class BaseBackend(abc.ABC):
     '''
 
 
-    def __init__(self, logger, name):
+    # HTTP status codes for which a failed API request is retried.
+    RETRY_STATUS_CODES = (502, 503, 504)
+
+    # HTTP methods which can be retried after the request has been sent,
+    # as repeating them has no further effect. Other requests are only
+    # retried if the connection could not be made.
+    RETRY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+    # Response encodings accepted from the API endpoint.
+    ACCEPT_ENCODING = "gzip, deflate"
+
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, logger, name,
+                 metrics=None,
+                 progress=None,
+                 trace=None,
+                 api_retries=0,
+                 http_cache=None,
+                 transform=None,
+                 extra_fields=None,
+                 pool_size=None,
+                 rate_limit=None):
         '''
         Database backend constructor.
         '''
@@ -40,15 +76,211 @@ class BaseBackend(abc.ABC):
         self.logger = logger
         self.name = name
 
+        # Set by the backend implementation.
+        self.api_endpoint = None
+
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.progress = progress if progress is not None else Progress(logger)
+        self.trace = trace if trace is not None else ObjectTrace(logger)
+        self.api_retries = api_retries
+        self.http_cache = http_cache
+        self.transform = transform
+
+        # Object type -> names of the extra fields to keep from input records.
+        self.extra_fields = extra_fields if extra_fields else {}
+
+        # Object type -> ExtraTable of the extra fields read.
+        self.extras = {}
+
+        # Maximum number of API requests per second, if limited.
+        self.rate_limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        # Persistent HTTP session, reusing connections between requests.
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = self.ACCEPT_ENCODING
+
+        # Keep more connections open for concurrent requests, if configured.
+        if pool_size:
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+            self.session.mount("http://", adapter)
+            self.session.mount("https://", adapter)
+
+
+    def http_request(self, method, uri, **kwargs):
+        '''
+        Send an HTTP request to the API endpoint, retrying on connection
+        errors and gateway errors, and recording request metrics.
+        Requests (including retries) wait for the rate limiter, if any.
+
+        Requests which are not idempotent (e.g. POST) are only retried if
+        they were never sent, as the API may have acted on a request whose
+        response was lost or was a gateway error.
+
+        If an HTTP cache is configured, GET requests are revalidated
+        against the cache, and successful responses are stored in it.
+        '''
+
+        endpoint = self.metrics.endpoint_get(uri, self.api_endpoint)
+        attempt = 0
+        idempotent = method in self.RETRY_METHODS
+
+        # Streamed responses are read by the caller, so they are not cached.
+        use_cache = self.http_cache is not None and method == "GET" and not kwargs.get("stream")
+        if use_cache:
+            headers_unconditional = kwargs.get("headers")
+            headers = dict(headers_unconditional or {})
+            headers.update(self.http_cache.headers_get(uri))
+            kwargs["headers"] = headers
+        revalidating = use_cache
+
+        while True:
+            if self.rate_limiter is not None and self.rate_limiter.acquire():
+                self.metrics.counter_add("{}.rate_limit.delayed".format(self.name))
+
+            start = time.time()
+            try:
+                response = self.session.request(method, uri, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                self.metrics.request_record(
+                    self.name, method, endpoint,
+                    time.time() - start,
+                    error=True,
+                )
+                if attempt >= self.api_retries or \
+                   not (idempotent or self.request_unsent(err)):
+                    raise
+            else:
+                body = response.request.body
+                # Streamed response bodies have not been read yet,
+                # so only their reported length is known.
+                if kwargs.get("stream"):
+                    bytes_received = int(response.headers.get("Content-Length", 0))
+                else:
+                    bytes_received = len(response.content)
+                self.metrics.request_record(
+                    self.name, method, endpoint,
+                    time.time() - start,
+                    bytes_sent=len(body) if body else 0,
+                    bytes_received=bytes_received,
+                    error=response.status_code >= 400,
+                )
+                if response.status_code not in self.RETRY_STATUS_CODES or \
+                   attempt >= self.api_retries or not idempotent:
+                    if not use_cache:
+                        return response
+                    cached_response = self.http_cache_update(uri, response)
+                    if cached_response is not None:
+                        return cached_response
+                    if not revalidating:
+                        return response
+                    # The cached response is gone, so request it again
+                    # without revalidating it.
+                    kwargs["headers"] = headers_unconditional
+                    revalidating = False
+                    continue
+                response.close()
+
+            self.metrics.retry_record(self.name, method, endpoint)
+            time.sleep(min(2 ** attempt * 0.5, 30.0))
+            attempt += 1
+
+
+    @staticmethod
+    def request_unsent(err):
+        '''
+        Return True if the given request exception means the request was
+        never sent, because the connection to the API endpoint timed out
+        or could not be made.
+        '''
+
+        if isinstance(err, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(err, requests.exceptions.ConnectionError) and err.args:
+            reason = getattr(err.args[0], "reason", err.args[0])
+            return isinstance(reason, urllib3.exceptions.NewConnectionError)
+        return False
+
+
+    def http_cache_update(self, uri, response):
+        '''
+        Update the HTTP cache from the given response to a GET request.
+        A 304 (Not Modified) response is turned into a 200 (OK) response
+        with the cached body. If the cached body is no longer available
+        (e.g. it was removed since the request was sent), the stale cache
+        entry is removed and None is returned, so the request can be sent
+        again without revalidating it.
+        '''
+
+        if response.status_code == 304: # Not Modified
+            cached = self.http_cache.response_get(uri)
+            if cached is None:
+                response.close()
+                self.http_cache.remove(uri)
+                return None
+            headers, body = cached
+            self.metrics.counter_add("{}.http_cache.hit".format(self.name))
+            # Headers sent with the 304 response take precedence.
+            for key, value in headers.items():
+                response.headers.setdefault(key, value)
+            # pylint: disable=protected-access
+            response.status_code = 200
+            response._content = body
+            return response
+
+        elif response.status_code == 200: # OK
+            if self.http_cache.store(uri, response.headers, response.content):
+                self.metrics.counter_add("{}.http_cache.store".format(self.name))
+
+        self.metrics.counter_add("{}.http_cache.miss".format(self.name))
+        return response
+
+
+    def close(self):
+        '''
+        Release any resources held by this backend.
+        '''
+
+        self.session.close()
+
+
+    def extras_add(self, obj_type, data, obj):
+        '''
+        Keep the configured extra fields (if any) of the given object of the
+        given type (e.g. "ip_addresses") from the given raw record.
+        '''
+
+        fields = self.extra_fields.get(obj_type)
+        if not fields:
+            return
+
+        table = self.extras.get(obj_type)
+        if table is None:
+            table = self.extras[obj_type] = ExtraTable(fields)
+        table.add(obj.id_get(), data)
+
+
+    def transform_apply(self, obj_type, data, obj):
+        '''
+        Apply the configured transform (if any) to the given object of the
+        given type (e.g. "ip_addresses"), read from the given raw record.
+        Returns the object.
+        '''
+
+        if self.transform is None:
+            return obj
+        return self.transform.apply(obj_type, data, obj)
+
 
     @abc.abstractmethod
     def database_read(self,
                       read_ip_addresses=True,
                       read_prefixes=True,
                       read_vlans=True,
-                      read_vrfs=True):
+                      read_vrfs=True,
+                      filters=None):
         '''
-        Read a Database object from this backend.
+        Read a Database object from this backend, optionally restricted
+        to the objects matching the given Filter.
         '''
 
         pass
@@ -61,3 +293,20 @@ class BaseBackend(abc.ABC):
         '''
 
         pass
+
+
+    def database_plan(self, database):
+        '''
+        Compute the ipam_migrator.planner.Plan for writing a Database object
+        to this backend, without writing anything.
+        '''
+
+        raise PlanError("{} backend does not support write plans".format(self.name))
+
+
+    def plan_execute(self, plan):
+        '''
+        Execute a previously computed write plan on this backend.
+        '''
+
+        raise PlanError("{} backend does not support write plans".format(self.name))
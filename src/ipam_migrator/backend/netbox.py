@@ -23,12 +23,23 @@ phpIPAM database backend.
 '''
 
 
+import collections
+import hashlib
+import json
+import urllib.parse
+
 import requests
 
+from ipam_migrator import codec
+
 from ipam_migrator.backend.base import BaseBackend
 
+from ipam_migrator.chunk import Chunker
+
 from ipam_migrator.db.database import Database
 from ipam_migrator.db.ip_address import IPAddress
+from ipam_migrator.db.parse import ip_address_parse
+from ipam_migrator.db.parse import ip_network_parse
 from ipam_migrator.db.prefix import Prefix
 from ipam_migrator.db.vlan import VLAN
 from ipam_migrator.db.vrf import VRF
@@ -37,6 +48,11 @@ from ipam_migrator.exception import APIGetError
 from ipam_migrator.exception import APIReadError
 from ipam_migrator.exception import APIWriteError
 from ipam_migrator.exception import AuthMethodUnsupportedError
+from ipam_migrator.exception import PlanError
+
+from ipam_migrator.filter import Filter
+
+from ipam_migrator.planner import Plan
 
 
 class HTTPTokenAuth(requests.auth.AuthBase):
@@ -90,19 +106,54 @@ class NetBox(BaseBackend):
     # pylint: disable=too-many-public-methods
 
 
+    # Number of objects to request per page when reading lists of objects.
+    PAGE_SIZE = 1000
+
+    # Fields used by the object getters and write payloads for each
+    # object type, requested on their own where the API supports it.
+    READ_FIELDS = {
+        "ip-addresses": ("id", "address", "description", "custom_fields", "vrf"),
+        "prefixes": ("id", "prefix", "is_pool", "description", "vlan", "vrf"),
+        "vlans": ("id", "vid", "name", "description"),
+        "vrfs": ("id", "rd", "enforce_unique", "name", "description"),
+    }
+
+    # First API version supporting the 'fields' query parameter.
+    READ_FIELDS_API_VERSION = (4, 0)
+
+    # Fields of objects read from NetBox which are never written,
+    # and so are left out of the index of the objects on NetBox.
+    INDEX_SKIP_FIELDS = frozenset((
+        "url", "display", "display_name", "display_url", "created", "last_updated",
+    ))
+
+    # Object types in write plans, in the order they are written.
+    PLAN_OBJ_TYPES = ("vrfs", "vlans", "prefixes", "ip-addresses")
+
+    # Metrics counter and trace action for each write action.
+    WRITE_RESULTS = {
+        "create": ("created", "wrote"),
+        "update": ("updated", "updated"),
+        "unchanged": ("unchanged", "unchanged"),
+    }
+
+
     # pylint: disable=too-many-arguments
     def __init__(self,
                  logger, name,
                  api_endpoint, api_auth_method,
-                 api_auth_data, api_ssl_verify):
+                 api_auth_data, api_ssl_verify,
+                 chunker=None,
+                 **kwargs):
         '''
         NetBox API backend constructor.
         '''
 
-        super().__init__(name, logger)
+        super().__init__(logger, name, **kwargs)
 
         # Configuration fields.
         self.api_endpoint = api_endpoint
+        self.chunker = chunker if chunker is not None else Chunker()
 
         self.token = None
         self.api_auth_method = api_auth_method
@@ -137,6 +188,9 @@ class NetBox(BaseBackend):
             except ImportError:
                 pass
 
+        # Runtime fields.
+        self.api_version = None
+
 
     #
     ##
@@ -164,31 +218,164 @@ class NetBox(BaseBackend):
 
     def api_get(self, uri):
         '''
-        Send a GET request to the API backend.
+        Send a GET request to the API backend, returning the list of results.
+        '''
+
+        return self.api_get_page(uri)["results"]
+
+
+    def api_get_page(self, uri):
+        '''
+        Send a GET request to the API backend, returning the decoded response.
+        '''
+
+        self.api_authenticate()
+
+        response = self.http_request(
+            "GET",
+            uri,
+            auth=HTTPTokenAuth(self.token),
+            verify=self.api_ssl_verify,
+        )
+
+        self.api_version_update(response)
+
+        return self.api_get_decode(response)
+
+
+    def api_get_page_stream(self, uri):
+        '''
+        Send a GET request for a page of objects to the API backend,
+        decoding the response incrementally as it is received.
+        Yields ("item", obj) for each object in the page, and (key, value)
+        for the other top-level fields (e.g. "next").
         '''
 
         self.api_authenticate()
 
-        response = requests.get(uri, auth=HTTPTokenAuth(self.token), verify=self.api_ssl_verify)
+        response = self.http_request(
+            "GET",
+            uri,
+            auth=HTTPTokenAuth(self.token),
+            verify=self.api_ssl_verify,
+            stream=True,
+        )
 
-        if not response.text:
+        self.api_version_update(response)
+
+        try:
+            if response.status_code != 200:
+                # Error responses are small, so decode them as a whole.
+                self.api_get_decode(response)
+            response.raw.decode_content = True
+            for event in codec.list_stream(response.raw, "results"):
+                yield event
+        finally:
+            response.close()
+
+
+    @staticmethod
+    def api_get_decode(response):
+        '''
+        Decode the response to a GET request, raising an error
+        if the request failed.
+        '''
+
+        if not response.content:
             raise APIReadError(response.status_code, "(empty response)")
 
-        obj = response.json()
+        obj = codec.loads(response.content)
 
         if response.status_code == 200: # OK
-            return obj["results"]
+            return obj
         elif response.status_code == 400: # Bad request
             raise APIGetError(
                 response.status_code,
                 "bad request:\n{}".format(
-                    "\n".join(("  {}: {}".format(k, v) for k, v in obj.items())),
+                    "\n".join((
+                        "  {}: {}".format(k, v)
+                        # Bulk requests return the errors for each object.
+                        for o in (obj if isinstance(obj, list) else [obj])
+                        for k, v in o.items()
+                    )),
                 ),
             )
         else:
             raise APIGetError(response.status_code, "(unhandled error code)")
 
 
+    def api_version_get(self):
+        '''
+        Get the API version of the backend as a tuple of integers,
+        requesting the API root if no response has been received yet.
+        Returns an empty tuple if the backend does not report its version.
+        '''
+
+        if self.api_version is None:
+            self.api_authenticate()
+            response = self.http_request(
+                "GET",
+                "{}/".format(self.api_endpoint),
+                auth=HTTPTokenAuth(self.token),
+                verify=self.api_ssl_verify,
+            )
+            self.api_version_update(response)
+            if self.api_version is None:
+                self.api_version = ()
+            self.logger.debug(
+                "%s: API version %s",
+                self.name,
+                ".".join((str(v) for v in self.api_version)) or "unknown",
+            )
+
+        return self.api_version
+
+
+    def api_version_update(self, response):
+        '''
+        Update the API version of the backend from the API-Version header
+        of the given response, if it has not been set yet.
+        '''
+
+        if self.api_version:
+            return
+
+        version = response.headers.get("API-Version")
+        if not version:
+            return
+
+        try:
+            self.api_version = tuple((int(v) for v in version.split(".")))
+        except ValueError:
+            self.logger.warning("%s: unable to parse API version '%s'", self.name, version)
+            self.api_version = ()
+
+
+    def api_fields_params(self, obj_type, fields_written=()):
+        '''
+        Get the query parameters limiting the fields returned for objects
+        of the given type to those used by this backend, and the given
+        fields being written to them. Returns no parameters if the API does
+        not support field selection.
+        '''
+
+        if obj_type not in self.READ_FIELDS or \
+           self.api_version_get() < self.READ_FIELDS_API_VERSION:
+            return {}
+
+        fields = self.READ_FIELDS[obj_type]
+
+        # Fields used by a transform or kept as extra fields
+        # need to be read as well.
+        db_obj_type = obj_type.replace("-", "_")
+        fields_used = frozenset(self.extra_fields.get(db_obj_type, ())) | frozenset(fields_written)
+        if self.transform is not None:
+            fields_used |= self.transform.fields_get(db_obj_type)
+        fields = fields + tuple(sorted(fields_used - frozenset(fields)))
+
+        return {"fields": ",".join(fields)}
+
+
     def api_read(self, *args):
         '''
         Read an object from the API backend.
@@ -205,38 +392,98 @@ class NetBox(BaseBackend):
         '''
 
         link = "/".join(args)
-        params = "&".join(["{}={}".format(k, v) for k, v in kwargs.items()])
+        params = urllib.parse.urlencode(kwargs, doseq=True)
         command = "{}/?{}".format(link, params)
 
         return self.api_get("{}/{}".format(self.api_endpoint, command))
 
 
-    def api_write(self, *args, data=None):
+    def api_list(self, *args, **kwargs):
         '''
-        Write an object to the API backend.
+        Read all objects matching the given query parameters from the API
+        backend, following pagination. Parameters with list values are
+        sent once for each value.
+        '''
+
+        return [data for page in self.api_list_pages(*args, **kwargs) for data in page]
+
+
+    def api_list_pages(self, *args, **kwargs):
+        '''
+        Read all objects matching the given query parameters from the API
+        backend, yielding the list of objects in each page as it is read.
+        '''
+
+        kwargs.setdefault("limit", self.PAGE_SIZE)
+
+        link = "/".join((str(a) for a in args))
+        params = urllib.parse.urlencode(kwargs, doseq=True)
+        uri = "{}/{}/?{}".format(self.api_endpoint, link, params)
+
+        while uri:
+            # Cached responses need to be read as a whole to be stored.
+            if codec.STREAMING and self.http_cache is None:
+                results = []
+                next_uri = None
+                for key, value in self.api_get_page_stream(uri):
+                    if key == "item":
+                        results.append(value)
+                    elif key == "next":
+                        next_uri = value
+                uri = next_uri
+            else:
+                obj = self.api_get_page(uri)
+                results = obj["results"]
+                uri = obj.get("next")
+
+            yield results
+
+
+    def api_list_any(self, obj_type, params_list, fields_written=()):
+        '''
+        Read all objects of the given type matching any of the given sets of
+        query parameters from the API backend, without duplicates, with the
+        given fields being written to them (see api_fields_params).
+        '''
+
+        results = {}
+        fields_params = self.api_fields_params(obj_type, fields_written)
+
+        for params in params_list:
+            for data in self.api_list("ipam", obj_type, **dict(params, **fields_params)):
+                results[data["id"]] = data
+
+        return results.values()
+
+
+    def api_write(self, *args, data=None, body=None):
+        '''
+        Write an object to the API backend. The request body is either the
+        given data encoded as JSON, or the given already encoded body.
         '''
 
         self.api_authenticate()
 
         req_type = args[0]
-        if req_type != "POST" and req_type != "PUT":
+        if req_type not in ("POST", "PUT", "PATCH"):
             raise APIWriteError(0, "request type '{}' unsupported by api_write".format(req_type))
 
-        function = requests.put if req_type == "PUT" else requests.post
         command = "/".join((str(a) for a in args[1:]))
         uri = "{}/{}/".format(self.api_endpoint, command)
 
-        response = function(
+        response = self.http_request(
+            req_type,
             uri,
             auth=HTTPTokenAuth(self.token),
-            data=data,
+            headers={"Content-Type": codec.CONTENT_TYPE},
+            data=body if body is not None else codec.dumps(data),
             verify=self.api_ssl_verify,
         )
 
-        if not response.text:
+        if not response.content:
             raise APIReadError(response.status_code, "(empty response)")
 
-        obj = response.json()
+        obj = codec.loads(response.content)
 
         if response.status_code == 200: # OK
             if req_type == "POST":
@@ -253,7 +500,12 @@ class NetBox(BaseBackend):
             raise APIWriteError(
                 response.status_code,
                 "bad request:\n{}".format(
-                    "\n".join(("  {}: {}".format(k, v) for k, v in obj.items())),
+                    "\n".join((
+                        "  {}: {}".format(k, v)
+                        # Bulk requests return the errors for each object.
+                        for o in (obj if isinstance(obj, list) else [obj])
+                        for k, v in o.items()
+                    )),
                 ),
             )
         elif response.status_code == 405: # Method Not Allowed
@@ -267,20 +519,50 @@ class NetBox(BaseBackend):
             raise APIWriteError(response.status_code, "(unhandled error code)")
 
 
-    def api_put(self, *args, data=None):
+    def api_put(self, *args, data=None, body=None):
         '''
         Send a PUT request to the API backend.
         '''
 
-        return self.api_write("PUT", *args, data=data)
+        return self.api_write("PUT", *args, data=data, body=body)
+
+
+    def api_patch(self, *args, data=None, body=None):
+        '''
+        Send a PATCH request to the API backend.
+        '''
+
+        return self.api_write("PATCH", *args, data=data, body=body)
 
 
-    def api_post(self, *args, data=None):
+    def api_post(self, *args, data=None, body=None):
         '''
         Send a POST request to the API backend.
         '''
 
-        return self.api_write("POST", *args, data=data)
+        return self.api_write("POST", *args, data=data, body=body)
+
+
+    def api_write_chunk(self, obj_type, chunk):
+        '''
+        Write the given Chunk of objects of the given type to the API backend,
+        using a bulk POST request for the objects to create, and a bulk PATCH
+        request for the objects to update. Returns the written data dictionary
+        for each item in the chunk, or None for items not written.
+        '''
+
+        results = [None] * len(chunk)
+
+        for method, action in (("POST", "create"), ("PATCH", "update")):
+            body = chunk.body(action)
+            if body is None:
+                continue
+            body, indexes = body
+            new_objs_data = self.api_write(method, "ipam", obj_type, body=body)
+            for i, new_obj_data in zip(indexes, new_objs_data):
+                results[i] = new_obj_data
+
+        return results
 
 
     #
@@ -292,67 +574,160 @@ class NetBox(BaseBackend):
                       read_ip_addresses=True,
                       read_prefixes=True,
                       read_vlans=True,
-                      read_vrfs=True):
+                      read_vrfs=True,
+                      filters=None):
         '''
         Read a Database object from the API backend.
         '''
 
-        vlans = self.vlans_read() if read_vlans else None
-        vrfs = self.vrfs_read() if read_vrfs else None
-        prefixes = self.prefixes_read() if read_prefixes else None
-        ip_addresses = self.ip_addresses_read() if read_ip_addresses else None
+        filters = filters if filters is not None else Filter()
+        self.extras = {}
+
+        if filters.sections:
+            self.logger.warning("NetBox has no sections, ignoring section filter")
+
+        if read_vlans:
+            with self.metrics.phase(self.name, "vlans"):
+                vlans = self.vlans_read(filters)
+        else:
+            vlans = None
+
+        # VRFs are required for resolving the VRF filter,
+        # even if the VRFs themselves are not requested in the database.
+        if read_vrfs or filters.vrfs:
+            with self.metrics.phase(self.name, "vrfs"):
+                vrfs = self.vrfs_read(filters)
+            filters.vrfs_resolve(vrfs)
+        else:
+            vrfs = None
+
+        if read_prefixes:
+            with self.metrics.phase(self.name, "prefixes"):
+                prefixes = self.prefixes_read(filters)
+        else:
+            prefixes = None
+
+        if read_ip_addresses:
+            with self.metrics.phase(self.name, "ip_addresses"):
+                ip_addresses = self.ip_addresses_read(filters)
+        else:
+            ip_addresses = None
 
         return Database(
             self.name,
             ip_addresses=ip_addresses,
             prefixes=prefixes,
             vlans=vlans,
-            vrfs=vrfs,
+            vrfs=vrfs if read_vrfs else None,
+            extras=self.extras,
         )
 
 
-    def vlans_read(self):
+    def vlans_read(self, filters=None):
         '''
         Read a dictionary of VLAN objects from the API backend.
         '''
 
-        req = self.api_read("ipam", "vlans")
-        res = req.json()
+        filters = filters if filters is not None else Filter()
 
-        return {data["id"]:self.vlan_get(data) for data in res["results"]}
+        if filters.vlan_ranges:
+            params_list = [{"vid__gte": l, "vid__lte": h} for l, h in filters.vlan_ranges]
+        else:
+            params_list = [{}]
 
+        return self.objs_read("vlans", params_list, self.vlan_get, filters.vlan_match)
 
-    def vrfs_read(self):
+
+    def vrfs_read(self, filters=None):
         '''
         Read a dictionary of VRF objects from the API backend.
         '''
 
-        req = self.api_read("ipam", "vrfs")
-        res = req.json()
+        filters = filters if filters is not None else Filter()
 
-        return {data["id"]:self.vrf_get(data) for data in res["results"]}
+        return self.objs_read("vrfs", [{}], self.vrf_get, filters.vrf_match)
 
 
-    def prefixes_read(self):
+    def prefixes_read(self, filters=None):
         '''
         Read a dictionary of Prefix objects from the API backend.
         '''
 
-        req = self.api_read("ipam", "prefixes")
-        res = req.json()
+        filters = filters if filters is not None else Filter()
 
-        return {data["id"]:self.prefix_get(data) for data in res["results"]}
+        return self.objs_read(
+            "prefixes",
+            self.filter_params(filters, "within_include"),
+            self.prefix_get,
+            filters.prefix_match,
+        )
 
 
-    def ip_addresses_read(self):
+    def ip_addresses_read(self, filters=None):
         '''
         Read a dictionary of IPAddress objects from the API backend.
         '''
 
-        req = self.api_read("ipam", "ip-addresses")
-        res = req.json()
+        filters = filters if filters is not None else Filter()
+
+        return self.objs_read(
+            "ip-addresses",
+            self.filter_params(filters, "parent"),
+            self.ip_address_get,
+            filters.ip_address_match,
+        )
+
+
+    def objs_read(self, obj_type, params_list, obj_get_func, obj_match_func):
+        '''
+        Read a dictionary of objects of the given type matching any of the
+        given sets of query parameters from the API backend, keeping only those
+        the given match function accepts.
+        '''
+
+        objs = {}
+
+        self.logger.info("Searching for {}...".format(obj_type))
+
+        progress = self.progress.phase(self.name, obj_type)
 
-        return {data["id"]:self.ip_address_get(data) for data in res["results"]}
+        for data in self.api_list_any(obj_type, params_list):
+            obj = self.transform_apply(obj_type.replace("-", "_"), data, obj_get_func(data))
+            if not obj_match_func(obj):
+                continue
+            objs[data["id"]] = obj
+            self.extras_add(obj_type.replace("-", "_"), data, obj)
+            self.trace.record(self.name, "found", obj)
+            progress.update()
+
+        progress.finish()
+
+        self.logger.info("Found {} {}.".format(len(objs), obj_type))
+
+        return objs
+
+
+    @staticmethod
+    def filter_params(filters, cidr_param):
+        '''
+        Get the list of query parameter sets selecting the objects
+        matching the VRF and CIDR filters, using the given query parameter
+        to select objects inside a CIDR range. An empty list means no
+        objects match, so none need to be read.
+        '''
+
+        params = {}
+
+        if filters.vrfs:
+            # No matching VRFs means no matching objects, but an empty
+            # vrf_id parameter would match everything.
+            if not filters.vrf_ids:
+                return []
+            params["vrf_id"] = sorted(filters.vrf_ids)
+
+        if filters.cidrs:
+            return [dict(params, **{cidr_param: str(cidr)}) for cidr in filters.cidrs]
+        return [params]
 
 
     #
@@ -369,7 +744,8 @@ class NetBox(BaseBackend):
 
         if database.vlans:
             vlans_old = database.vlans
-            vlans_new, vlans_old_to_new = self.vlans_write(vlans_old)
+            with self.metrics.phase(self.name, "vlans_write"):
+                vlans_new, vlans_old_to_new = self.vlans_write(vlans_old)
         else:
             vlans_old = {}
             vlans_new = {}
@@ -377,7 +753,8 @@ class NetBox(BaseBackend):
 
         if database.vrfs:
             vrfs_old = database.vrfs
-            vrfs_new, vrfs_old_to_new = self.vrfs_write(vrfs_old)
+            with self.metrics.phase(self.name, "vrfs_write"):
+                vrfs_new, vrfs_old_to_new = self.vrfs_write(vrfs_old)
         else:
             vrfs_old = {}
             vrfs_new = {}
@@ -385,11 +762,12 @@ class NetBox(BaseBackend):
 
         if database.prefixes:
             prefixes_old = database.prefixes
-            prefixes_new, prefixes_old_to_new = self.prefixes_write(
-                prefixes_old,
-                vlans_new, vlans_old_to_new,
-                vrfs_new, vrfs_old_to_new,
-            )
+            with self.metrics.phase(self.name, "prefixes_write"):
+                prefixes_new, prefixes_old_to_new = self.prefixes_write(
+                    prefixes_old,
+                    vlans_new, vlans_old_to_new,
+                    vrfs_new, vrfs_old_to_new,
+                )
         else:
             prefixes_old = {}
             prefixes_new = {}
@@ -397,54 +775,690 @@ class NetBox(BaseBackend):
 
         if database.ip_addresses:
             ip_addresses_old = database.ip_addresses
-            ip_addresses_new, ip_addresses_old_to_new = self.ip_addresses_write(
-                ip_addresses_old,
-                vrfs_new, vrfs_old_to_new,
-            )
+            with self.metrics.phase(self.name, "ip_addresses_write"):
+                ip_addresses_new, ip_addresses_old_to_new = self.ip_addresses_write(
+                    ip_addresses_old,
+                    vrfs_new, vrfs_old_to_new,
+                )
         else:
             ip_addresses_old = {}
             ip_addresses_new = {}
             ip_addresses_old_to_new = {}
 
 
-    def obj_write(self,
-                  obj_type,
-                  obj_search_params,
-                  obj_data,
-                  obj_get_func):
+    def database_plan(self, database):
         '''
-        Write an Object to the API backend.
+        Compute the plan for writing a Database object to the API backend,
+        from a single bulk read of the objects currently on NetBox.
         '''
 
-        # Check if an equivalent object already exists on NetBox.
-        # If there is one, we will overwrite its data and reuse its ID
-        # with a PUT request, otherwise upload a new object using a POST request.
-        current_objs = self.api_search("ipam", obj_type, **obj_search_params)
-        current_obj = current_objs[0] if current_objs else None
+        plan = Plan(database.name, self.api_endpoint)
+
+        # Source object ID to NetBox object ID, for objects already on NetBox.
+        old_to_new = {obj_type: {} for obj_type in self.PLAN_OBJ_TYPES}
+        # Source object IDs of objects to be created by the plan.
+        created = {obj_type: set() for obj_type in self.PLAN_OBJ_TYPES}
+
+        def vrf_key(vrf_id):
+            '''
+            Get the VRF part of a prefix or IP address key.
+            '''
+            if vrf_id in old_to_new["vrfs"]:
+                return old_to_new["vrfs"][vrf_id]
+            if vrf_id in created["vrfs"]:
+                return ("new", vrf_id)
+            return None
+
+        with self.metrics.phase(self.name, "vrfs_plan"):
+            self.objs_plan(
+                plan, "vrfs", database.vrfs, old_to_new, created,
+                self.vrf_key_get,
+                self.vrf_data_key_get,
+                lambda v: (self.vrf_data(v), {}),
+            )
 
-        if current_obj:
-            new_obj_data = self.api_put(
-                "ipam", obj_type, current_obj["id"],
-                data=obj_data,
+        with self.metrics.phase(self.name, "vlans_plan"):
+            self.objs_plan(
+                plan, "vlans", database.vlans, old_to_new, created,
+                lambda v: v.vid,
+                lambda d: d["vid"],
+                lambda v: (self.vlan_data(v), {}),
             )
-        else:
-            new_obj_data = self.api_post("ipam", obj_type, data=obj_data)
-        new_obj = obj_get_func(new_obj_data)
 
-        if current_obj:
-            self.logger.debug("updated {}".format(new_obj))
+        with self.metrics.phase(self.name, "prefixes_plan"):
+            self.objs_plan(
+                plan, "prefixes", database.prefixes, old_to_new, created,
+                lambda p: (vrf_key(p.vrf_id), p.prefix),
+                lambda d: (self.object_id_get(d, "vrf"), ip_network_parse(d["prefix"])),
+                lambda p: (
+                    self.prefix_data(p, old_to_new["vlans"], old_to_new["vrfs"]),
+                    self.plan_refs(created, vlan=("vlans", p.vlan_id), vrf=("vrfs", p.vrf_id)),
+                ),
+            )
+
+        with self.metrics.phase(self.name, "ip_addresses_plan"):
+            self.objs_plan(
+                plan, "ip-addresses", database.ip_addresses, old_to_new, created,
+                lambda a: (vrf_key(a.vrf_id), a.address),
+                lambda d: (
+                    self.object_id_get(d, "vrf"),
+                    ip_address_parse(d["address"].split("/")[0]),
+                ),
+                lambda a: (
+                    self.ip_address_data(a, old_to_new["vrfs"]),
+                    self.plan_refs(created, vrf=("vrfs", a.vrf_id)),
+                ),
+            )
+
+        return plan
+
+
+    # pylint: disable=too-many-arguments,too-many-locals
+    def objs_plan(self,
+                  plan, obj_type, objs,
+                  old_to_new, created,
+                  obj_key_func, data_key_func, obj_data_func):
+        '''
+        Add the entries for writing the given dictionary of objects of the
+        given type to the plan, matching them to the objects currently on
+        NetBox using the given key functions for objects and NetBox data.
+        '''
+
+        if not objs:
+            return
+
+        self.logger.info("Planning {}...".format(obj_type))
+
+        current = {}
+        fields_written = self.overrides_fields_get(objs.values())
+        for data in self.api_list_any(obj_type, [{}], fields_written):
+            current.setdefault(data_key_func(data), []).append(data)
+
+        claimed = {}
+
+        for obj in sorted(objs.values()):
+            obj_id = obj.id_get()
+            key = obj_key_func(obj)
+            obj_data, refs = obj_data_func(obj)
+
+            if key in claimed:
+                plan.add(
+                    obj_type, "conflict", obj_id,
+                    message="{} has the same key as source object {}".format(obj, claimed[key]),
+                )
+                continue
+            claimed[key] = obj_id
+
+            matches = current.get(key, ())
+
+            if len(matches) > 1:
+                plan.add(
+                    obj_type, "conflict", obj_id,
+                    message="{} matches {} objects on NetBox (IDs {})".format(
+                        obj,
+                        len(matches),
+                        ", ".join((str(m["id"]) for m in matches)),
+                    ),
+                )
+
+            elif matches:
+                current_obj = matches[0]
+                # Referenced objects to be created are always written.
+                obj_data_changed = self.obj_data_diff(
+                    current_obj,
+                    {k: v for k, v in obj_data.items() if k not in refs},
+                )
+                obj_data_changed.update({k: None for k in refs})
+                plan.add(
+                    obj_type, "update" if obj_data_changed else "skip", obj_id,
+                    target_id=current_obj["id"],
+                    data=obj_data_changed,
+                    refs=refs,
+                )
+                old_to_new[obj_type][obj_id] = current_obj["id"]
+
+            else:
+                plan.add(obj_type, "create", obj_id, data=obj_data, refs=refs)
+                created[obj_type].add(obj_id)
+
+        self.logger.info("Planned {} {}.".format(len(objs), obj_type))
+
+
+    @staticmethod
+    def plan_refs(created, **kwargs):
+        '''
+        Get the payload fields referencing objects to be created by the plan,
+        from the given mapping of field names to (object type, source ID).
+        '''
+
+        return {
+            field: [obj_type, obj_id]
+            for field, (obj_type, obj_id) in kwargs.items()
+            if obj_id in created[obj_type]
+        }
+
+
+    def plan_execute(self, plan):
+        '''
+        Execute a previously computed write plan on the API backend.
+        '''
+
+        if plan.target != self.api_endpoint:
+            raise PlanError(
+                "plan was computed for '{}', not '{}'".format(plan.target, self.api_endpoint),
+            )
+
+        self.logger.info("Executing write plan...")
+
+        old_to_new = {obj_type: {} for obj_type in self.PLAN_OBJ_TYPES}
+
+        progress = self.progress.phase(self.name, "plan_execute", total=len(plan.entries))
+
+        for entry in plan.entries:
+            obj_type = entry["obj_type"]
+            action = entry["action"]
+
+            if action == "conflict":
+                self.logger.warning(
+                    "%s: not writing %s %s: %s",
+                    self.name, obj_type, entry["source_id"], entry["message"],
+                )
+                self.metrics.counter_add("{}.{}.conflict".format(self.name, obj_type))
+                progress.update()
+                continue
+
+            obj_data = dict(entry["data"])
+            for field, (ref_type, ref_id) in entry["refs"].items():
+                obj_data[field] = old_to_new[ref_type].get(ref_id)
+
+            if action == "create":
+                new_obj_data = self.api_post("ipam", obj_type, data=obj_data)
+                target_id = new_obj_data["id"]
+                self.metrics.counter_add("{}.{}.created".format(self.name, obj_type))
+                self.trace.record(self.name, "wrote", self.obj_get_func(obj_type)(new_obj_data))
+            elif action == "update":
+                new_obj_data = self.api_patch(
+                    "ipam", obj_type, entry["target_id"],
+                    data=obj_data,
+                )
+                target_id = entry["target_id"]
+                self.metrics.counter_add("{}.{}.updated".format(self.name, obj_type))
+                self.trace.record(self.name, "updated", self.obj_get_func(obj_type)(new_obj_data))
+            else:
+                target_id = entry["target_id"]
+                self.metrics.counter_add("{}.{}.unchanged".format(self.name, obj_type))
+
+            old_to_new[obj_type][entry["source_id"]] = target_id
+            progress.update()
+
+        progress.finish()
+
+        self.logger.info("Executed write plan.")
+
+
+    def replicate(self, source, id_map, obj_types=None):
+        '''
+        Replicate the objects on the given source NetBox backend to this one.
+
+        The objects of each type are streamed from the source a page at a
+        time, and each page is written to this backend using bulk requests
+        for each chunk of objects (see Chunker).
+        The given IDMap maps source objects to the objects written for them,
+        with their digests as written, so objects which have not changed
+        since the last replication are not written again. Source objects
+        not in the map are matched to existing objects by their keys
+        (see data_key_get). Objects removed from the source are removed
+        from the map, but left on this backend.
+        '''
+
+        obj_types = obj_types if obj_types is not None else self.PLAN_OBJ_TYPES
+
+        self.logger.info("Replicating {} to {}...".format(source.api_endpoint, self.api_endpoint))
+
+        for obj_type in self.PLAN_OBJ_TYPES:
+            if obj_type not in obj_types:
+                continue
+            with self.metrics.phase(self.name, "{}_replicate".format(obj_type)):
+                self.objs_replicate(source, id_map, obj_type)
+            id_map.save()
+
+        self.logger.info("Replicated {} to {}.".format(source.api_endpoint, self.api_endpoint))
+
+
+    # pylint: disable=too-many-locals
+    def objs_replicate(self, source, id_map, obj_type):
+        '''
+        Replicate the objects of the given type on the given source
+        NetBox backend to this one.
+        '''
+
+        self.logger.info("Replicating {}...".format(obj_type))
+
+        obj_get_func = self.obj_get_func(obj_type)
+        obj_get_func_source = source.obj_get_func(obj_type)
+
+        source_ids = set()
+        counts = collections.Counter()
+
+        # Objects on this backend, by key, only read if there are source
+        # objects not in the ID map (see replicate_items). As objects are only
+        # created for those, it is read before any are created.
+        indexes = {}
+
+        progress = self.progress.phase(self.name, "{}_replicate".format(obj_type))
+
+        # Pages are read, and matched to the objects on this backend, between
+        # chunk writes, so chunks are only prepared in the background from
+        # items which are already known (see Chunker).
+        for page in source.api_list_pages("ipam", obj_type, **source.api_fields_params(obj_type)):
+            objs = [
+                source.transform_apply(obj_type.replace("-", "_"), data, obj_get_func_source(data))
+                for data in page
+            ]
+            items = list(self.replicate_items(source, id_map, obj_type, objs, indexes))
+            source_ids.update((obj.id_get() for obj in objs))
+
+            for chunk in self.chunker.chunks(items):
+                for (_, (action, obj_id, target_id, digest)), new_obj_data in zip(
+                        chunk.items,
+                        self.api_write_chunk(obj_type, chunk)):
+                    if new_obj_data is not None:
+                        target_id = new_obj_data["id"]
+                        self.trace.record(
+                            self.name,
+                            self.WRITE_RESULTS[action][1],
+                            obj_get_func(new_obj_data),
+                        )
+                        counts[self.WRITE_RESULTS[action][0]] += 1
+                    else:
+                        counts["unchanged"] += 1
+
+                    if action != "unchanged":
+                        id_map.set(obj_type, obj_id, target_id, digest)
+
+                progress.update(len(chunk))
+
+        progress.finish()
+
+        counts["removed"] = id_map.prune(obj_type, source_ids)
+
+        for result in ("created", "updated", "unchanged"):
+            self.metrics.counter_add("{}.{}.{}".format(self.name, obj_type, result), counts[result])
+
+        self.logger.info(
+            "Replicated {} {}: {} created, {} updated, {} unchanged, "
+            "{} removed from the source.".format(
+                len(source_ids), obj_type,
+                counts["created"], counts["updated"], counts["unchanged"], counts["removed"],
+            ),
+        )
+
+
+    # pylint: disable=too-many-arguments
+    def replicate_items(self, source, id_map, obj_type, objs, indexes):
+        '''
+        Generate the chunk items for replicating the given objects of the
+        given type from the given source NetBox backend. Each item is the
+        payload to write (or None) and the context (action, source ID,
+        target ID, digest), where the action is "match" for unchanged
+        objects newly matched to an existing object on this backend.
+
+        Objects not in the ID map are matched to the objects on this
+        backend in the given dictionary of indexes by object type, which
+        is read the first time it is needed (see objs_index).
+        '''
+
+        obj_data_func = self.replicate_data_func(id_map, obj_type)
+
+        # Fields set by the source's transform are written as well.
+        if source.transform is not None:
+            fields_written = source.transform.targets_get(obj_type.replace("-", "_"))
         else:
-            self.logger.debug("wrote {}".format(new_obj))
+            fields_written = ()
 
-        return new_obj
+        for obj in objs:
+            obj_id = obj.id_get()
+
+            obj_data = obj_data_func(obj)
+            digest = self.replicate_digest(obj, obj_data)
+
+            entry = id_map.get(obj_type, obj_id)
+
+            if entry is not None:
+                target_id, target_digest = entry
+                if target_digest == digest:
+                    yield (None, ("unchanged", obj_id, target_id, digest))
+                else:
+                    yield (
+                        dict(obj_data, id=target_id),
+                        ("update", obj_id, target_id, digest),
+                    )
+                continue
+
+            if obj_type not in indexes:
+                indexes[obj_type] = self.objs_index(obj_type, fields_written)
+
+            current_obj = indexes[obj_type].get(self.data_key_get(obj_type, obj_data))
+
+            if current_obj is None:
+                yield (obj_data, ("create", obj_id, None, digest))
+                continue
+
+            obj_data_changed = self.obj_data_diff(current_obj, obj_data)
+            if obj_data_changed:
+                yield (
+                    dict(obj_data_changed, id=current_obj["id"]),
+                    ("update", obj_id, current_obj["id"], digest),
+                )
+            else:
+                yield (None, ("match", obj_id, current_obj["id"], digest))
+
+
+    def replicate_data_func(self, id_map, obj_type):
+        '''
+        Get the function returning the write payload for an object of the
+        given type, with references mapped using the given IDMap.
+        '''
+
+        if obj_type == "ip-addresses":
+            vrfs_old_to_new = id_map.old_to_new("vrfs")
+            return lambda a: self.ip_address_data(a, vrfs_old_to_new)
+
+        if obj_type == "prefixes":
+            vlans_old_to_new = id_map.old_to_new("vlans")
+            vrfs_old_to_new = id_map.old_to_new("vrfs")
+            return lambda p: self.prefix_data(p, vlans_old_to_new, vrfs_old_to_new)
+
+        if obj_type == "vlans":
+            return self.vlan_data
+
+        return self.vrf_data
+
+
+    @staticmethod
+    def replicate_digest(obj, obj_data):
+        '''
+        Get the digest of a source object as replicated: its fingerprint,
+        the IDs of the objects it references on the target, the address
+        with its prefix length, and the fields set by a transform.
+        '''
+
+        digest = hashlib.sha1(obj.fingerprint())
+        digest.update(
+            "\0".join((
+                str(obj_data.get(field)) for field in ("vlan", "vrf", "address")
+            )).encode("UTF-8"),
+        )
+        if obj.overrides:
+            digest.update(json.dumps(obj.overrides, sort_keys=True).encode("UTF-8"))
+        return digest.hexdigest()
+
+
+    @staticmethod
+    def data_key_get(obj_type, data):
+        '''
+        Get the key identifying an object of the given type on NetBox, from
+        either its data dictionary or its write payload: the VRF and prefix
+        for prefixes, the VRF and address for IP addresses, the VLAN ID for
+        VLANs and the route distinguisher (or name) for VRFs.
+        '''
+
+        if obj_type == "ip-addresses":
+            return (
+                NetBox.object_id_get(data, "vrf"),
+                ip_address_parse(str(data["address"]).split("/")[0]),
+            )
+        if obj_type == "prefixes":
+            return (NetBox.object_id_get(data, "vrf"), ip_network_parse(data["prefix"]))
+        if obj_type == "vlans":
+            return data["vid"]
+        return NetBox.vrf_data_key_get(data)
+
+
+    def obj_get_func(self, obj_type):
+        '''
+        Get the object getter for the given object type.
+        '''
+
+        return {
+            "ip-addresses": self.ip_address_get,
+            "prefixes": self.prefix_get,
+            "vlans": self.vlan_get,
+            "vrfs": self.vrf_get,
+        }[obj_type]
+
+
+    # pylint: disable=too-many-locals
+    def objs_write(self, obj_type, objs, obj_data_func):
+        '''
+        Write the given collection of objects of the given type to the API
+        backend, returning a dictionary of the written objects by ID, and
+        a mapping of the given objects' IDs to their IDs on NetBox.
+
+        The objects currently on NetBox are read once into a compact index
+        (see objs_index), and matched to the given objects by their keys
+        (see data_key_get). Objects which are
+        missing are created, and objects which differ are updated with only
+        the fields which differ, using bulk requests for each chunk of
+        objects (see Chunker). Objects with the same key as an earlier
+        object are written as the same NetBox object.
+        '''
+
+        obj_get_func = self.obj_get_func(obj_type)
+
+        objs_new = dict()
+        old_to_new = dict()
+
+        progress = self.progress.phase(
+            self.name,
+            "{}_write".format(obj_type.replace("-", "_")),
+            total=len(objs),
+        )
+
+        current = self.objs_index(obj_type, self.overrides_fields_get(objs))
+
+        items = self.objs_write_items(obj_type, objs, obj_data_func, current)
+
+        for chunk in self.chunker.chunks(items):
+            counts = collections.Counter()
+
+            for (_, (action, obj, target)), new_obj_data in zip(
+                    chunk.items,
+                    self.api_write_chunk(obj_type, chunk)):
+                if action == "duplicate":
+                    old_to_new[obj.id_get()] = old_to_new[target]
+                    progress.update()
+                    continue
+
+                result, trace_action = self.WRITE_RESULTS[action]
+                new_obj = obj_get_func(new_obj_data if new_obj_data is not None else target)
+                counts[result] += 1
+                self.trace.record(self.name, trace_action, new_obj)
+
+                objs_new[new_obj.id_get()] = new_obj
+                old_to_new[obj.id_get()] = new_obj.id_get()
+                progress.update()
+
+            for result, count in counts.items():
+                self.metrics.counter_add("{}.{}.{}".format(self.name, obj_type, result), count)
+
+        progress.finish()
+
+        return (objs_new, old_to_new)
+
+
+    def objs_index(self, obj_type, fields_written=()):
+        '''
+        Read the objects of the given type currently on NetBox, one page
+        at a time, into an index of their compacted data by key
+        (see data_key_get and obj_data_compact), including the given fields
+        being written to them. Where objects share a key, the first one is
+        indexed.
+        '''
+
+        index = {}
+        fields_params = self.api_fields_params(obj_type, fields_written)
+
+        for page in self.api_list_pages("ipam", obj_type, **fields_params):
+            for data in page:
+                key = self.data_key_get(obj_type, data)
+                if key not in index:
+                    index[key] = self.obj_data_compact(data)
+
+        return index
+
+
+    @staticmethod
+    def overrides_fields_get(objs):
+        '''
+        Get the set of fields set by the overrides of the given objects
+        (see Object.overrides_apply), which are written in addition to the
+        fields of their write payloads.
+        '''
+
+        fields = set()
+        for obj in objs:
+            if obj.overrides:
+                fields.update(obj.overrides)
+        return fields
+
+
+    @staticmethod
+    def obj_data_compact(data):
+        '''
+        Get a compact copy of the given object data dictionary from NetBox,
+        for comparing to write payloads and getting objects from: without
+        the fields which are never written, and with nested objects and
+        choices replaced by their ID or value (see obj_value_normalise).
+        '''
+
+        compact = {}
+
+        for key, value in data.items():
+            if key in NetBox.INDEX_SKIP_FIELDS:
+                continue
+            if key == "custom_fields" and isinstance(value, dict):
+                compact[key] = {
+                    k: v if not isinstance(v, dict) else NetBox.obj_value_normalise(k, v)
+                    for k, v in value.items()
+                }
+            elif isinstance(value, dict):
+                compact[key] = NetBox.obj_value_normalise(key, value)
+            else:
+                compact[key] = value
+
+        return compact
+
+
+    def objs_write_items(self, obj_type, objs, obj_data_func, current):
+        '''
+        Generate the chunk items for writing the given objects of the given
+        type, matched to the given index of current objects on NetBox.
+        Each item is the payload to write (or None) and the context
+        (action, object, target), where the target is the current object
+        on NetBox for updated and unchanged objects, and the ID of the
+        earlier object with the same key for duplicates.
+        '''
+
+        # Key -> ID of the first object with the key.
+        claimed = {}
+
+        for obj in objs:
+            obj_data = obj_data_func(obj)
+            key = self.data_key_get(obj_type, obj_data)
+
+            if key in claimed:
+                yield (None, ("duplicate", obj, claimed[key]))
+                continue
+            claimed[key] = obj.id_get()
+
+            current_obj = current.get(key)
+
+            if current_obj is None:
+                yield (obj_data, ("create", obj, None))
+                continue
+
+            obj_data_changed = self.obj_data_diff(current_obj, obj_data)
+            if obj_data_changed:
+                yield (dict(obj_data_changed, id=current_obj["id"]), ("update", obj, current_obj))
+            else:
+                yield (None, ("unchanged", obj, current_obj))
+
+
+    @staticmethod
+    def obj_value_normalise(key, value):
+        '''
+        Normalise a field value from either a NetBox object or an object write
+        payload, so that the two can be compared.
+        '''
+
+        # Nested objects are written using their ID, and choice fields
+        # using their value.
+        if isinstance(value, dict):
+            if "id" in value:
+                return value["id"]
+            if "value" in value:
+                return value["value"]
+
+        # NetBox stores empty strings for unset text fields.
+        if value == "":
+            return None
+
+        # NetBox returns IP addresses with their mask length, which
+        # is not necessarily given when writing them.
+        if key == "address" and value is not None:
+            return value if "/" in str(value) else "{}/{}".format(
+                value,
+                ip_address_parse(value).max_prefixlen,
+            )
+
+        return value
+
+
+    @staticmethod
+    def obj_data_diff(current_obj, obj_data):
+        '''
+        Return the fields in the given write payload which differ from the
+        given current object on NetBox. An empty dictionary means the object
+        is already up to date.
+        '''
+
+        changed = {}
+
+        for key, value in obj_data.items():
+            current_value = current_obj.get(key)
+
+            # Only compare the custom fields being written, as NetBox returns
+            # every custom field defined for the object type.
+            if key == "custom_fields":
+                current_value = current_value if current_value else {}
+                if any((NetBox.obj_value_normalise(k, v) !=
+                        NetBox.obj_value_normalise(k, current_value.get(k))
+                        for k, v in (value if value else {}).items())):
+                    changed[key] = value
+                continue
+
+            if NetBox.obj_value_normalise(key, value) != \
+               NetBox.obj_value_normalise(key, current_value):
+                changed[key] = value
+
+        return changed
 
 
     def vrfs_write(self, vrfs):
         '''
         Write a dictionary of VRF objects to the API backend.
+        VRFs are matched to the VRFs on NetBox by route distinguisher
+        (or name, for VRFs without one).
         '''
 
-        raise NotImplementedError()
+        self.logger.info("Writing VRFs...")
+
+        vrfs_new, vrfs_old_to_new = self.objs_write("vrfs", sorted(vrfs.values()), self.vrf_data)
+
+        self.logger.info("Wrote {} VRFs.".format(len(vrfs_old_to_new)))
+
+        return (vrfs_new, vrfs_old_to_new)
 
 
     def vlans_write(self, vlans):
@@ -454,29 +1468,9 @@ class NetBox(BaseBackend):
 
         self.logger.info("Writing VLANs...")
 
-        count = 0
-
-        vlans_new = dict()
-        vlans_old_to_new = dict()
-
-        for vlan in vlans.values():
-            new_vlan = self.obj_write(
-                "vlans",
-                {"vid": vlan.vid},
-                {
-                    "name": vlan.name,
-                    "description": vlan.description,
-                    "vid": vlan.vid,
-                },
-                self.vlan_get,
-            )
-
-            vlans_new[new_vlan.id_get()] = new_vlan
-            vlans_old_to_new[vlan.id_get()] = new_vlan.id_get()
-
-            count += 1
+        vlans_new, vlans_old_to_new = self.objs_write("vlans", vlans.values(), self.vlan_data)
 
-        self.logger.info("Wrote {} VLANs.".format(count))
+        self.logger.info("Wrote {} VLANs.".format(len(vlans_old_to_new)))
 
         return (vlans_new, vlans_old_to_new)
 
@@ -494,31 +1488,13 @@ class NetBox(BaseBackend):
 
         self.logger.info("Writing prefixes...")
 
-        count = 0
-
-        prefixes_new = dict()
-        prefixes_old_to_new = dict()
-
-        for prefix in prefixes.values():
-            new_prefix = self.obj_write(
-                "prefixes",
-                {"q": str(prefix.prefix)},
-                {
-                    "description": prefix.description,
-                    "prefix": str(prefix.prefix),
-                    "is_pool": prefix.is_pool,
-                    "vlan": vlans_old_to_new[prefix.vlan_id] if prefix.vlan_id else None,
-                    "vrf": vrfs_old_to_new[prefix.vrf_id] if prefix.vrf_id else None,
-                },
-                self.prefix_get,
-            )
-
-            prefixes_new[new_prefix.id_get()] = new_prefix
-            prefixes_old_to_new[prefix.id_get()] = new_prefix.id_get()
-
-            count += 1
+        prefixes_new, prefixes_old_to_new = self.objs_write(
+            "prefixes",
+            prefixes.values(),
+            lambda p: self.prefix_data(p, vlans_old_to_new, vrfs_old_to_new),
+        )
 
-        self.logger.info("Wrote {} prefixes.".format(count))
+        self.logger.info("Wrote {} prefixes.".format(len(prefixes_old_to_new)))
 
         return (prefixes_new, prefixes_old_to_new)
 
@@ -534,32 +1510,109 @@ class NetBox(BaseBackend):
 
         self.logger.info("Writing IP addresses...")
 
-        count = 0
-
-        ip_addresses_new = dict()
-        ip_addresses_old_to_new = dict()
-
-        for ip_address in ip_addresses.values():
-            new_ip_address = self.obj_write(
-                "ip-addresses",
-                {"q": str(ip_address.address)},
-                {
-                    "description": ip_address.description,
-                    "address": str(ip_address.address),
-                    "custom_fields": ip_address.custom_fields,
-                    "vrf": vrfs_old_to_new[ip_address.vrf_id] if ip_address.vrf_id else None,
-                },
-                self.ip_address_get,
-            )
+        ip_addresses_new, ip_addresses_old_to_new = self.objs_write(
+            "ip-addresses",
+            ip_addresses.values(),
+            lambda a: self.ip_address_data(a, vrfs_old_to_new),
+        )
 
-            ip_addresses_new[new_ip_address.id_get()] = new_ip_address
-            ip_addresses_old_to_new[ip_address.id_get()] = new_ip_address.id_get()
+        self.logger.info("Wrote {} IP addresses.".format(len(ip_addresses_old_to_new)))
 
-            count += 1
+        return (ip_addresses_new, ip_addresses_old_to_new)
 
-        self.logger.info("Wrote {} IP addresses.".format(count))
 
-        return (ip_addresses_new, ip_addresses_old_to_new)
+    #
+    ##
+    #
+
+
+    @staticmethod
+    def ip_address_data(ip_address, vrfs_old_to_new):
+        '''
+        Get the write payload for the given IPAddress object, using the given
+        mapping of VRF IDs to their IDs on NetBox. The address is written with
+        its prefix length if it has one (e.g. when replicating from NetBox).
+        '''
+
+        if ip_address.prefix_length is not None:
+            address = "{}/{}".format(ip_address.address, ip_address.prefix_length)
+        else:
+            address = str(ip_address.address)
+
+        return ip_address.overrides_apply({
+            "description": ip_address.description,
+            "address": address,
+            "custom_fields": ip_address.custom_fields,
+            "vrf": vrfs_old_to_new.get(ip_address.vrf_id),
+        })
+
+
+    @staticmethod
+    def prefix_data(prefix, vlans_old_to_new, vrfs_old_to_new):
+        '''
+        Get the write payload for the given Prefix object, using the given
+        mappings of VLAN and VRF IDs to their IDs on NetBox.
+        '''
+
+        return prefix.overrides_apply({
+            "description": prefix.description,
+            "prefix": str(prefix.prefix),
+            "is_pool": prefix.is_pool,
+            "vlan": vlans_old_to_new.get(prefix.vlan_id),
+            "vrf": vrfs_old_to_new.get(prefix.vrf_id),
+        })
+
+
+    @staticmethod
+    def vlan_data(vlan):
+        '''
+        Get the write payload for the given VLAN object.
+        '''
+
+        return vlan.overrides_apply({
+            "name": vlan.name,
+            "description": vlan.description,
+            "vid": vlan.vid,
+        })
+
+
+    @staticmethod
+    def vrf_data(vrf):
+        '''
+        Get the write payload for the given VRF object.
+        '''
+
+        # NetBox requires VRFs to have a name.
+        return vrf.overrides_apply({
+            "name": vrf.name if vrf.name else vrf.route_distinguisher,
+            "description": vrf.description,
+            "rd": vrf.route_distinguisher,
+            "enforce_unique": vrf.enforce_unique,
+        })
+
+
+    @staticmethod
+    def vrf_key_get(vrf):
+        '''
+        Get the key matching the given VRF object to VRFs on NetBox:
+        its route distinguisher, or its name if it does not have one.
+        '''
+
+        if vrf.route_distinguisher:
+            return vrf.route_distinguisher
+        return ("name", vrf.name)
+
+
+    @staticmethod
+    def vrf_data_key_get(data):
+        '''
+        Get the key matching the given VRF data dictionary from NetBox
+        to VRF objects (see vrf_key_get).
+        '''
+
+        if data["rd"]:
+            return data["rd"]
+        return ("name", data["name"])
 
 
     #
@@ -584,12 +1637,15 @@ class NetBox(BaseBackend):
         Get an IPAddress object from the given data dictionary.
         '''
 
+        address, _, prefix_length = data["address"].partition("/")
+
         return IPAddress(
             data["id"], # ip_address_id
-            data["address"].split("/")[0], # address
+            address, # address
             description=data["description"],
             custom_fields=data["custom_fields"] if "custom_fields" in data else None,
             vrf_id=NetBox.object_id_get(data, "vrf"),
+            prefix_length=prefix_length if prefix_length else None,
         )
 
 
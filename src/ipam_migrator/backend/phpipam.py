@@ -23,20 +23,34 @@ phpIPAM database backend.
 '''
 
 
+import bisect
+import collections
+import concurrent.futures
 import datetime
+import json
+import os
+import threading
+import time
 
 import requests
 
+from ipam_migrator import codec
+
 from ipam_migrator.backend.base import BaseBackend
 
 from ipam_migrator.db.database import Database
 from ipam_migrator.db.ip_address import IPAddress
 from ipam_migrator.db.object import Object
+from ipam_migrator.db.parse import ip_address_parse
 from ipam_migrator.db.prefix import Prefix
 from ipam_migrator.db.vlan import VLAN
+from ipam_migrator.db.vrf import VRF
+
+from ipam_migrator.filter import Filter
 
 from ipam_migrator.exception import APIOptionsError
 from ipam_migrator.exception import APIReadError
+from ipam_migrator.exception import APIWriteError
 from ipam_migrator.exception import AuthMethodUnsupportedError
 
 
@@ -97,6 +111,240 @@ class Section(Object):
         }
 
 
+class PrefixTree(object):
+    '''
+    Containment tree of a dictionary of Prefix objects, computed locally.
+    Only used internally in the PhpIPAM backend for writing subnets, which
+    are nested in phpIPAM using the ID of their parent (master) subnet.
+
+    Prefixes are only nested within the same VRF. Prefixes with the same
+    network and VRF as an earlier prefix are recorded as duplicates of it,
+    and left out of the tree.
+    '''
+
+
+    def __init__(self, prefixes):
+        '''
+        Prefix tree object constructor.
+        '''
+
+        self.prefixes = prefixes
+
+        # Prefix ID -> parent prefix ID (None for top-level prefixes).
+        self.parents = {}
+        # Lists of prefix IDs at each depth of the tree, starting at the top.
+        self.levels = []
+        # Prefix ID -> ID of the earlier prefix it duplicates.
+        self.duplicates = {}
+
+        # (VRF ID, IP version) -> sorted network addresses (as integers),
+        # and the IDs of their prefixes, for address lookups.
+        self.starts = {}
+        self.ids = {}
+
+        stacks = {}
+
+        for prefix in sorted(prefixes.values(), key=self.sort_key):
+            prefix_id = prefix.id_get()
+            key = (prefix.vrf_id if prefix.vrf_id else None, prefix.prefix.version)
+            start = int(prefix.prefix.network_address)
+            end = int(prefix.prefix.broadcast_address)
+
+            # Prefixes are sorted by network address, then by size (largest
+            # first), so the enclosing prefixes of each prefix are on the
+            # stack, and the ones which have ended can be popped off it.
+            stack = stacks.setdefault(key, [])
+            while stack and stack[-1][1] < end:
+                stack.pop()
+
+            if stack and prefixes[stack[-1][0]].prefix == prefix.prefix:
+                self.duplicates[prefix_id] = stack[-1][0]
+                continue
+
+            self.parents[prefix_id] = stack[-1][0] if stack else None
+            if len(stack) == len(self.levels):
+                self.levels.append([])
+            self.levels[len(stack)].append(prefix_id)
+            stack.append((prefix_id, end))
+
+            self.starts.setdefault(key, []).append(start)
+            self.ids.setdefault(key, []).append(prefix_id)
+
+
+    @staticmethod
+    def sort_key(prefix):
+        '''
+        Sort key for building the tree.
+        '''
+
+        return (
+            prefix.vrf_id if prefix.vrf_id else 0,
+            prefix.prefix.version,
+            int(prefix.prefix.network_address),
+            prefix.prefix.prefixlen,
+        )
+
+
+    def lookup(self, address, vrf_id=None):
+        '''
+        Get the ID of the deepest prefix containing the given IP address in
+        the given VRF, or None if there is none. Addresses without a VRF
+        are looked up in the global table first, and then in every VRF.
+        '''
+
+        if vrf_id:
+            keys = [(vrf_id, address.version)]
+        else:
+            keys = [(None, address.version)] + sorted((
+                k for k in self.starts if k[0] is not None and k[1] == address.version
+            ))
+
+        value = int(address)
+
+        for key in keys:
+            if key not in self.starts:
+                continue
+
+            i = bisect.bisect_right(self.starts[key], value) - 1
+            prefix_id = self.ids[key][i] if i >= 0 else None
+
+            # Prefixes starting between the deepest containing prefix and
+            # the address are nested in it, so it is an ancestor of this one.
+            while prefix_id is not None and address not in self.prefixes[prefix_id].prefix:
+                prefix_id = self.parents[prefix_id]
+
+            if prefix_id is not None:
+                return prefix_id
+
+        return None
+
+
+class TokenManager(object):
+    '''
+    Thread-safe authentication token manager.
+
+    Tokens are requested using the given function, which returns the token
+    and its expiry time (as a UTC datetime, or None if it does not expire).
+    The token is refreshed by a background timer ahead of its expiry, and
+    concurrent requests for a new token share a single request.
+    '''
+
+
+    # Refresh tokens this many seconds before they expire.
+    REFRESH_MARGIN = 60
+
+
+    def __init__(self, logger, name, token_request_func):
+        '''
+        Token manager object constructor.
+        '''
+
+        self.logger = logger
+        self.name = name
+        self.token_request_func = token_request_func
+
+        self.lock = threading.Lock()
+        self.timer = None
+
+        self.token = None
+        # time.monotonic() value after which the token needs refreshing,
+        # or None if it does not expire.
+        self.refresh_at = None
+
+
+    def token_get(self):
+        '''
+        Get a valid authentication token, requesting a new one if necessary.
+        '''
+
+        # Fast path: a token is cached and not due for refreshing.
+        token = self.token
+        refresh_at = self.refresh_at
+        if token and (refresh_at is None or time.monotonic() < refresh_at):
+            return token
+
+        with self.lock:
+            # Another thread may have refreshed the token while we waited for the lock.
+            if self.token and (self.refresh_at is None or time.monotonic() < self.refresh_at):
+                return self.token
+            return self.refresh()
+
+
+    def invalidate(self, token):
+        '''
+        Mark the given token as rejected by the API backend, so that the next
+        call to token_get requests a new one. Does nothing if the token has
+        already been replaced.
+        '''
+
+        with self.lock:
+            if self.token == token:
+                self.token = None
+
+
+    def refresh(self):
+        '''
+        Request a new token, and schedule its background refresh.
+        Must be called with the lock held.
+        '''
+
+        token, expires = self.token_request_func()
+
+        self.token = token
+
+        if self.timer:
+            self.timer.cancel()
+            self.timer = None
+
+        if expires is None:
+            self.refresh_at = None
+            return token
+
+        remaining = (expires - datetime.datetime.utcnow()).total_seconds()
+        if remaining <= self.REFRESH_MARGIN:
+            # Short-lived token, refresh half way through its lifetime instead.
+            delay = max(remaining / 2, 0)
+        else:
+            delay = remaining - self.REFRESH_MARGIN
+        self.refresh_at = time.monotonic() + delay
+
+        self.timer = threading.Timer(delay, self.refresh_background)
+        self.timer.daemon = True
+        self.timer.start()
+
+        return token
+
+
+    def refresh_background(self):
+        '''
+        Refresh the token ahead of its expiry in the background.
+        '''
+
+        with self.lock:
+            try:
+                self.refresh()
+                self.logger.debug("%s: refreshed authentication token", self.name)
+            # pylint: disable=broad-except
+            except Exception as exc:
+                # Leave the token to be refreshed on demand by token_get.
+                self.logger.warning(
+                    "%s: unable to refresh authentication token in the background: %s",
+                    self.name,
+                    exc,
+                )
+
+
+    def close(self):
+        '''
+        Stop the background token refresh timer.
+        '''
+
+        with self.lock:
+            if self.timer:
+                self.timer.cancel()
+                self.timer = None
+
+
 class PhpIPAM(BaseBackend):
     '''
     phpIPAM API backend.
@@ -106,21 +354,44 @@ class PhpIPAM(BaseBackend):
     # pylint: disable=too-many-public-methods
 
 
+    # API controllers used by the backend, whose methods are
+    # read once per run to detect the features supported by the endpoint.
+    CONTROLLERS = ("sections", "subnets", "addresses", "vlans", "vrfs")
+
+    # Capabilities cache file format version, and the maximum age of
+    # cached capabilities before they are read from the endpoint again.
+    CAPABILITIES_CACHE_VERSION = 1
+    CAPABILITIES_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+    # Name of the section prefixes and IP addresses are written to.
+    SECTION_NAME = "ipam-migrator"
+
+    # Default number of concurrent requests when writing objects.
+    WRITE_CONCURRENCY = 8
+
+    # Minimum share of the subnets with IP addresses on the API endpoint
+    # whose addresses are needed for reading every address in one request,
+    # instead of reading the addresses of each subnet.
+    READ_ALL_RATIO = 0.5
+
+
     # pylint: disable=too-many-arguments
     def __init__(self,
                  logger, name,
                  api_endpoint, api_auth_method,
-                 api_auth_data, api_ssl_verify):
+                 api_auth_data, api_ssl_verify,
+                 capabilities_cache=None,
+                 write_concurrency=None,
+                 **kwargs):
         '''
         phpIPAM API backend constructor.
         '''
 
-        super().__init__(logger, name)
+        super().__init__(logger, name, **kwargs)
 
         # Configuration fields.
         self.api_endpoint = api_endpoint
 
-        self.token = None
         self.api_auth_method = api_auth_method
         if self.api_auth_method == "login":
             self.api_user = api_auth_data[0]
@@ -150,9 +421,21 @@ class PhpIPAM(BaseBackend):
             except ImportError:
                 pass
 
+        self.capabilities_cache = capabilities_cache
+
+        self.write_concurrency = write_concurrency if write_concurrency else self.WRITE_CONCURRENCY
+
         # Runtime fields.
-        self.token = None
-        self.token_expires = None
+        self.auth = TokenManager(logger, name, self.api_token_request)
+
+        # Controller name -> {command tuple: frozenset of methods}
+        self.capabilities = {}
+
+        # IDs of prefixes known to contain no IP addresses.
+        self.prefixes_empty = set()
+
+        # Number of subnets with IP addresses on the API endpoint, if known.
+        self.subnets_used_total = None
 
 
     #
@@ -160,44 +443,107 @@ class PhpIPAM(BaseBackend):
     #
 
 
+    def close(self):
+        '''
+        Stop the background authentication token refresh.
+        '''
+
+        self.auth.close()
+        super().close()
+
+
     def api_authenticate(self):
         '''
-        Authenticate with the API backend.
+        Authenticate with the API backend, returning a valid token.
         '''
 
-        if self.token and not self.token_expires:
-            return
-        elif self.token and \
-             self.token_expires and self.token_expires >= datetime.datetime.utcnow():
-            return
-        else:
-            response = requests.post(
+        return self.auth.token_get()
+
+
+    def api_token_request(self):
+        '''
+        Request a new authentication token from the API backend,
+        returning the token and its expiry time.
+        '''
+
+        with self.metrics.phase(self.name, "auth"):
+            response = self.http_request(
+                "POST",
                 "{}/user/".format(self.api_endpoint),
                 auth=requests.auth.HTTPBasicAuth(self.api_user, self.api_pass),
                 verify=self.api_ssl_verify,
             )
 
-            if not response.text:
-                raise RuntimeError("ERROR {}: (empty response)".format(response.status_code))
-            elif response.text == "Authentication failed":
-                raise RuntimeError("ERROR {}: authentication failed".format(response.status_code))
+        if not response.content:
+            raise RuntimeError("ERROR {}: (empty response)".format(response.status_code))
+        elif response.content == b"Authentication failed":
+            raise RuntimeError("ERROR {}: authentication failed".format(response.status_code))
 
-            obj = response.json()
+        obj = codec.loads(response.content)
 
-            if obj["success"]:
-                self.token = obj["data"]["token"]
-                # Example format: 2015-07-09 20:05:28
-                self.token_expires = datetime.datetime.strptime(
-                    obj["data"]["expires"],
-                    "%Y-%m-%d %H:%M:%S",
-                )
-            else:
-                raise RuntimeError(
-                    "ERROR {}: failed to receive authentication token from phpIPAM ({})".format(
-                        obj["code"],
-                        obj["message"],
-                    ),
+        if not obj["success"]:
+            raise RuntimeError(
+                "ERROR {}: failed to receive authentication token from phpIPAM ({})".format(
+                    obj["code"],
+                    obj["message"],
+                ),
+            )
+
+        # Example format: 2015-07-09 20:05:28
+        expires = obj["data"].get("expires")
+
+        return (
+            obj["data"]["token"],
+            datetime.datetime.strptime(expires, "%Y-%m-%d %H:%M:%S") if expires else None,
+        )
+
+
+    def api_send(self, method, *args, data=None):
+        '''
+        Send an authenticated request to the API backend, returning the
+        response and its decoded body (None if the response is empty).
+        If the token is rejected, a new one is requested and the request
+        is sent again once.
+        '''
+
+        command = "/".join((str(a) for a in args))
+        uri = "{}/{}/".format(self.api_endpoint, command)
+
+        body = codec.dumps(data) if data is not None else None
+
+        retried = False
+        while True:
+            token = self.api_authenticate()
+
+            headers = {"phpipam-token": token}
+            if body is not None:
+                headers["Content-Type"] = codec.CONTENT_TYPE
+
+            response = self.http_request(
+                method,
+                uri,
+                headers=headers,
+                data=body,
+                verify=self.api_ssl_verify,
+            )
+
+            if not response.content:
+                return (response, None)
+
+            obj = codec.loads(response.content)
+
+            if not retried and not obj["success"] and obj["code"] in (401, 403) and \
+               "token" in str(obj.get("message", "")).lower():
+                self.logger.debug(
+                    "%s: authentication token rejected (%s), requesting a new one",
+                    self.name,
+                    obj["message"],
                 )
+                self.auth.invalidate(token)
+                retried = True
+                continue
+
+            return (response, obj)
 
 
     def api_read(self, *args, data=None):
@@ -205,22 +551,11 @@ class PhpIPAM(BaseBackend):
         Read an object from the API backend.
         '''
 
-        self.api_authenticate()
-
-        command = "/".join((str(a) for a in args))
-
-        response = requests.get(
-            "{}/{}/".format(self.api_endpoint, command),
-            headers={"phpipam-token": self.token},
-            data=data,
-            verify=self.api_ssl_verify,
-        )
+        response, obj = self.api_send("GET", *args, data=data)
 
-        if not response.text:
+        if obj is None:
             raise APIReadError(response.status_code, "(empty response)")
 
-        obj = response.json()
-
         if not obj["success"]:
             raise APIReadError(obj["code"], obj["message"])
 
@@ -233,21 +568,11 @@ class PhpIPAM(BaseBackend):
         See the comments for usage details.
         '''
 
-        self.api_authenticate()
-
-        command = "/".join((str(a) for a in args))
+        response, obj = self.api_send("OPTIONS", *args)
 
-        response = requests.options(
-            "{}/{}/".format(self.api_endpoint, command),
-            headers={"phpipam-token": self.token},
-            verify=self.api_ssl_verify,
-        )
-
-        if not response.text:
+        if obj is None:
             raise APIOptionsError(response.status_code, "(empty response)")
 
-        obj = response.json()
-
         if not obj["success"]:
             raise APIOptionsError(obj["code"], obj["message"])
 
@@ -256,26 +581,233 @@ class PhpIPAM(BaseBackend):
         # Example dict:
         # {
         #   # https://ipam.example.com/api/example/vlans
-        #   ("vlans",): ["OPTIONS", "GET"],
+        #   ("vlans",): frozenset({"OPTIONS", "GET"}),
         #   # https://ipam.example.com/api/example/vlans/{id}
-        #   ("vlans", "{id}"): ["GET", "POST", "PATCH", "DELETE"],
+        #   ("vlans", "{id}"): frozenset({"GET", "POST", "PATCH", "DELETE"}),
         # }
         command_methods = {}
         for href_methods in obj["data"]["methods"]:
             href = href_methods["href"]
             command = tuple(href.strip("/").split("/"))[2:]
             methods = href_methods["methods"]
-            command_methods[command] = (met["method"] for met in methods)
+            command_methods[command] = frozenset((met["method"] for met in methods))
 
         return command_methods
 
 
+    def api_controller_supports(self, command, method):
+        '''
+        Check whether the given command tuple supports the given method,
+        using the capabilities cache. The controller methods are only read
+        from the API backend if they have not been read already.
+        '''
+
+        controller = command[0]
+
+        if controller not in self.capabilities:
+            self.capabilities[controller] = self.api_controller_methods(controller)
+
+        return method in self.capabilities[controller].get(tuple(command), frozenset())
+
+
+    def capabilities_set(self, command, methods):
+        '''
+        Record the methods supported by the given command tuple, as detected
+        by trying them, in the capabilities cache.
+        '''
+
+        command_methods = self.capabilities.setdefault(command[0], {})
+
+        if command_methods.get(tuple(command)) != methods:
+            command_methods[tuple(command)] = methods
+            self.capabilities_cache_save()
+
+
+    def capabilities_read(self, controllers=None):
+        '''
+        Read the methods of the given controllers (by default, all controllers
+        used by the backend) into the capabilities cache, loading them from
+        and saving them to the capabilities cache file if one is configured.
+        '''
+
+        controllers = controllers if controllers is not None else self.CONTROLLERS
+
+        cache = self.capabilities_cache_load()
+        if cache:
+            for controller, command_methods in cache.items():
+                self.capabilities.setdefault(controller, command_methods)
+
+        missing = [c for c in controllers if c not in self.capabilities]
+        if not missing:
+            self.logger.debug("using cached API controller capabilities for all controllers")
+            return
+
+        for controller in missing:
+            try:
+                self.capabilities[controller] = self.api_controller_methods(controller)
+            except APIOptionsError as err:
+                self.logger.debug(
+                    "unable to read methods for API controller '%s': %s",
+                    controller,
+                    err,
+                )
+                self.capabilities[controller] = {}
+
+        self.capabilities_cache_save()
+
+
+    def capabilities_cache_load(self):
+        '''
+        Load the capabilities of this API endpoint from the
+        capabilities cache file, if it is configured and up to date.
+        '''
+
+        if not self.capabilities_cache or not os.path.isfile(self.capabilities_cache):
+            return None
+
+        try:
+            with open(self.capabilities_cache, "r", encoding="UTF-8") as cache_file:
+                cache = json.load(cache_file)
+        except (OSError, ValueError) as err:
+            self.logger.warning(
+                "unable to read capabilities cache file '%s', ignoring: %s",
+                self.capabilities_cache,
+                err,
+            )
+            return None
+
+        if cache.get("version") != self.CAPABILITIES_CACHE_VERSION:
+            return None
+
+        entry = cache.get("endpoints", {}).get(self.api_endpoint)
+        if not entry or time.time() - entry["time"] > self.CAPABILITIES_CACHE_MAX_AGE:
+            return None
+
+        return {
+            controller: {
+                tuple(command.split("/")): frozenset(methods)
+                for command, methods in command_methods.items()
+            }
+            for controller, command_methods in entry["controllers"].items()
+        }
+
+
+    def capabilities_cache_save(self):
+        '''
+        Save the capabilities of this API endpoint to the
+        capabilities cache file, if it is configured.
+        '''
+
+        if not self.capabilities_cache:
+            return
+
+        cache = {"version": self.CAPABILITIES_CACHE_VERSION, "endpoints": {}}
+
+        if os.path.isfile(self.capabilities_cache):
+            try:
+                with open(self.capabilities_cache, "r", encoding="UTF-8") as cache_file:
+                    old_cache = json.load(cache_file)
+                if old_cache.get("version") == self.CAPABILITIES_CACHE_VERSION:
+                    cache = old_cache
+            except (OSError, ValueError):
+                pass
+
+        cache["endpoints"][self.api_endpoint] = {
+            "time": time.time(),
+            "controllers": {
+                controller: {
+                    "/".join(command): sorted(methods)
+                    for command, methods in command_methods.items()
+                }
+                for controller, command_methods in self.capabilities.items()
+            },
+        }
+
+        try:
+            dirname = os.path.dirname(self.capabilities_cache)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            with open(self.capabilities_cache, "w", encoding="UTF-8") as cache_file:
+                json.dump(cache, cache_file, sort_keys=True, indent=4)
+        except OSError as err:
+            self.logger.warning(
+                "unable to write capabilities cache file '%s': %s",
+                self.capabilities_cache,
+                err,
+            )
+
+
     def api_write(self, *args, data=None):
         '''
-        Write an object to the API backend.
+        Write an object to the API backend, returning the decoded response.
+        For POST requests, the ID of the new object is in its 'id' field.
+        '''
+
+        req_type = args[0]
+        if req_type not in ("POST", "PATCH"):
+            raise APIWriteError(0, "request type '{}' unsupported by api_write".format(req_type))
+
+        response, obj = self.api_send(req_type, *args[1:], data=data)
+
+        if obj is None:
+            raise APIWriteError(response.status_code, "(empty response)")
+
+        if not obj["success"]:
+            raise APIWriteError(obj["code"], obj["message"])
+
+        return obj
+
+
+    def api_patch(self, *args, data=None):
+        '''
+        Send a PATCH request to the API backend.
         '''
 
-        raise NotImplementedError()
+        return self.api_write("PATCH", *args, data=data)
+
+
+    def api_post(self, *args, data=None):
+        '''
+        Send a POST request to the API backend.
+        '''
+
+        return self.api_write("POST", *args, data=data)
+
+
+    def obj_create(self, controller, data):
+        '''
+        Create an object using the given controller, returning its ID.
+        '''
+
+        return int(self.api_post(controller, data=data)["id"])
+
+
+    def obj_update(self, controller, obj_id, data):
+        '''
+        Update the given fields of the object with the given ID, using the
+        object's own URI if the controller supports it, or the controller's
+        root URI with the ID in the payload otherwise (phpIPAM < 1.3).
+        '''
+
+        if self.api_controller_supports((controller, "{id}"), "PATCH"):
+            return self.api_patch(controller, obj_id, data=data)
+        return self.api_patch(controller, data=dict(data, id=obj_id))
+
+
+    def concurrent_map(self, func, items):
+        '''
+        Call the given function for each of the given items using concurrent
+        requests, returning the results in order.
+        '''
+
+        items = list(items)
+
+        if self.write_concurrency <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(self.write_concurrency, len(items))) as executor:
+            return list(executor.map(func, items))
 
 
     #
@@ -287,43 +819,72 @@ class PhpIPAM(BaseBackend):
                       read_ip_addresses=True,
                       read_prefixes=True,
                       read_vlans=True,
-                      read_vrfs=True):
+                      read_vrfs=True,
+                      filters=None):
         '''
         Read a Database object from the API backend.
         '''
 
+        filters = filters if filters is not None else Filter()
+        self.extras = {}
+
+        # Detect the features supported by the API endpoint.
+        with self.metrics.phase(self.name, "capabilities"):
+            self.capabilities_read()
+
+        # VRFs are required for resolving the VRF filter,
+        # even if the VRFs themselves are not requested in the database.
+        if read_vrfs or filters.vrfs:
+            with self.metrics.phase(self.name, "vrfs"):
+                vrfs = self.vrfs_read(filters)
+            filters.vrfs_resolve(vrfs)
+        else:
+            vrfs = None
+
         # Read sections, needed for getting prefixes and IP addresses.
-        sections = self.sections_read() if read_prefixes or read_ip_addresses else None
+        if read_prefixes or read_ip_addresses:
+            with self.metrics.phase(self.name, "sections"):
+                sections = self.sections_read(filters)
+        else:
+            sections = None
 
         # Reading prefixes are required for reading IP addresses,
-        # even if the VLANs themselves are not requested in the database.
+        # even if the prefixes themselves are not requested in the database.
         if read_prefixes or read_ip_addresses:
-            prefixes = self.prefixes_read_from_sections(sections)
+            with self.metrics.phase(self.name, "prefixes"):
+                prefixes = self.prefixes_read_from_sections(sections, filters)
         else:
             prefixes = None
 
         if read_ip_addresses:
-            ip_addresses = self.ip_addresses_read_from_prefixes(prefixes)
+            with self.metrics.phase(self.name, "ip_addresses"):
+                ip_addresses = self.ip_addresses_read_from_prefixes(prefixes, filters)
         else:
             ip_addresses = None
 
-        vlans = self.vlans_read() if read_vlans else None
-        vrfs = self.vrfs_read() if read_vrfs else None
+        if read_vlans:
+            with self.metrics.phase(self.name, "vlans"):
+                vlans = self.vlans_read(filters)
+        else:
+            vlans = None
 
         return Database(
             self.name,
             ip_addresses=ip_addresses,
-            prefixes=prefixes, # phpIPAM: Subnets
+            prefixes=prefixes if read_prefixes else None, # phpIPAM: Subnets
             vlans=vlans,
-            vrfs=vrfs,
+            vrfs=vrfs if read_vrfs else None,
+            extras=self.extras,
         )
 
 
-    def sections_read(self):
+    def sections_read(self, filters=None):
         '''
         Read a dictionary of Section objects from the API backend.
         '''
 
+        filters = filters if filters is not None else Filter()
+
         sections = {}
 
         self.logger.info("Searching for sections...")
@@ -331,26 +892,38 @@ class PhpIPAM(BaseBackend):
         for data in self.api_read("sections"):
             i = data["id"]
 
+            if not filters.section_match(i):
+                continue
+
             sections[i] = self.section_get(data)
-            self.logger.debug("found {}".format(sections[i]))
+            self.trace.record(self.name, "found", sections[i])
 
         self.logger.info("Found {} sections.".format(len(sections)))
 
         return sections
 
 
-    def prefixes_read_from_sections(self, sections):
+    def prefixes_read_from_sections(self, sections, filters=None):
         '''
         Read a dictionary of Prefix objects from the API backend,
         using previously read Sections.
         '''
 
+        filters = filters if filters is not None else Filter()
+
         prefixes = {}
+        self.prefixes_empty = set()
+
+        # Subnets in sections not being read are not counted.
+        subnets_used_total = 0
 
         self.logger.info("Searching for prefixes in found sections...")
 
+        progress = self.progress.phase(self.name, "prefixes", total=len(sections))
+
         for section_id in sections.keys():
             try:
+                found = 0
                 for data in self.api_read("sections", section_id, "subnets"):
                     i = data["id"]
 
@@ -364,53 +937,215 @@ class PhpIPAM(BaseBackend):
                         )
                         continue
 
-                    prefixes[i] = self.prefix_get(data)
-                    self.logger.debug("found {}".format(prefixes[i]))
+                    if not self.prefix_empty_get(data):
+                        subnets_used_total += 1
+
+                    prefix = self.transform_apply("prefixes", data, self.prefix_get(data))
+                    if not filters.prefix_match(prefix):
+                        continue
+
+                    prefixes[i] = prefix
+                    self.extras_add("prefixes", data, prefix)
+                    self.trace.record(self.name, "found", prefixes[i])
+                    found += 1
+
+                    if self.prefix_empty_get(data):
+                        self.prefixes_empty.add(i)
 
             except APIReadError as err:
-                if err.api_message == "No subnets found":
-                    continue
-                else:
+                if err.api_message != "No subnets found":
                     raise
 
+            progress.update(objects=found)
+
+        progress.finish()
+
+        self.subnets_used_total = subnets_used_total if not filters.sections else None
+
         self.logger.info("Found {} prefixes.".format(len(prefixes)))
+        if self.prefixes_empty:
+            self.logger.info(
+                "{} prefixes are folders or have no used addresses, "
+                "skipping reading their IP addresses.".format(len(self.prefixes_empty)),
+            )
 
         return prefixes
 
 
-    def ip_addresses_read_from_prefixes(self, prefixes):
+    def ip_addresses_read_from_prefixes(self, prefixes, filters=None):
         '''
         Read a dictionary of IPAddress objects from the API backend,
         using previously read Prefixes.
+
+        If the API endpoint supports reading all addresses in one request,
+        that is used instead of reading the addresses of each prefix.
         '''
 
-        ip_addresses = {}
+        filters = filters if filters is not None else Filter()
 
         self.logger.info("Searching for IP addresses used in found prefixes...")
 
-        for prefix_id in prefixes.keys():
+        if self.ip_addresses_read_strategy(prefixes.keys()) == "all":
+            ip_addresses = self.ip_addresses_read_all(prefixes, filters)
+            if ip_addresses is not None:
+                self.logger.info("Found {} IP addresses.".format(len(ip_addresses)))
+                return ip_addresses
+
+        ip_addresses = self.ip_addresses_read_per_prefix(prefixes, filters)
+
+        self.logger.info("Found {} IP addresses.".format(len(ip_addresses)))
+
+        return ip_addresses
+
+
+    def ip_addresses_read_strategy(self, prefix_ids):
+        '''
+        Choose the strategy for reading the IP addresses in the prefixes with
+        the given IDs: 'all' to read every address in one request, or
+        'per-prefix' to read the addresses of each prefix in one request per
+        prefix. Every address is only read if most of the subnets with
+        addresses on the API endpoint are needed (e.g. not when filtering).
+        '''
+
+        prefixes_used = len([i for i in prefix_ids if i not in self.prefixes_empty])
+        if prefixes_used <= 1:
+            return "per-prefix"
+        if prefixes_used < self.subnets_used_total_get() * self.READ_ALL_RATIO:
+            return "per-prefix"
+
+        # phpIPAM 1.4+ supports 'addresses/all', but does not always advertise it
+        # in the controller methods. Unless the controller is known not to
+        # support it, try it: if it fails, one request is wasted, and the
+        # result is remembered in the capabilities cache.
+        if self.api_controller_supports(("addresses", "all"), "GET"):
+            return "all"
+        if ("addresses", "all") in self.capabilities.get("addresses", {}):
+            return "per-prefix"
+        if not self.api_controller_supports(("addresses",), "GET") and \
+           not self.api_controller_supports(("addresses", "{id}"), "GET"):
+            return "per-prefix"
+        return "all"
+
+
+    def subnets_used_total_get(self):
+        '''
+        Get the number of subnets with IP addresses on the API endpoint,
+        reading the subnets of every section if it is not known yet.
+        '''
+
+        if self.subnets_used_total is None:
+            subnets_used_total = 0
+            for section_data in self.api_read("sections"):
+                try:
+                    for data in self.api_read("sections", section_data["id"], "subnets"):
+                        if data["subnet"] and data["mask"] and not self.prefix_empty_get(data):
+                            subnets_used_total += 1
+                except APIReadError as err:
+                    if err.api_message != "No subnets found":
+                        raise
+            self.subnets_used_total = subnets_used_total
+
+        return self.subnets_used_total
+
+
+    def ip_addresses_read_all(self, prefixes, filters):
+        '''
+        Read a dictionary of IPAddress objects in the given prefixes from the
+        API backend in a single request. Returns None if the API endpoint
+        does not support it.
+        '''
+
+        ip_addresses = {}
+        prefix_ids = frozenset((str(i) for i in prefixes.keys()))
+
+        progress = self.progress.phase(self.name, "ip_addresses", total=1)
+
+        try:
+            datas = self.api_read("addresses", "all")
+        except APIReadError as err:
+            if err.api_message == "No addresses found":
+                datas = []
+            else:
+                self.logger.info(
+                    "NOTE: 'addresses/all' not supported by API endpoint (%s), "
+                    "reading IP addresses per prefix (consider upgrading to phpIPAM 1.4+)",
+                    err.api_message,
+                )
+                self.capabilities_set(("addresses", "all"), frozenset())
+                return None
+        except ValueError as err:
+            # Older phpIPAM versions (or a proxy in front of them) may
+            # return an HTML error page instead of a JSON error.
+            self.logger.info(
+                "NOTE: 'addresses/all' returned an invalid response (%s), "
+                "reading IP addresses per prefix (consider upgrading to phpIPAM 1.4+)",
+                err,
+            )
+            self.capabilities_set(("addresses", "all"), frozenset())
+            return None
+
+        self.capabilities_set(("addresses", "all"), frozenset(("GET",)))
+
+        for data in datas:
+            if str(data["subnetId"]) not in prefix_ids:
+                continue
+            ip_address = self.transform_apply("ip_addresses", data, self.ip_address_get(data))
+            if not filters.ip_address_match(ip_address):
+                continue
+            i = data["id"]
+            ip_addresses[i] = ip_address
+            self.extras_add("ip_addresses", data, ip_address)
+            self.trace.record(self.name, "found", ip_addresses[i])
+
+        progress.update(objects=len(ip_addresses))
+        progress.finish()
+
+        return ip_addresses
+
+
+    def ip_addresses_read_per_prefix(self, prefixes, filters):
+        '''
+        Read a dictionary of IPAddress objects in the given prefixes from the
+        API backend, using one request per prefix.
+        '''
+
+        ip_addresses = {}
+
+        prefix_ids = [i for i in prefixes.keys() if i not in self.prefixes_empty]
+
+        progress = self.progress.phase(self.name, "ip_addresses", total=len(prefix_ids))
+
+        for prefix_id in prefix_ids:
             try:
+                found = 0
                 for data in self.api_read("subnets", prefix_id, "addresses"):
+                    ip_address = self.transform_apply("ip_addresses", data, self.ip_address_get(data))
+                    if not filters.ip_address_match(ip_address):
+                        continue
                     i = data["id"]
-                    ip_addresses[i] = self.ip_address_get(data)
-                    self.logger.debug("found {}".format(ip_addresses[i]))
+                    ip_addresses[i] = ip_address
+                    self.extras_add("ip_addresses", data, ip_address)
+                    self.trace.record(self.name, "found", ip_addresses[i])
+                    found += 1
 
             except APIReadError as err:
-                if err.api_message == "No addresses found":
-                    continue
-                else:
+                if err.api_message != "No addresses found":
                     raise
 
-        self.logger.info("Found {} IP addresses.".format(len(ip_addresses)))
+            progress.update(objects=found)
+
+        progress.finish()
 
         return ip_addresses
 
 
-    def vlans_read(self):
+    def vlans_read(self, filters=None):
         '''
         Read a dictionary of VLAN objects from the API backend.
         '''
 
+        filters = filters if filters is not None else Filter()
+
         vlans = {}
 
         self.logger.info("Searching for VLANs...")
@@ -418,11 +1153,19 @@ class PhpIPAM(BaseBackend):
         # GET command for the VLANs controller is not supported in phpIPAM
         # versions older than 1.3. It's much faster, though, so use it if
         # it's available.
-        if "GET" in self.api_controller_methods("vlans")[("vlans",)]:
-            for data in self.api_read("vlans"):
-                i = data["id"]
-                vlans[i] = self.vlan_get(data)
-                self.logger.debug("found {}".format(vlans[i]))
+        if self.api_controller_supports(("vlans",), "GET"):
+            try:
+                for data in self.api_read("vlans"):
+                    vlan = self.transform_apply("vlans", data, self.vlan_get(data))
+                    if not filters.vlan_match(vlan):
+                        continue
+                    i = data["id"]
+                    vlans[i] = vlan
+                    self.extras_add("vlans", data, vlan)
+                    self.trace.record(self.name, "found", vlans[i])
+            except APIReadError as err:
+                if err.api_message != "No vlans configured":
+                    raise
 
         else:
             self.logger.info(
@@ -430,27 +1173,57 @@ class PhpIPAM(BaseBackend):
                 "using iterative path (consider upgrading to phpIPAM 1.3+)",
             )
 
+            progress = self.progress.phase(self.name, "vlans", total=4094)
+
             for i in range(1, 4095):
                 try:
-                    vlans[i] = self.vlan_get(self.api_read("vlans", i))
-                    self.logger.debug("found {}".format(vlans[i]))
+                    data = self.api_read("vlans", i)
+                    vlan = self.transform_apply("vlans", data, self.vlan_get(data))
+                    if filters.vlan_match(vlan):
+                        vlans[i] = vlan
+                        self.extras_add("vlans", data, vlan)
+                        self.trace.record(self.name, "found", vlans[i])
+                    progress.update()
                 except APIReadError as err:
                     if err.api_message == "Vlan not found":
-                        continue
+                        progress.update(objects=0)
                     else:
                         raise
 
+            progress.finish()
+
         self.logger.info("Found {} VLANs.".format(len(vlans)))
 
         return vlans
 
 
-    def vrfs_read(self):
+    def vrfs_read(self, filters=None):
         '''
         Read a dictionary of VRF objects from the API backend,
         '''
 
-        raise NotImplementedError()
+        filters = filters if filters is not None else Filter()
+
+        vrfs = {}
+
+        self.logger.info("Searching for VRFs...")
+
+        try:
+            for data in self.api_read("vrfs"):
+                vrf = self.transform_apply("vrfs", data, self.vrf_get(data))
+                if not filters.vrf_match(vrf):
+                    continue
+                i = data["vrfId"]
+                vrfs[i] = vrf
+                self.extras_add("vrfs", data, vrf)
+                self.trace.record(self.name, "found", vrfs[i])
+        except APIReadError as err:
+            if err.api_message != "No vrfs configured":
+                raise
+
+        self.logger.info("Found {} VRFs.".format(len(vrfs)))
+
+        return vrfs
 
 
     #
@@ -463,47 +1236,491 @@ class PhpIPAM(BaseBackend):
         Write a Database object to the API backend.
         '''
 
-        raise NotImplementedError()
+        # pylint: disable=unused-variable
+
+        # Detect the features supported by the API endpoint.
+        with self.metrics.phase(self.name, "capabilities"):
+            self.capabilities_read()
+
+        # Subnets are counted again if needed, as they change when writing.
+        self.subnets_used_total = None
+
+        if database.vrfs:
+            with self.metrics.phase(self.name, "vrfs_write"):
+                vrfs_new, vrfs_old_to_new = self.vrfs_write(database.vrfs)
+        else:
+            vrfs_new = {}
+            vrfs_old_to_new = {}
+
+        if database.vlans:
+            with self.metrics.phase(self.name, "vlans_write"):
+                vlans_new, vlans_old_to_new = self.vlans_write(database.vlans)
+        else:
+            vlans_new = {}
+            vlans_old_to_new = {}
+
+        if not database.prefixes and not database.ip_addresses:
+            return
+
+        with self.metrics.phase(self.name, "sections_write"):
+            section_id = self.sections_write()
+
+        prefix_tree = PrefixTree(database.prefixes)
+
+        if database.prefixes:
+            with self.metrics.phase(self.name, "prefixes_write"):
+                prefixes_new, prefixes_old_to_new = self.prefixes_write(
+                    prefix_tree,
+                    section_id,
+                    vlans_old_to_new,
+                    vrfs_old_to_new,
+                )
+        else:
+            prefixes_new = {}
+            prefixes_old_to_new = {}
+
+        if database.ip_addresses:
+            with self.metrics.phase(self.name, "ip_addresses_write"):
+                self.ip_addresses_write(
+                    database.ip_addresses,
+                    prefix_tree,
+                    prefixes_old_to_new,
+                )
 
 
     def sections_write(self):
         '''
-        Write a dictionary of Section objects to the API backend.
+        Find the section prefixes and IP addresses are written to,
+        creating it if it does not exist, and return its ID.
+        '''
+
+        for data in self.api_read("sections"):
+            if data["name"] == self.SECTION_NAME:
+                self.logger.info("Writing to existing section '{}'.".format(self.SECTION_NAME))
+                return int(data["id"])
+
+        section_id = self.obj_create("sections", {
+            "name": self.SECTION_NAME,
+            "description": "Migrated by ipam-migrator",
+        })
+
+        self.metrics.counter_add("{}.sections.created".format(self.name))
+        self.logger.info("Created section '{}'.".format(self.SECTION_NAME))
+
+        return section_id
+
+
+    def ip_addresses_write(self, ip_addresses, prefix_tree, prefixes_old_to_new):
+        '''
+        Write a dictionary of IPAddress objects to the API backend, in the
+        deepest previously written prefix containing each of them.
+
+        Only the IP addresses in existing subnets are read to find the
+        addresses to update, as new subnets are known to be empty.
+        '''
+
+        self.logger.info("Writing IP addresses...")
+
+        ip_addresses_new = dict()
+        ip_addresses_old_to_new = dict()
+
+        current = self.ip_addresses_data_read(set(prefixes_old_to_new.values()))
+
+        progress = self.progress.phase(self.name, "ip_addresses_write", total=len(ip_addresses))
+
+        # IP addresses to write, grouped by subnet and address, as IP addresses
+        # in the same subnet with the same address are written as one.
+        writes = collections.OrderedDict()
+
+        for ip_address in sorted(ip_addresses.values()):
+            prefix_id = prefix_tree.lookup(ip_address.address, ip_address.vrf_id)
+
+            if prefix_id is None or prefix_id not in prefixes_old_to_new:
+                self.logger.warning(
+                    "{} is not inside any written prefix, skipping".format(ip_address),
+                )
+                self.metrics.counter_add("{}.addresses.skipped".format(self.name))
+                progress.update()
+                continue
+
+            key = (prefixes_old_to_new[prefix_id], str(ip_address.address))
+            writes.setdefault(key, []).append(ip_address)
+
+        def ip_address_write(key_ip_addresses):
+            '''
+            Write an IP address, creating it or updating it as necessary.
+            '''
+            key, key_ip_addresses = key_ip_addresses
+            data = self.ip_address_data(key_ip_addresses[0], key[0])
+            current_data = current.get(key)
+            if current_data is None:
+                data = dict(data, id=self.obj_create("addresses", data))
+                self.metrics.counter_add("{}.addresses.created".format(self.name))
+            else:
+                data = dict(data, id=int(current_data["id"]))
+                data_changed = self.data_diff(current_data, data)
+                if data_changed:
+                    self.obj_update("addresses", data["id"], data_changed)
+                    self.metrics.counter_add("{}.addresses.updated".format(self.name))
+                else:
+                    self.metrics.counter_add("{}.addresses.unchanged".format(self.name))
+            progress.update(len(key_ip_addresses))
+            return (key_ip_addresses, data)
+
+        for key_ip_addresses, data in self.concurrent_map(ip_address_write, writes.items()):
+            new_ip_address = self.ip_address_get(data)
+            self.trace.record(self.name, "wrote", new_ip_address)
+            ip_addresses_new[new_ip_address.id_get()] = new_ip_address
+            for ip_address in key_ip_addresses:
+                ip_addresses_old_to_new[ip_address.id_get()] = new_ip_address.id_get()
+
+        progress.finish()
+
+        self.logger.info("Wrote {} IP addresses.".format(len(ip_addresses_old_to_new)))
+
+        return (ip_addresses_new, ip_addresses_old_to_new)
+
+
+    def ip_addresses_data_read(self, subnet_ids):
+        '''
+        Read the IP addresses in the given subnets from the API backend, as
+        a dictionary of (subnet ID, address) to data dictionary. Subnets known
+        to be empty are not read.
+        '''
+
+        subnet_ids = frozenset((i for i in subnet_ids if i not in self.prefixes_empty))
+
+        if not subnet_ids:
+            return {}
+
+        datas = None
+
+        if self.ip_addresses_read_strategy(subnet_ids) == "all":
+            try:
+                datas = self.api_read("addresses", "all")
+                self.capabilities_set(("addresses", "all"), frozenset(("GET",)))
+            except APIReadError as err:
+                if err.api_message == "No addresses found":
+                    datas = []
+                else:
+                    self.capabilities_set(("addresses", "all"), frozenset())
+
+        if datas is None:
+            def subnet_addresses_read(subnet_id):
+                '''
+                Read the IP addresses in a subnet.
+                '''
+                try:
+                    return self.api_read("subnets", subnet_id, "addresses")
+                except APIReadError as err:
+                    if err.api_message != "No addresses found":
+                        raise
+                    return []
+
+            datas = [
+                data
+                for subnet_datas in self.concurrent_map(subnet_addresses_read, sorted(subnet_ids))
+                for data in subnet_datas
+            ]
+
+        return {
+            (int(data["subnetId"]), str(ip_address_parse(data["ip"]))): data
+            for data in datas
+            if int(data["subnetId"]) in subnet_ids
+        }
+
+
+    def prefixes_write(self,
+                       prefix_tree,
+                       section_id,
+                       vlans_old_to_new,
+                       vrfs_old_to_new):
+        '''
+        Write the prefixes in the given prefix tree to the given section of
+        the API backend as subnets, nested using their master subnet IDs,
+        and using previously written VRFs and VLANs to preserve reference
+        information.
+
+        Each level of the tree is written in turn, so that parent subnets
+        exist before their children, with concurrent requests within a level.
+        '''
+
+        self.logger.info("Writing prefixes...")
+
+        prefixes = prefix_tree.prefixes
+
+        prefixes_new = dict()
+        prefixes_old_to_new = dict()
+
+        progress = self.progress.phase(self.name, "prefixes_write", total=len(prefixes))
+
+        current = {}
+        self.prefixes_empty = set()
+        try:
+            for data in self.api_read("sections", section_id, "subnets"):
+                if not data["subnet"] or not data["mask"]:
+                    continue
+                prefix = self.prefix_get(data)
+                current[(prefix.vrf_id if prefix.vrf_id else None, prefix.prefix)] = data
+                if self.prefix_empty_get(data):
+                    self.prefixes_empty.add(int(data["id"]))
+        except APIReadError as err:
+            if err.api_message != "No subnets found":
+                raise
+
+        def prefix_write(prefix_id):
+            '''
+            Write a prefix, creating it or updating it as necessary.
+            '''
+            prefix = prefixes[prefix_id]
+            parent_id = prefix_tree.parents[prefix_id]
+            data = self.prefix_data(
+                prefix,
+                section_id,
+                prefixes_old_to_new[parent_id] if parent_id is not None else 0,
+                vlans_old_to_new,
+                vrfs_old_to_new,
+            )
+            current_data = current.get((data["vrfId"], prefix.prefix))
+
+            if current_data is None:
+                data = dict(data, id=self.obj_create("subnets", data))
+                # New subnets are known to be empty, so their addresses are not read.
+                self.prefixes_empty.add(data["id"])
+                self.metrics.counter_add("{}.subnets.created".format(self.name))
+            else:
+                data = dict(data, id=int(current_data["id"]))
+                data_changed = self.data_diff(current_data, data)
+                if data_changed:
+                    self.obj_update("subnets", data["id"], data_changed)
+                    self.metrics.counter_add("{}.subnets.updated".format(self.name))
+                else:
+                    self.metrics.counter_add("{}.subnets.unchanged".format(self.name))
+
+            progress.update()
+            return (prefix_id, data)
+
+        for level in prefix_tree.levels:
+            for prefix_id, data in self.concurrent_map(prefix_write, level):
+                new_prefix = self.prefix_get(data)
+                self.trace.record(self.name, "wrote", new_prefix)
+                prefixes_new[new_prefix.id_get()] = new_prefix
+                prefixes_old_to_new[prefix_id] = new_prefix.id_get()
+
+        for prefix_id, other_id in prefix_tree.duplicates.items():
+            prefixes_old_to_new[prefix_id] = prefixes_old_to_new[other_id]
+            progress.update()
+
+        progress.finish()
+
+        self.logger.info("Wrote {} prefixes.".format(len(prefixes_new)))
+
+        return (prefixes_new, prefixes_old_to_new)
+
+
+    def vlans_write(self, vlans):
+        '''
+        Write a dictionary of VLAN objects to the API backend, matching
+        them to the VLANs currently on phpIPAM by VLAN ID.
+        '''
+
+        self.logger.info("Writing VLANs...")
+
+        current = {vlan.vid: vlan for vlan in self.vlans_read().values()}
+
+        vlans_new, vlans_old_to_new = self.objs_write(
+            "vlans", vlans, current,
+            lambda v: v.vid,
+            self.vlan_data,
+            self.vlan_get,
+        )
+
+        self.logger.info("Wrote {} VLANs.".format(len(vlans_new)))
+
+        return (vlans_new, vlans_old_to_new)
+
+
+    def vrfs_write(self, vrfs):
+        '''
+        Write a dictionary of VRF objects to the API backend, matching them
+        to the VRFs currently on phpIPAM by route distinguisher (or name,
+        for VRFs without one).
+        '''
+
+        self.logger.info("Writing VRFs...")
+
+        current = {self.vrf_key_get(vrf): vrf for vrf in self.vrfs_read().values()}
+
+        vrfs_new, vrfs_old_to_new = self.objs_write(
+            "vrfs", vrfs, current,
+            self.vrf_key_get,
+            self.vrf_data,
+            lambda data: self.vrf_get(dict(data, vrfId=data["id"])),
+        )
+
+        self.logger.info("Wrote {} VRFs.".format(len(vrfs_new)))
+
+        return (vrfs_new, vrfs_old_to_new)
+
+
+    # pylint: disable=too-many-arguments
+    def objs_write(self, controller, objs, current, key_func, data_func, obj_get_func):
+        '''
+        Write a dictionary of objects using the given controller, creating
+        them or updating the current objects with the same key, and return
+        the new objects and the mapping of old to new object IDs. Objects
+        with the same key as an earlier object are written as the same object.
         '''
 
-        raise NotImplementedError()
+        objs_new = dict()
+        objs_old_to_new = dict()
+
+        progress = self.progress.phase(self.name, "{}_write".format(controller), total=len(objs))
+
+        writes = collections.OrderedDict()
+        for obj in sorted(objs.values()):
+            writes.setdefault(key_func(obj), []).append(obj)
+
+        def obj_write(key_objs):
+            '''
+            Write an object, creating it or updating it as necessary.
+            '''
+            key, key_objs = key_objs
+            data = data_func(key_objs[0])
+            current_obj = current.get(key)
+            if current_obj is None:
+                data = dict(data, id=self.obj_create(controller, data))
+                self.metrics.counter_add("{}.{}.created".format(self.name, controller))
+            else:
+                data = dict(data, id=current_obj.id_get())
+                data_changed = self.data_diff(data_func(current_obj), data)
+                if data_changed:
+                    self.obj_update(controller, data["id"], data_changed)
+                    self.metrics.counter_add("{}.{}.updated".format(self.name, controller))
+                else:
+                    self.metrics.counter_add("{}.{}.unchanged".format(self.name, controller))
+            progress.update(len(key_objs))
+            return (key_objs, data)
+
+        for key_objs, data in self.concurrent_map(obj_write, writes.items()):
+            new_obj = obj_get_func(data)
+            self.trace.record(self.name, "wrote", new_obj)
+            objs_new[new_obj.id_get()] = new_obj
+            for obj in key_objs:
+                objs_old_to_new[obj.id_get()] = new_obj.id_get()
+
+        progress.finish()
+
+        return (objs_new, objs_old_to_new)
 
 
-    def ip_addresses_write(self):
+    @staticmethod
+    def data_value_normalise(value):
         '''
-        Write a dictionary of IPAddress objects to the API backend.
+        Normalise a field value from either a phpIPAM object or an object
+        write payload, so that the two can be compared.
         '''
 
-        raise NotImplementedError()
+        # phpIPAM returns every field as a string, and uses
+        # 0 or an empty string for unset fields.
+        if value is None or value == "" or value == 0 or value == "0":
+            return None
+        return str(value)
 
 
-    def prefixes_write(self):
+    @staticmethod
+    def data_diff(current_data, data):
         '''
-        Write a dictionary of Prefix objects to the API backend.
+        Return the fields in the given write payload which differ from the
+        given current object data. An empty dictionary means the object
+        is already up to date.
         '''
 
-        raise NotImplementedError()
+        return {
+            key: value
+            for key, value in data.items()
+            if key != "id" and
+            PhpIPAM.data_value_normalise(value) !=
+            PhpIPAM.data_value_normalise(current_data.get(key))
+        }
+
 
+    #
+    ##
+    #
 
-    def vlans_write(self):
+
+    @staticmethod
+    def ip_address_data(ip_address, subnet_id):
         '''
-        Write a dictionary of VLAN objects to the API backend.
+        Get the write payload for the given IPAddress object,
+        in the subnet with the given ID.
         '''
 
-        raise NotImplementedError()
+        return ip_address.overrides_apply({
+            "ip": str(ip_address.address),
+            "subnetId": subnet_id,
+            "description": ip_address.description,
+        })
 
 
-    def vrfs_write(self):
+    @staticmethod
+    def prefix_data(prefix, section_id, master_subnet_id, vlans_old_to_new, vrfs_old_to_new):
         '''
-        Write a dictionary of VRF objects to the API backend.
+        Get the write payload for the given Prefix object, in the section
+        and master subnet with the given IDs, using the given mappings of
+        VLAN and VRF IDs to their IDs on phpIPAM.
         '''
 
-        raise NotImplementedError()
+        return prefix.overrides_apply({
+            "subnet": str(prefix.prefix.network_address),
+            "mask": prefix.prefix.prefixlen,
+            "sectionId": section_id,
+            "masterSubnetId": master_subnet_id,
+            "description": prefix.description,
+            "vlanId": vlans_old_to_new.get(prefix.vlan_id),
+            "vrfId": vrfs_old_to_new.get(prefix.vrf_id),
+        })
+
+
+    @staticmethod
+    def vlan_data(vlan):
+        '''
+        Get the write payload for the given VLAN object.
+        '''
+
+        # phpIPAM requires VLANs to have a name.
+        return vlan.overrides_apply({
+            "number": vlan.vid,
+            "name": vlan.name if vlan.name else str(vlan.vid),
+            "description": vlan.description,
+        })
+
+
+    @staticmethod
+    def vrf_data(vrf):
+        '''
+        Get the write payload for the given VRF object.
+        '''
+
+        # phpIPAM requires VRFs to have a name.
+        return vrf.overrides_apply({
+            "name": vrf.name if vrf.name else vrf.route_distinguisher,
+            "rd": vrf.route_distinguisher,
+            "description": vrf.description,
+        })
+
+
+    @staticmethod
+    def vrf_key_get(vrf):
+        '''
+        Get the key matching the given VRF object to VRFs on phpIPAM:
+        its route distinguisher, or its name if it does not have one.
+        '''
+
+        if vrf.route_distinguisher:
+            return vrf.route_distinguisher
+        return ("name", vrf.name)
 
 
     #
@@ -588,6 +1805,32 @@ class PhpIPAM(BaseBackend):
         )
 
 
+    @staticmethod
+    def prefix_empty_get(data):
+        '''
+        Check whether the prefix in the given data dictionary is known to
+        contain no IP addresses, using its folder flag and usage statistics.
+        '''
+
+        # Folders only contain other subnets.
+        if str(data.get("isFolder", "0")) == "1":
+            return True
+
+        # Subnets marked as full are in use, regardless of their statistics.
+        if str(data.get("isFull", "0")) == "1":
+            return False
+
+        # Usage statistics are returned with the subnet by some phpIPAM versions.
+        usage = data.get("usage")
+        if isinstance(usage, dict) and "used" in usage:
+            try:
+                return int(usage["used"]) == 0
+            except (TypeError, ValueError):
+                return False
+
+        return False
+
+
     @staticmethod
     def ip_address_get(data):
         '''
@@ -622,4 +1865,12 @@ class PhpIPAM(BaseBackend):
         Get a VRF object from the given data dictionary.
         '''
 
-        raise NotImplementedError()
+        return VRF(
+            data["vrfId"], # vrf_id
+            data["rd"], # route_distinguisher
+            name=data["name"],
+            description=data["description"],
+            # Unused:
+            # sections - Sections the VRF is available in
+            # editDate - Date and time of last update
+        )
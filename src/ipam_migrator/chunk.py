@@ -0,0 +1,205 @@
+#
+# IPAM database migration script
+# ipam_migrator/chunk.py - chunked bulk writes
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Chunked bulk writes.
+'''
+
+
+import concurrent.futures
+import time
+
+from ipam_migrator import codec
+
+
+class Chunk(object):
+    '''
+    Chunk of objects to write in bulk requests, as a list of
+    (encoded payload, context) items. Contexts are tuples starting with
+    the action to write the object with (e.g. "create"). Items with no
+    payload are objects which do not need to be written.
+    '''
+
+
+    def __init__(self):
+        '''
+        Chunk object constructor.
+        '''
+
+        self.items = []
+
+        # Number of items with a payload, and the size of their payloads.
+        self.writes = 0
+        self.bytes = 0
+
+
+    def __len__(self):
+        '''
+        Get the number of items in the chunk.
+        '''
+
+        return len(self.items)
+
+
+    def add(self, encoded, context):
+        '''
+        Add an item to the chunk.
+        '''
+
+        self.items.append((encoded, context))
+        if encoded is not None:
+            self.writes += 1
+            self.bytes += len(encoded)
+
+
+    def body(self, action):
+        '''
+        Get the encoded JSON list of the payloads of the items to write with
+        the given action, and the indexes of those items, or None if there
+        are none.
+        '''
+
+        indexes = [
+            i for i, (encoded, context) in enumerate(self.items)
+            if encoded is not None and context[0] == action
+        ]
+        if not indexes:
+            return None
+
+        return (codec.join((self.items[i][0] for i in indexes)), indexes)
+
+
+class Chunker(object):
+    '''
+    Splits a stream of (payload, context) items into chunks for bulk write
+    requests, bounded by the number of objects and the encoded size of their
+    payloads.
+
+    Items are read from the stream, and their payloads encoded, lazily in a
+    background thread, one chunk ahead of the chunk being written, so only
+    two chunks of payloads are in memory at any time, and the next chunk is
+    ready as soon as the current one has been written.
+
+    The number of objects per chunk adapts to the time taken to write each
+    chunk, increasing additively while chunks are written within the target
+    latency, and halving when they are not, up to the configured size.
+    '''
+
+
+    # Default maximum number of objects per chunk.
+    SIZE = 1000
+
+    # Default maximum encoded size of the payloads in a chunk, in bytes.
+    # This is the default maximum request body size of nginx,
+    # commonly used in front of NetBox.
+    BYTES = 1024 * 1024
+
+    # Default time to write a chunk in, in seconds.
+    LATENCY_TARGET = 10.0
+
+
+    def __init__(self, size=None, size_bytes=None, latency_target=None):
+        '''
+        Chunker object constructor. A size_bytes of 0 means the size of
+        chunks in bytes is unbounded.
+        '''
+
+        self.size_max = size if size else self.SIZE
+        self.bytes_max = size_bytes if size_bytes is not None else self.BYTES
+        self.latency_target = latency_target if latency_target else self.LATENCY_TARGET
+
+        # Current maximum number of objects per chunk, and the number
+        # of objects to increase it by after a chunk written in time.
+        self.size = self.size_max
+        self.size_step = max(1, self.size_max // 10)
+
+
+    def chunks(self, items):
+        '''
+        Generate the chunks of the given iterable of (payload, context) items.
+
+        The time taken by the caller to process each chunk (i.e. to write it)
+        is used to adapt the size of the chunks. As the next chunk is built
+        while the current one is being written, size changes take effect
+        from the chunk after next.
+
+        The items are read in the background thread, at the same time as
+        chunks are written, so they must not make API requests themselves.
+        '''
+
+        items = iter(items)
+        # Item read past the end of the previous chunk, if any.
+        carry = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(self.chunk_build, items, carry)
+
+            while True:
+                chunk = future.result()
+                if not chunk:
+                    return
+
+                future = executor.submit(self.chunk_build, items, carry)
+
+                start = time.monotonic()
+                yield chunk
+                if chunk.writes:
+                    self.latency_record(time.monotonic() - start)
+
+
+    def chunk_build(self, items, carry):
+        '''
+        Build the next chunk from the given iterator of items, starting with
+        the carried over item (if any), and carrying over the first item
+        which does not fit into the chunk.
+        '''
+
+        chunk = Chunk()
+
+        if carry:
+            chunk.add(*carry.pop())
+
+        while len(chunk) < self.size:
+            item = next(items, None)
+            if item is None:
+                break
+
+            payload, context = item
+            encoded = codec.dumps(payload) if payload is not None else None
+
+            if encoded is not None and chunk.writes and self.bytes_max and \
+               chunk.bytes + len(encoded) > self.bytes_max:
+                carry.append((encoded, context))
+                break
+
+            chunk.add(encoded, context)
+
+        return chunk
+
+
+    def latency_record(self, latency):
+        '''
+        Adapt the chunk size to the given time taken to write a chunk.
+        '''
+
+        if latency > self.latency_target:
+            self.size = max(1, self.size // 2)
+        else:
+            self.size = min(self.size_max, self.size + self.size_step)
@@ -0,0 +1,129 @@
+#
+# IPAM database migration script
+# ipam_migrator/codec.py - JSON codec for API requests and responses
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+JSON codec for API requests and responses.
+
+Uses the fastest JSON module available (orjson, then ujson, then the
+standard library json module), and ijson for decoding large responses
+incrementally, if it is installed.
+'''
+
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+if orjson is not None:
+    NAME = "orjson"
+elif ujson is not None:
+    NAME = "ujson"
+else:
+    NAME = "json"
+
+# True if responses can be decoded incrementally.
+STREAMING = ijson is not None
+
+# Content type of encoded request bodies.
+CONTENT_TYPE = "application/json"
+
+
+def loads(data):
+    '''
+    Decode the given JSON document (bytes or str).
+    '''
+
+    if orjson is not None:
+        return orjson.loads(data)
+    if ujson is not None:
+        return ujson.loads(data)
+    # The standard library only decodes bytes from Python 3.6 onwards.
+    if isinstance(data, bytes):
+        data = data.decode("UTF-8")
+    return json.loads(data)
+
+
+def dumps(obj):
+    '''
+    Encode the given object as a JSON document, returned as bytes.
+    '''
+
+    if orjson is not None:
+        return orjson.dumps(obj)
+    if ujson is not None:
+        return ujson.dumps(obj, ensure_ascii=False).encode("UTF-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("UTF-8")
+
+
+def join(documents):
+    '''
+    Join the given encoded JSON documents (bytes) into
+    an encoded JSON list, without decoding them.
+    '''
+
+    return b"[" + b",".join(documents) + b"]"
+
+
+def list_stream(fileobj, key):
+    '''
+    Incrementally decode a JSON object containing a list of objects under
+    the given key from the given file object, without reading the whole
+    document into memory.
+
+    Yields ("item", obj) for each object in the list, and (name, value)
+    for each other scalar value at the top level of the document,
+    in document order. Requires ijson.
+    '''
+
+    if ijson is None:
+        raise RuntimeError("incremental JSON decoding requires the ijson Python module")
+
+    item_prefix = "{}.item".format(key)
+    builder = None
+
+    for prefix, event, value in ijson.parse(fileobj):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == item_prefix and event in ("end_map", "end_array"):
+                yield ("item", builder.value)
+                builder = None
+        elif prefix == item_prefix:
+            if event in ("start_map", "start_array"):
+                builder = ijson.common.ObjectBuilder()
+                builder.event(event, value)
+            else:
+                yield ("item", value)
+        elif "." not in prefix and prefix and \
+             event in ("null", "boolean", "integer", "double", "number", "string"):
+            yield (prefix, value)
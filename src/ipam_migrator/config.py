@@ -0,0 +1,264 @@
+#
+# IPAM database migration script
+# ipam_migrator/config.py - configuration files
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Configuration files.
+'''
+
+
+import collections
+import configparser
+import re
+
+from ipam_migrator.exception import ConfigError
+
+from ipam_migrator.filter import Filter
+
+
+class Config(object):
+    '''
+    Configuration file in INI format, describing the input and output
+    databases in the [input] and [output] sections, with their tuning
+    parameters, and the pipeline options in the [pipeline] section:
+
+        [input]
+        endpoint = https://phpipam.example.com/api/app
+        type = phpipam
+        auth_method = login
+        user = admin
+        password = secret
+        rate_limit = 20
+
+        [output]
+        endpoint = https://netbox.example.com/api
+        type = netbox
+        auth_method = token
+        token = 0123456789abcdef
+        write_chunk_size = 500
+
+        [pipeline]
+        validate = yes
+
+    Pipeline options have the same names as the long command line options,
+    with underscores instead of dashes. List values are separated by commas
+    or new lines, except for extra fields, which are separated by spaces.
+    '''
+
+
+    # Options of the input and output sections, and their types.
+    BACKEND_OPTIONS = collections.OrderedDict((
+        ("endpoint", "str"),
+        ("type", "str"),
+        ("auth_method", "str"),
+        ("key", "str"),
+        ("token", "str"),
+        ("user", "str"),
+        ("password", "str"),
+        ("ssl_verify", "bool"),
+        ("api_retries", "int"),
+        ("pool_size", "int"),
+        ("rate_limit", "float"),
+        ("concurrency", "int"),
+        ("write_chunk_size", "int"),
+        ("write_chunk_bytes", "int"),
+        ("http_cache", "str"),
+        ("capabilities_cache", "str"),
+        ("transform", "str"),
+        ("extra_fields", "words"),
+    ))
+
+    # Options of the pipeline section, and their types.
+    PIPELINE_OPTIONS = collections.OrderedDict((
+        ("log", "str"),
+        ("log_level", "str"),
+        ("no_ip_addresses", "bool"),
+        ("no_prefixes", "bool"),
+        ("no_vlans", "bool"),
+        ("no_vrfs", "bool"),
+        ("filter_section", "list"),
+        ("filter_vrf", "list"),
+        ("filter_cidr", "list"),
+        ("filter_vlan_range", "vlan_ranges"),
+        ("validate", "bool"),
+        ("validate_report", "str"),
+        ("plan", "str"),
+        ("plan_objects", "bool"),
+        ("plan_execute", "str"),
+        ("verify", "bool"),
+        ("verify_report", "str"),
+        ("replicate", "bool"),
+        ("id_map", "str"),
+        ("debug_sample", "int"),
+        ("audit_log", "str"),
+        ("metrics", "str"),
+        ("metrics_port", "int"),
+        ("progress_interval", "float"),
+    ))
+
+    # Option types holding lists of values.
+    LIST_TYPES = ("list", "words", "vlan_ranges")
+
+    # Backend options holding the authentication data for each
+    # authentication method, in order.
+    AUTH_OPTIONS = {
+        "key": ("key",),
+        "token": ("token",),
+        "login": ("user", "password"),
+    }
+
+
+    def __init__(self, backends=None, pipeline=None):
+        '''
+        Configuration object constructor.
+        '''
+
+        # Target name ("input" or "output") -> backend options.
+        self.backends = backends if backends is not None else {}
+        self.pipeline = pipeline if pipeline is not None else {}
+
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Read a configuration from the given INI file.
+        '''
+
+        # Values are used as they are, as passwords may contain '%'.
+        parser = configparser.ConfigParser(interpolation=None)
+
+        try:
+            with open(path, "r", encoding="UTF-8") as config_file:
+                parser.read_file(config_file)
+        except (OSError, configparser.Error) as err:
+            raise ConfigError(
+                "unable to read configuration file '{}': {}".format(path, err),
+            ) from err
+
+        backends = {}
+        pipeline = {}
+
+        for section_name in parser.sections():
+            section = parser[section_name]
+            if section_name in ("input", "output"):
+                backends[section_name] = cls.section_read(path, section, cls.BACKEND_OPTIONS)
+                for option in ("endpoint", "type"):
+                    if option not in backends[section_name]:
+                        raise ConfigError(
+                            "missing option '{}' in section [{}] of '{}'".format(
+                                option, section_name, path,
+                            ),
+                        )
+            elif section_name == "pipeline":
+                pipeline = cls.section_read(path, section, cls.PIPELINE_OPTIONS)
+            else:
+                raise ConfigError("unknown section [{}] in '{}'".format(section_name, path))
+
+        return cls(backends, pipeline)
+
+
+    @classmethod
+    def section_read(cls, path, section, options):
+        '''
+        Read the options in the given section of the given file,
+        as a dictionary of converted values.
+        '''
+
+        values = {}
+
+        for option in section:
+            if option not in options:
+                raise ConfigError(
+                    "unknown option '{}' in section [{}] of '{}'".format(
+                        option, section.name, path,
+                    ),
+                )
+            try:
+                values[option] = cls.value_get(section, option, options[option])
+            except ValueError as err:
+                raise ConfigError(
+                    "invalid value for option '{}' in section [{}] of '{}': {}".format(
+                        option, section.name, path, err,
+                    ),
+                ) from err
+
+        return values
+
+
+    @staticmethod
+    def value_get(section, option, value_type):
+        '''
+        Get the value of the given option in the given section,
+        converted to the given type.
+        '''
+
+        if value_type == "bool":
+            return section.getboolean(option)
+        if value_type == "int":
+            return section.getint(option)
+        if value_type == "float":
+            return section.getfloat(option)
+
+        value = section[option]
+
+        if value_type == "list":
+            return [v.strip() for v in re.split(r"[,\n]", value) if v.strip()]
+        if value_type == "words":
+            return value.split()
+        if value_type == "vlan_ranges":
+            return [
+                Filter.vlan_range_parse(v.strip())
+                for v in re.split(r"[,\n]", value) if v.strip()
+            ]
+
+        return value
+
+
+    def backend_get(self, name):
+        '''
+        Get the options of the backend with the given target name
+        ("input" or "output"), or None if it is not configured.
+        '''
+
+        return self.backends.get(name)
+
+
+    def api_data_get(self, name):
+        '''
+        Get the API data of the backend with the given target name, as a
+        tuple of (endpoint, type, authentication method, authentication
+        data, SSL verify), in the same format as api_data_read.
+        '''
+
+        options = self.backends[name]
+
+        api_auth_method = options.get("auth_method", "none")
+        api_auth_data = [
+            options[option]
+            for option in self.AUTH_OPTIONS.get(api_auth_method, ())
+            if option in options
+        ]
+
+        return (
+            options["endpoint"],
+            options["type"],
+            api_auth_method,
+            api_auth_data,
+            options.get("ssl_verify", True),
+        )
@@ -24,16 +24,42 @@ Database object type.
 
 
 import copy
+import functools
+import hashlib
+import ipaddress
 import json
 
 
+@functools.lru_cache(maxsize=4096)
+def supernet_format(version, bits):
+    '''
+    Format the rollup supernet for the given IP version, from its network
+    bits (an address as an integer, shifted right past the host bits).
+    '''
+
+    prefixlen = Database.ROLLUP_PREFIXLEN[version]
+    if version == 4:
+        address = ipaddress.IPv4Address(bits << (ipaddress.IPV4LENGTH - prefixlen))
+    else:
+        address = ipaddress.IPv6Address(bits << (ipaddress.IPV6LENGTH - prefixlen))
+    return "{}/{}".format(address, prefixlen)
+
+
 class Database(object):
     '''
     Database object type.
     '''
 
 
-    # pylint: disable=too-few-public-methods
+    # Object types which can be fingerprinted and rolled up.
+    OBJ_TYPES = ("vrfs", "vlans", "prefixes", "ip_addresses")
+
+    # Prefix length of the networks prefixes and IP addresses
+    # are grouped by in rollups, for each IP version.
+    ROLLUP_PREFIXLEN = {4: 16, 6: 48}
+
+    # Number of VLAN IDs grouped together in rollups.
+    ROLLUP_VIDS = 256
 
 
     # pylint: disable=too-many-arguments
@@ -42,9 +68,14 @@ class Database(object):
                  ip_addresses=None,
                  prefixes=None,
                  vlans=None,
-                 vrfs=None):
+                 vrfs=None,
+                 extras=None):
         '''
         Database object constructor.
+
+        extras is a dictionary of object type to ExtraTable, holding extra
+        attributes of the objects read from the input records. The tables
+        are not copied.
         '''
 
         self.name = name
@@ -54,6 +85,8 @@ class Database(object):
         self.vlans = copy.deepcopy(vlans) if vlans is not None else dict()
         self.vrfs = copy.deepcopy(vrfs) if vrfs is not None else dict()
 
+        self.extras = extras if extras is not None else dict()
+
 
     def __str__(self):
         '''
@@ -61,12 +94,189 @@ class Database(object):
         suitable for dumping to output.
         '''
 
-        return json.dumps(
-            {
-                "name": self.name,
-                "ip_addresses": [ip.as_dict() for ip in self.ip_addresses.values()],
-                "prefixes": [prefix.as_dict() for prefix in self.prefixes.values()],
-                "vlans": [vlans.as_dict() for vlans in self.vlans.values()],
-                "vrfs": [vrf.as_dict() for vrf in self.vrfs.values()],
-            },
-        )
+        data = {
+            "name": self.name,
+            "ip_addresses": [ip.as_dict() for ip in self.ip_addresses.values()],
+            "prefixes": [prefix.as_dict() for prefix in self.prefixes.values()],
+            "vlans": [vlans.as_dict() for vlans in self.vlans.values()],
+            "vrfs": [vrf.as_dict() for vrf in self.vrfs.values()],
+        }
+
+        if self.extras:
+            data["extras"] = {
+                obj_type: table.as_dict() for obj_type, table in self.extras.items()
+            }
+
+        return json.dumps(data)
+
+
+    def extra_get(self, obj_type, obj_id, field, default=None):
+        '''
+        Get the extra attribute with the given field name of the object of the
+        given type and ID, or the default if it is not set or was not read.
+        '''
+
+        table = self.extras.get(obj_type)
+        if table is None:
+            return default
+        return table.get(obj_id, field, default=default)
+
+
+    #
+    ##
+    #
+
+
+    def vrf_key_get(self, vrf_id):
+        '''
+        Get the key (route distinguisher or name) of the VRF with the given ID,
+        which identifies the VRF across systems.
+        '''
+
+        if not vrf_id:
+            return None
+        vrf = self.vrfs.get(vrf_id)
+        if vrf is None:
+            return "<unknown VRF {}>".format(vrf_id)
+        return vrf.route_distinguisher if vrf.route_distinguisher else vrf.name
+
+
+    def vlan_key_get(self, vlan_id):
+        '''
+        Get the key (VLAN ID) of the VLAN with the given ID,
+        which identifies the VLAN across systems.
+        '''
+
+        if not vlan_id:
+            return None
+        vlan = self.vlans.get(vlan_id)
+        if vlan is None:
+            return "<unknown VLAN {}>".format(vlan_id)
+        return vlan.vid
+
+
+    def obj_key_get(self, obj_type, obj):
+        '''
+        Get the key identifying the given object of the given type across
+        systems, as a tuple of strings: (VRF, prefix) for prefixes,
+        (VRF, address) for IP addresses, the VLAN ID for VLANs and the
+        route distinguisher (or name) for VRFs.
+        '''
+
+        if obj_type == "ip_addresses":
+            return (self.vrf_key_get(obj.vrf_id) or "", str(obj.address))
+        if obj_type == "prefixes":
+            return (self.vrf_key_get(obj.vrf_id) or "", str(obj.prefix))
+        if obj_type == "vlans":
+            return (str(obj.vid),)
+        if obj.route_distinguisher:
+            return (obj.route_distinguisher,)
+        return ("", obj.name or "")
+
+
+    def obj_digest_get(self, obj):
+        '''
+        Get the digest of the given object's fingerprint and the keys of the
+        objects it references, which is the same for equivalent objects
+        on different systems.
+        '''
+
+        refs = []
+        if hasattr(obj, "vrf_id"):
+            refs.append(self.vrf_key_get(obj.vrf_id))
+        if hasattr(obj, "vlan_id"):
+            refs.append(self.vlan_key_get(obj.vlan_id))
+
+        if not refs:
+            return obj.fingerprint()
+
+        return hashlib.sha1(
+            obj.fingerprint() + "\0".join((str(r) for r in refs)).encode("UTF-8"),
+        ).digest()
+
+
+    def bucket_get(self, obj_type, obj):
+        '''
+        Get the rollup bucket of the given object: its VRF and the network
+        it is in for prefixes and IP addresses, and its VLAN ID range for VLANs.
+        All VRFs are in a single bucket.
+        '''
+
+        if obj_type in ("ip_addresses", "prefixes"):
+            network = obj.address if obj_type == "ip_addresses" else obj.prefix.network_address
+            host_bits = network.max_prefixlen - self.ROLLUP_PREFIXLEN[network.version]
+            return "{} {}".format(
+                self.vrf_key_get(obj.vrf_id) or "global",
+                supernet_format(network.version, int(network) >> host_bits),
+            )
+
+        if obj_type == "vlans":
+            low = obj.vid - (obj.vid % self.ROLLUP_VIDS)
+            return "vids {}-{}".format(low, low + self.ROLLUP_VIDS - 1)
+
+        return "all"
+
+
+    def digests_get(self, obj_type):
+        '''
+        Get the digests of the objects of the given type, grouped by rollup
+        bucket, as a dictionary of bucket to sorted list of (key, digest, ID)
+        tuples. Objects with the same key as an earlier object are left out,
+        as they cannot be told apart from it.
+        '''
+
+        buckets = {}
+        keys = set()
+
+        for obj in sorted(getattr(self, obj_type).values()):
+            key = self.obj_key_get(obj_type, obj)
+            if key in keys:
+                continue
+            keys.add(key)
+            buckets.setdefault(self.bucket_get(obj_type, obj), []).append(
+                (key, self.obj_digest_get(obj), obj.id_get()),
+            )
+
+        for digests in buckets.values():
+            digests.sort()
+
+        return buckets
+
+
+    def rollup(self, obj_type, digests=None):
+        '''
+        Get the Merkle-style rollup of the objects of the given type, as
+        a dictionary of bucket to (hex digest, object count). Two databases
+        with the same objects in a bucket have the same digest for it, so
+        they can be compared by their rollups, and only the buckets which
+        differ need to be compared object by object.
+
+        digests is the output of digests_get, if it is already known.
+        '''
+
+        if digests is None:
+            digests = self.digests_get(obj_type)
+
+        rollup = {}
+
+        for bucket, bucket_digests in digests.items():
+            digest = hashlib.sha1()
+            for key, obj_digest, _ in bucket_digests:
+                digest.update("\0".join(key).encode("UTF-8"))
+                digest.update(obj_digest)
+            rollup[bucket] = (digest.hexdigest(), len(bucket_digests))
+
+        return rollup
+
+
+    @staticmethod
+    def rollup_diff(rollup, other):
+        '''
+        Get the sorted list of buckets which differ between two rollups,
+        including buckets only in one of them.
+        '''
+
+        return sorted((
+            bucket for bucket in set(rollup) | set(other)
+            if rollup.get(bucket, (None,))[0] != other.get(bucket, (None,))[0]
+        ))
@@ -0,0 +1,169 @@
+#
+# IPAM database migration script
+# ipam_migrator/db/extra.py - columnar store for extra object attributes
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Columnar store for extra object attributes.
+'''
+
+
+import array
+
+
+class ExtraTable(object):
+    '''
+    Side table of extra attributes (fields of the raw input records which
+    are not part of the database objects) for objects of one type, keyed
+    by object ID.
+
+    Values are stored as strings, in columns of integer codes into a
+    dictionary of the distinct values of each field, so repeated values
+    (e.g. owners or tags) are stored once, and each object only costs a
+    few bytes per field. Code 0 means the field is unset.
+    '''
+
+
+    def __init__(self, fields):
+        '''
+        Extra attribute table object constructor.
+        '''
+
+        self.fields = tuple(fields)
+
+        # Object ID -> row number.
+        self.rows = {}
+
+        # Field -> column of value codes, one per row.
+        self.columns = {field: array.array("I") for field in self.fields}
+        # Field -> list of values, indexed by code.
+        self.values = {field: [None] for field in self.fields}
+        # Field -> {value: code}
+        self.codes = {field: {} for field in self.fields}
+
+
+    def __len__(self):
+        '''
+        Get the number of objects in the table.
+        '''
+
+        return len(self.rows)
+
+
+    def __contains__(self, obj_id):
+        '''
+        Check whether the object with the given ID is in the table.
+        '''
+
+        return obj_id in self.rows
+
+
+    def add(self, obj_id, data):
+        '''
+        Add the extra attributes of the object with the given ID from its
+        raw input record, replacing any already in the table.
+        '''
+
+        row = self.rows.get(obj_id)
+
+        for field in self.fields:
+            code = self.code_get(field, self.value_normalise(data.get(field)))
+            if row is None:
+                self.columns[field].append(code)
+            else:
+                self.columns[field][row] = code
+
+        if row is None:
+            self.rows[obj_id] = len(self.rows)
+
+
+    def code_get(self, field, value):
+        '''
+        Get the code of the given value of the given field,
+        adding it to the field's dictionary if necessary.
+        '''
+
+        if value is None:
+            return 0
+
+        codes = self.codes[field]
+        code = codes.get(value)
+        if code is None:
+            code = len(self.values[field])
+            codes[value] = code
+            self.values[field].append(value)
+        return code
+
+
+    def get(self, obj_id, field, default=None):
+        '''
+        Get the value of the given field for the object with the given ID.
+        Returns the default if the object is not in the table, or the field
+        is unset.
+        '''
+
+        row = self.rows.get(obj_id)
+        if row is None or field not in self.columns:
+            return default
+
+        value = self.values[field][self.columns[field][row]]
+        return value if value is not None else default
+
+
+    def row_get(self, obj_id):
+        '''
+        Get the extra attributes of the object with the given ID as a
+        dictionary, or None if it is not in the table.
+        '''
+
+        row = self.rows.get(obj_id)
+        if row is None:
+            return None
+
+        return {
+            field: self.values[field][self.columns[field][row]]
+            for field in self.fields
+        }
+
+
+    def as_dict(self):
+        '''
+        Dictionary representation of the table, keyed by object ID.
+        '''
+
+        return {obj_id: self.row_get(obj_id) for obj_id in self.rows}
+
+
+    @staticmethod
+    def value_normalise(value):
+        '''
+        Normalise a raw field value for storing in the table.
+        '''
+
+        # Unset fields are empty strings on some backends.
+        if value is None or value == "":
+            return None
+
+        # Nested objects (e.g. on NetBox) are stored by their value or ID.
+        if isinstance(value, dict):
+            if "value" in value:
+                value = value["value"]
+            elif "id" in value:
+                value = value["id"]
+
+        return str(value)
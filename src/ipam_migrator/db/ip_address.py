@@ -23,9 +23,8 @@ Internet Protocol (IP) addresses.
 '''
 
 
-import ipaddress
-
 from ipam_migrator.db.object import Object
+from ipam_migrator.db.parse import ip_address_parse
 
 
 class IPAddress(Object):
@@ -40,7 +39,8 @@ class IPAddress(Object):
                  address,
                  description=None,
                  custom_fields=None,
-                 vrf_id=None):
+                 vrf_id=None,
+                 prefix_length=None):
         '''
         VLAN object constructor.
         '''
@@ -49,9 +49,12 @@ class IPAddress(Object):
         super().__init__(address_id, None, description)
 
         # Internal fields.
-        self.address = ipaddress.ip_address(address)
-        self.family = 6 if isinstance(self.address, ipaddress.IPv6Address) else 4
+        self.address = ip_address_parse(address)
+        self.family = self.address.version
         self.custom_fields = custom_fields.copy() if custom_fields is not None else dict()
+        # Length of the prefix the address is configured with on an interface,
+        # if the backend it was read from stores one.
+        self.prefix_length = int(prefix_length) if prefix_length is not None else None
 
         # Grouping fields, in ascending order of scale.
         self.vrf_id = int(vrf_id) if vrf_id is not None else None
@@ -78,7 +81,23 @@ class IPAddress(Object):
 
             "address": str(self.address),
             "family": self.family,
+            "prefix_length": self.prefix_length,
             "custom_fields": self.custom_fields.copy(),
 
             "vrf_id": self.vrf_id,
+
+            "overrides": self.overrides,
+        }
+
+
+    def fingerprint_fields(self):
+        '''
+        Migratable fields of an IPAddress.
+        '''
+
+        return {
+            "description": self.description,
+            "address": str(self.address),
+            # Backends may return every custom field defined, set or not.
+            "custom_fields": {k: v for k, v in self.custom_fields.items() if v is not None},
         }
@@ -23,6 +23,12 @@ Database object base class.
 '''
 
 
+import hashlib
+import json
+
+from ipam_migrator.db.parse import string_intern
+
+
 class Object(object):
     '''
     Database object base class.
@@ -35,8 +41,16 @@ class Object(object):
         '''
 
         self.object_id = int(object_id)
-        self.name = name
-        self.description = description
+        # Names and descriptions are often repeated between objects,
+        # so share a single copy of each.
+        self.name = string_intern(name)
+        self.description = string_intern(description)
+
+        # Output fields set by a transform, merged into write payloads.
+        self.overrides = None
+
+        # Cached content fingerprint, computed on first use.
+        self.fingerprint_cache = None
 
 
     def id_get(self):
@@ -71,6 +85,69 @@ class Object(object):
         raise NotImplementedError()
 
 
+    def fingerprint_fields(self):
+        '''
+        Get the fields of this Object which are migrated between systems,
+        as a dictionary. Object IDs and references to other objects by ID
+        are left out, as they differ between systems.
+        '''
+
+        raise NotImplementedError()
+
+
+    def fingerprint(self):
+        '''
+        Get the content fingerprint of this Object, a SHA-1 digest of its
+        migratable fields. Objects with the same content have the same
+        fingerprint, regardless of the system they were read from.
+
+        The fingerprint is computed once and cached, so call
+        fingerprint_reset after changing the object.
+        '''
+
+        if self.fingerprint_cache is None:
+            fields = {
+                # Unset text fields are empty strings on some backends.
+                k: v if v != "" else None
+                for k, v in self.fingerprint_fields().items()
+            }
+            self.fingerprint_cache = hashlib.sha1(
+                json.dumps(
+                    fields,
+                    sort_keys=True,
+                    separators=(",", ":"),
+                    default=str,
+                ).encode("UTF-8"),
+            ).digest()
+
+        return self.fingerprint_cache
+
+
+    def overrides_apply(self, data):
+        '''
+        Merge the overrides of this Object into the given write payload,
+        returning the payload. Nested fields (e.g. custom fields) are merged
+        with the fields already in the payload.
+        '''
+
+        if self.overrides:
+            for key, value in self.overrides.items():
+                if isinstance(value, dict) and isinstance(data.get(key), dict):
+                    data[key] = dict(data[key], **value)
+                else:
+                    data[key] = value
+
+        return data
+
+
+    def fingerprint_reset(self):
+        '''
+        Discard the cached content fingerprint of this Object.
+        '''
+
+        self.fingerprint_cache = None
+
+
     def __hash__(self):
         '''
         Hash function for VLAN object, based around the VLAN ID.
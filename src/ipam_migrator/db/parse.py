@@ -0,0 +1,91 @@
+#
+# IPAM database migration script
+# ipam_migrator/db/parse.py - cached parsing of database object fields
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Cached parsing of database object fields.
+'''
+
+
+import functools
+import ipaddress
+import sys
+
+
+# Maximum number of parsed addresses and prefixes to cache.
+CACHE_SIZE = 65536
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def ip_address_str_parse(address):
+    '''
+    Parse an IP address string, using the IP version given by
+    its format instead of trying each version in turn.
+    '''
+
+    if ":" in address:
+        return ipaddress.IPv6Address(address)
+    return ipaddress.IPv4Address(address)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def ip_network_str_parse(prefix):
+    '''
+    Parse an IP prefix string, using the IP version given by
+    its format instead of trying each version in turn.
+    '''
+
+    if ":" in prefix:
+        return ipaddress.IPv6Network(prefix)
+    return ipaddress.IPv4Network(prefix)
+
+
+def ip_address_parse(address):
+    '''
+    Parse the given IP address (a string, an integer or an address object).
+    Equivalent to ipaddress.ip_address, with strings parsed once and cached.
+    '''
+
+    if isinstance(address, str):
+        return ip_address_str_parse(address)
+    if isinstance(address, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+        return address
+    return ipaddress.ip_address(address)
+
+
+def ip_network_parse(prefix):
+    '''
+    Parse the given IP prefix (a string, or a network object).
+    Equivalent to ipaddress.ip_network, with strings parsed once and cached.
+    '''
+
+    if isinstance(prefix, str):
+        return ip_network_str_parse(prefix)
+    if isinstance(prefix, (ipaddress.IPv4Network, ipaddress.IPv6Network)):
+        return prefix
+    return ipaddress.ip_network(prefix)
+
+
+def string_intern(value):
+    '''
+    Intern the given string, so that repeated values share the same object.
+    Values which are not strings (e.g. None) are returned unchanged.
+    '''
+
+    return sys.intern(value) if isinstance(value, str) else value
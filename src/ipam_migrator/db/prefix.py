@@ -23,9 +23,8 @@ Internet Protocol (IP) subnet prefixes.
 '''
 
 
-import ipaddress
-
 from ipam_migrator.db.object import Object
+from ipam_migrator.db.parse import ip_network_parse
 
 
 class Prefix(Object):
@@ -47,8 +46,8 @@ class Prefix(Object):
 
         super().__init__(prefix_id, None, description)
 
-        self.prefix = ipaddress.ip_network(prefix)
-        self.family = 6 if isinstance(self.prefix, ipaddress.IPv6Network) else 4
+        self.prefix = ip_network_parse(prefix)
+        self.family = self.prefix.version
 
         self.is_pool = bool(is_pool) if is_pool is not None else None
 
@@ -82,4 +81,18 @@ class Prefix(Object):
 
             "vlan_id": self.vlan_id,
             "vrf_id": self.vrf_id,
+
+            "overrides": self.overrides,
+        }
+
+
+    def fingerprint_fields(self):
+        '''
+        Migratable fields of a Prefix.
+        '''
+
+        return {
+            "description": self.description,
+            "prefix": str(self.prefix),
+            "is_pool": self.is_pool,
         }
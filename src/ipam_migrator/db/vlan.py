@@ -68,4 +68,18 @@ class VLAN(Object):
             "description": self.description,
 
             "vid": self.vid,
+
+            "overrides": self.overrides,
+        }
+
+
+    def fingerprint_fields(self):
+        '''
+        Migratable fields of a VLAN.
+        '''
+
+        return {
+            "name": self.name,
+            "description": self.description,
+            "vid": self.vid,
         }
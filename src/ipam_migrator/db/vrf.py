@@ -72,4 +72,19 @@ class VRF(Object):
 
             "route_distinguisher": self.route_distinguisher,
             "enforce_unique": self.enforce_unique,
+
+            "overrides": self.overrides,
+        }
+
+
+    def fingerprint_fields(self):
+        '''
+        Migratable fields of a VRF.
+        '''
+
+        return {
+            "name": self.name,
+            "description": self.description,
+            "route_distinguisher": self.route_distinguisher,
+            "enforce_unique": self.enforce_unique,
         }
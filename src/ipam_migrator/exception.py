@@ -135,3 +135,64 @@ class APIWriteError(IpamMigratorError):
         self.api_code = code
         self.api_message = message
         super().__init__("ERROR {}: {}".format(self.api_code, self.api_message))
+
+
+class ValidationError(IpamMigratorError):
+    '''
+    Exception for a database failing validation.
+    '''
+
+    def __init__(self, name, errors, warnings):
+        '''
+        ValidationError initialisation method.
+        '''
+
+        self.errors = errors
+        self.warnings = warnings
+        super().__init__(
+            "{} database failed validation with {} errors and {} warnings".format(
+                name,
+                errors,
+                warnings,
+            ),
+        )
+
+
+class PlanError(IpamMigratorError):
+    '''
+    Exception for a write plan which cannot be loaded or executed.
+    '''
+
+    pass
+
+
+class IDMapError(IpamMigratorError):
+    '''
+    Exception for a replication ID map which cannot be loaded.
+    '''
+
+    pass
+
+
+class TransformError(IpamMigratorError):
+    '''
+    Exception for an invalid transform configuration.
+    '''
+
+    pass
+
+
+class ConfigError(IpamMigratorError):
+    '''
+    Exception for an invalid configuration file.
+    '''
+
+    pass
+
+
+class AuditLogError(IpamMigratorError):
+    '''
+    Exception for an audit log which could not be written.
+    '''
+
+    pass
@@ -0,0 +1,218 @@
+#
+# IPAM database migration script
+# ipam_migrator/filter.py - partial migration filters
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Partial migration filters.
+'''
+
+
+import ipaddress
+
+
+class Filter(object):
+    '''
+    Partial migration filter, restricting the objects read from a backend
+    to the given sections, VRFs, CIDR ranges and VLAN ID ranges.
+
+    Backends push as much of the filter as they can down into their queries,
+    and use the match methods to check the objects they read.
+    An empty filter matches everything.
+    '''
+
+
+    def __init__(self,
+                 sections=None,
+                 vrfs=None,
+                 cidrs=None,
+                 vlan_ranges=None):
+        '''
+        Filter object constructor.
+
+        sections is a list of section IDs (only used by phpIPAM backends),
+        vrfs a list of VRF IDs, names or route distinguishers, cidrs
+        a list of prefixes in CIDR notation, and vlan_ranges a list of
+        (lowest VLAN ID, highest VLAN ID) tuples.
+        '''
+
+        self.sections = frozenset((str(s) for s in sections)) if sections else None
+        self.vrfs = frozenset((str(v) for v in vrfs)) if vrfs else None
+        self.cidrs = tuple((ipaddress.ip_network(c) for c in cidrs)) if cidrs else None
+        self.vlan_ranges = tuple(((int(l), int(h)) for l, h in vlan_ranges)) \
+                           if vlan_ranges else None
+
+        # IDs of the VRFs matching the VRF filter, set by vrfs_resolve.
+        self.vrf_ids = None
+
+
+    def __bool__(self):
+        '''
+        Return True if the filter restricts any objects.
+        '''
+
+        return bool(self.sections or self.vrfs or self.cidrs or self.vlan_ranges)
+
+
+    def __str__(self):
+        '''
+        String representation of the filter.
+        '''
+
+        parts = []
+        if self.sections:
+            parts.append("sections {}".format(", ".join(sorted(self.sections))))
+        if self.vrfs:
+            parts.append("VRFs {}".format(", ".join(sorted(self.vrfs))))
+        if self.cidrs:
+            parts.append("CIDRs {}".format(", ".join((str(c) for c in self.cidrs))))
+        if self.vlan_ranges:
+            parts.append("VLAN IDs {}".format(
+                ", ".join(("{}-{}".format(l, h) for l, h in self.vlan_ranges)),
+            ))
+        return "; ".join(parts) if parts else "no filter"
+
+
+    #
+    ##
+    #
+
+
+    def vrfs_resolve(self, vrfs):
+        '''
+        Resolve the VRF filter to the IDs of the matching VRFs
+        in the given dictionary of VRF objects.
+        '''
+
+        if not self.vrfs:
+            self.vrf_ids = None
+            return
+
+        self.vrf_ids = frozenset((vrf.id_get() for vrf in vrfs.values() if self.vrf_match(vrf)))
+
+
+    def section_match(self, section_id):
+        '''
+        Check whether the given section ID matches the filter.
+        '''
+
+        return not self.sections or str(section_id) in self.sections
+
+
+    def vrf_match(self, vrf):
+        '''
+        Check whether the given VRF matches the filter.
+        '''
+
+        return not self.vrfs or \
+               str(vrf.id_get()) in self.vrfs or \
+               vrf.name in self.vrfs or \
+               vrf.route_distinguisher in self.vrfs
+
+
+    def vrf_id_match(self, vrf_id):
+        '''
+        Check whether an object with the given VRF ID matches the filter.
+        Objects without a VRF only match if there is no VRF filter.
+        '''
+
+        if not self.vrfs:
+            return True
+        if self.vrf_ids is None:
+            raise RuntimeError("VRF filter used before resolving VRF IDs")
+        return bool(vrf_id) and vrf_id in self.vrf_ids
+
+
+    def cidr_match(self, network):
+        '''
+        Check whether the given IP address or network is inside
+        any of the CIDR ranges in the filter.
+        '''
+
+        if not self.cidrs:
+            return True
+
+        if isinstance(network, (ipaddress.IPv4Address, ipaddress.IPv6Address)):
+            return any((network in cidr for cidr in self.cidrs))
+
+        return any((
+            network.version == cidr.version and
+            network.network_address in cidr and
+            network.prefixlen >= cidr.prefixlen
+            for cidr in self.cidrs
+        ))
+
+
+    def vlan_vid_match(self, vid):
+        '''
+        Check whether the given VLAN ID matches the filter.
+        '''
+
+        return not self.vlan_ranges or any((l <= vid <= h for l, h in self.vlan_ranges))
+
+
+    #
+    ##
+    #
+
+
+    def prefix_match(self, prefix):
+        '''
+        Check whether the given Prefix matches the filter.
+        '''
+
+        return self.cidr_match(prefix.prefix) and self.vrf_id_match(prefix.vrf_id)
+
+
+    def ip_address_match(self, ip_address):
+        '''
+        Check whether the given IPAddress matches the filter.
+
+        IP addresses without a VRF are not checked against the VRF filter,
+        as some backends (e.g. phpIPAM) only assign VRFs to prefixes. These
+        backends filter IP addresses by the prefixes they are read from.
+        '''
+
+        if not self.cidr_match(ip_address.address):
+            return False
+        return not ip_address.vrf_id or self.vrf_id_match(ip_address.vrf_id)
+
+
+    def vlan_match(self, vlan):
+        '''
+        Check whether the given VLAN matches the filter.
+        '''
+
+        return self.vlan_vid_match(vlan.vid)
+
+
+    #
+    ##
+    #
+
+
+    @staticmethod
+    def vlan_range_parse(value):
+        '''
+        Parse a VLAN ID range in the format LOW[-HIGH].
+        '''
+
+        if "-" in value:
+            low, high = value.split("-", 1)
+            return (int(low), int(high))
+        return (int(value), int(value))
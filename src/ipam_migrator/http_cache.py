@@ -0,0 +1,190 @@
+#
+# IPAM database migration script
+# ipam_migrator/http_cache.py - on-disk HTTP response cache
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+On-disk HTTP response cache.
+'''
+
+
+import hashlib
+import json
+import os
+import stat
+import tempfile
+
+
+class HTTPCache(object):
+    '''
+    On-disk cache of HTTP GET responses, keyed by URL.
+
+    Only responses with an ETag or Last-Modified header are cached.
+    Cached responses are revalidated on every request using conditional
+    request headers, so an unchanged response comes back from the server
+    as an empty 304 (Not Modified), and its body is read from the cache.
+
+    Cached responses may contain sensitive data, so the cache files
+    are only readable by their owner.
+    '''
+
+
+    # Response headers describing the transfer rather than the response
+    # body, which are not stored with cached responses.
+    HEADERS_UNCACHED = frozenset((
+        "connection",
+        "content-encoding",
+        "content-length",
+        "keep-alive",
+        "set-cookie",
+        "transfer-encoding",
+    ))
+
+
+    def __init__(self, directory):
+        '''
+        HTTP cache object constructor.
+        '''
+
+        self.directory = directory
+        os.makedirs(self.directory, mode=stat.S_IRWXU, exist_ok=True)
+
+
+    def path_get(self, uri, suffix):
+        '''
+        Get the path of the given cache file for the given URL.
+        '''
+
+        key = hashlib.sha256(uri.encode("UTF-8")).hexdigest()
+        return os.path.join(self.directory, "{}.{}".format(key, suffix))
+
+
+    def validators_get(self, uri):
+        '''
+        Get the cached validators (ETag and Last-Modified header values)
+        for the given URL, or None if it is not cached.
+        '''
+
+        try:
+            with open(self.path_get(uri, "json"), "r", encoding="UTF-8") as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+        # Guard against hash collisions.
+        if meta.get("uri") != uri:
+            return None
+
+        return meta
+
+
+    def headers_get(self, uri):
+        '''
+        Get the conditional request headers for revalidating
+        the cached response for the given URL.
+        '''
+
+        meta = self.validators_get(uri)
+        if not meta:
+            return {}
+
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+
+    def response_get(self, uri):
+        '''
+        Get the cached response headers and body for the given URL,
+        or None if it is not cached.
+        '''
+
+        meta = self.validators_get(uri)
+        if not meta:
+            return None
+
+        try:
+            with open(self.path_get(uri, "body"), "rb") as body_file:
+                return (meta.get("headers", {}), body_file.read())
+        except OSError:
+            return None
+
+
+    def store(self, uri, headers, body):
+        '''
+        Store the given response headers and body for the given URL, if the
+        response headers contain validators to revalidate it with.
+        Returns True if the response was stored.
+        '''
+
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+
+        if not etag and not last_modified:
+            return False
+
+        # Remove the old validators before writing the body, so that
+        # a partially written entry is never revalidated.
+        try:
+            os.unlink(self.path_get(uri, "json"))
+        except FileNotFoundError:
+            pass
+        self.file_write(self.path_get(uri, "body"), body)
+        self.file_write(
+            self.path_get(uri, "json"),
+            json.dumps({
+                "uri": uri,
+                "etag": etag,
+                "last_modified": last_modified,
+                "headers": {
+                    k: v for k, v in headers.items() if k.lower() not in self.HEADERS_UNCACHED
+                },
+            }).encode("UTF-8"),
+        )
+
+        return True
+
+
+    def remove(self, uri):
+        '''
+        Remove the cached response for the given URL, if any.
+        '''
+
+        for suffix in ("json", "body"):
+            try:
+                os.unlink(self.path_get(uri, suffix))
+            except FileNotFoundError:
+                pass
+
+
+    def file_write(self, path, data):
+        '''
+        Atomically write the given data to the given cache file.
+        '''
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            os.unlink(temp_path)
+            raise
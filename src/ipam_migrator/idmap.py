@@ -0,0 +1,195 @@
+#
+# IPAM database migration script
+# ipam_migrator/idmap.py - persistent object ID maps for replication
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Persistent object ID maps for replication.
+'''
+
+
+import json
+import os
+import tempfile
+
+from ipam_migrator.exception import IDMapError
+
+
+class IDMap(object):
+    '''
+    Map of source object IDs to target object IDs for each object type,
+    with the digest of each source object as it was last written, so that
+    repeated replications only write the objects which have changed.
+
+    The map is stored in a JSON file, which can hold the maps for more than
+    one pair of source and target endpoints. Without a file, the map is only
+    kept in memory.
+    '''
+
+
+    # ID map file format version.
+    VERSION = 1
+
+
+    def __init__(self, source, target, path=None):
+        '''
+        ID map object constructor.
+        '''
+
+        self.source = source
+        self.target = target
+        self.path = path
+
+        # Object type -> {source ID: target ID}
+        self.ids = {}
+        # Object type -> {source ID: digest}
+        self.digests = {}
+
+        if self.path and os.path.isfile(self.path):
+            self.load()
+
+
+    def __len__(self):
+        '''
+        Get the number of objects in the map.
+        '''
+
+        return sum((len(ids) for ids in self.ids.values()))
+
+
+    def key_get(self):
+        '''
+        Get the key of this map in the ID map file.
+        '''
+
+        return "{} {}".format(self.source, self.target)
+
+
+    def get(self, obj_type, source_id):
+        '''
+        Get the target ID and digest of the source object of the given type
+        and ID, or None if it is not in the map.
+        '''
+
+        target_id = self.ids.get(obj_type, {}).get(source_id)
+        if target_id is None:
+            return None
+        return (target_id, self.digests[obj_type][source_id])
+
+
+    def set(self, obj_type, source_id, target_id, digest):
+        '''
+        Map the source object of the given type and ID to the given target ID,
+        with the digest of the source object as written.
+        '''
+
+        self.ids.setdefault(obj_type, {})[source_id] = target_id
+        self.digests.setdefault(obj_type, {})[source_id] = digest
+
+
+    def old_to_new(self, obj_type):
+        '''
+        Get the dictionary of source IDs to target IDs for the given object
+        type. The dictionary is updated as objects are added to the map.
+        '''
+
+        return self.ids.setdefault(obj_type, {})
+
+
+    def prune(self, obj_type, source_ids):
+        '''
+        Remove the objects of the given type which are not in the given
+        set of source IDs from the map, returning the number removed.
+        '''
+
+        ids = self.ids.get(obj_type, {})
+        removed = [source_id for source_id in ids if source_id not in source_ids]
+
+        for source_id in removed:
+            del ids[source_id]
+            del self.digests[obj_type][source_id]
+
+        return len(removed)
+
+
+    def load(self):
+        '''
+        Load the map for this pair of endpoints from the ID map file.
+        '''
+
+        try:
+            with open(self.path, "r", encoding="UTF-8") as map_file:
+                data = json.load(map_file)
+        except (OSError, ValueError) as err:
+            raise IDMapError(
+                "unable to read ID map file '{}': {}".format(self.path, err),
+            ) from err
+
+        if data.get("version") != self.VERSION:
+            raise IDMapError(
+                "unsupported ID map file version '{}' in '{}', expected {}".format(
+                    data.get("version"),
+                    self.path,
+                    self.VERSION,
+                ),
+            )
+
+        # JSON object keys are always strings.
+        for obj_type, entries in data["maps"].get(self.key_get(), {}).items():
+            for source_id, (target_id, digest) in entries.items():
+                self.set(obj_type, int(source_id), target_id, digest)
+
+
+    def save(self):
+        '''
+        Atomically write the map for this pair of endpoints to the ID map
+        file, keeping the maps of other endpoints in it.
+        '''
+
+        if not self.path:
+            return
+
+        data = {"version": self.VERSION, "maps": {}}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path, "r", encoding="UTF-8") as map_file:
+                    old_data = json.load(map_file)
+                if old_data.get("version") == self.VERSION:
+                    data = old_data
+            except (OSError, ValueError):
+                pass
+
+        data["maps"][self.key_get()] = {
+            obj_type: {
+                str(source_id): [target_id, self.digests[obj_type][source_id]]
+                for source_id, target_id in ids.items()
+            }
+            for obj_type, ids in self.ids.items()
+        }
+
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)),
+            suffix=".tmp",
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="UTF-8") as temp_file:
+                json.dump(data, temp_file, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except OSError:
+            os.unlink(temp_path)
+            raise
@@ -24,14 +24,53 @@ Main routine.
 
 
 import argparse
+import collections
+import concurrent.futures
 import logging
 import os
 import stat
 
 from ipam_migrator.backend.netbox import NetBox
 from ipam_migrator.backend.phpipam import PhpIPAM
+from ipam_migrator.backend.phpipam_sql import PhpIPAMSQL
 
+from ipam_migrator.chunk import Chunker
+from ipam_migrator.config import Config
+
+from ipam_migrator.db.database import Database
+
+from ipam_migrator.exception import AuditLogError
 from ipam_migrator.exception import AuthDataNotFoundError
+from ipam_migrator.exception import ConfigError
+from ipam_migrator.exception import ValidationError
+
+from ipam_migrator.filter import Filter
+
+from ipam_migrator.http_cache import HTTPCache
+from ipam_migrator.idmap import IDMap
+
+from ipam_migrator.metrics import Metrics
+from ipam_migrator.planner import Plan
+from ipam_migrator.progress import Progress
+from ipam_migrator.trace import AuditLog
+from ipam_migrator.trace import ObjectTrace
+from ipam_migrator.transform import Transform
+
+from ipam_migrator.validate import database_validate
+from ipam_migrator.verify import database_verify
+
+
+# Command line options overriding the backend tuning options in the
+# configuration file, and the backends (by target name) they apply to.
+BACKEND_ARGS = collections.OrderedDict((
+    ("api_retries", ("input", "output")),
+    ("capabilities_cache", ("input", "output")),
+    ("http_cache", ("input",)),
+    ("transform", ("input",)),
+    ("extra_fields", ("input",)),
+    ("write_chunk_size", ("output",)),
+    ("write_chunk_bytes", ("output",)),
+))
 
 
 def main():
@@ -41,6 +80,7 @@ def main():
 
     # pylint: disable=too-many-locals
     # pylint: disable=too-many-statements
+    # pylint: disable=too-many-branches
 
     argparser = argparse.ArgumentParser(
         description="Transfer IPAM information between two (possibly differing) systems",
@@ -50,7 +90,10 @@ def main():
         "input_api_data",
         metavar="INPUT-API-ENDPOINT,TYPE,AUTH-METHOD,KEY|TOKEN|(USER,PASSWORD)",
         type=str,
-        help="input database API endpoint, type, authentication method and required information",
+        nargs="?",
+        default=None,
+        help="input database API endpoint, type, authentication method and required information "
+             "(overrides the [input] section of the configuration file)",
     )
 
     argparser.add_argument(
@@ -59,7 +102,17 @@ def main():
         type=str,
         nargs="?",
         default=None,
-        help="output database API endpoint, type, authentication method and required information",
+        help="output database API endpoint, type, authentication method and required information "
+             "(overrides the [output] section of the configuration file)",
+    )
+
+    argparser.add_argument(
+        "-c", "--config",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="read the databases, their tuning options and the pipeline options from FILE "
+             "(INI, see the README), overridden by the command line",
     )
 
     argparser.add_argument(
@@ -78,6 +131,241 @@ def main():
         help="use LEVEL as the logging level parameter",
     )
 
+    argparser.add_argument(
+        "-nia", "--no-ip-addresses",
+        action="store_true",
+        help="do NOT read or write IP addresses",
+    )
+
+    argparser.add_argument(
+        "-np", "--no-prefixes",
+        action="store_true",
+        help="do NOT read or write prefixes",
+    )
+
+    argparser.add_argument(
+        "-nvl", "--no-vlans",
+        action="store_true",
+        help="do NOT read or write VLANs",
+    )
+
+    argparser.add_argument(
+        "-nvr", "--no-vrfs",
+        action="store_true",
+        help="do NOT read or write VRFs",
+    )
+
+    argparser.add_argument(
+        "-fs", "--filter-section",
+        metavar="ID",
+        type=str,
+        action="append",
+        default=None,
+        help="only migrate prefixes and IP addresses in the phpIPAM section with ID "
+             "(may be given more than once)",
+    )
+
+    argparser.add_argument(
+        "-fv", "--filter-vrf",
+        metavar="VRF",
+        type=str,
+        action="append",
+        default=None,
+        help="only migrate VRFs, prefixes and IP addresses in the VRF with the ID, name or "
+             "route distinguisher VRF (may be given more than once)",
+    )
+
+    argparser.add_argument(
+        "-fc", "--filter-cidr",
+        metavar="CIDR",
+        type=str,
+        action="append",
+        default=None,
+        help="only migrate prefixes and IP addresses inside CIDR (may be given more than once)",
+    )
+
+    argparser.add_argument(
+        "-fvl", "--filter-vlan-range",
+        metavar="LOW[-HIGH]",
+        type=Filter.vlan_range_parse,
+        action="append",
+        default=None,
+        help="only migrate VLANs with VLAN IDs from LOW to HIGH (may be given more than once)",
+    )
+
+    argparser.add_argument(
+        "-va", "--validate",
+        action="store_true",
+        help="validate the input database, and do not write it if any errors are found",
+    )
+
+    argparser.add_argument(
+        "-vrp", "--validate-report",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="write the input database validation report to FILE in JSON format "
+             "(implies --validate)",
+    )
+
+    argparser.add_argument(
+        "-pl", "--plan",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="compute the plan for writing the input database to the output database "
+             "and write it to FILE, instead of writing the input database",
+    )
+
+    argparser.add_argument(
+        "-plo", "--plan-objects",
+        action="store_true",
+        help="log every object created or updated by the write plan",
+    )
+
+    argparser.add_argument(
+        "-ple", "--plan-execute",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="execute the write plan in FILE on the output database, given as the only "
+             "database argument, instead of reading an input database",
+    )
+
+    argparser.add_argument(
+        "-ve", "--verify",
+        action="store_true",
+        help="compare the input and output databases after a migration, "
+             "instead of writing the input database",
+    )
+
+    argparser.add_argument(
+        "-ver", "--verify-report",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="write the verification report to FILE in JSON format",
+    )
+
+    argparser.add_argument(
+        "-tf", "--transform",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="map input object fields to output fields using the rules in FILE "
+             "(JSON, see the README)",
+    )
+
+    argparser.add_argument(
+        "-xf", "--extra-fields",
+        metavar="TYPE=FIELD[,FIELD...]",
+        type=str,
+        action="append",
+        default=None,
+        help="keep the given input fields of objects of the given type "
+             "(ip_addresses, prefixes, vlans or vrfs) as extra attributes, "
+             "e.g. ip_addresses=hostname,mac (can be given more than once)",
+    )
+
+    argparser.add_argument(
+        "-rp", "--replicate",
+        action="store_true",
+        help="replicate the input NetBox database to the output NetBox database, "
+             "streaming objects into bulk writes (only the migrated fields are copied)",
+    )
+
+    argparser.add_argument(
+        "-im", "--id-map",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="keep the replication object ID map in FILE, "
+             "so that later replications only write changed objects",
+    )
+
+    argparser.add_argument(
+        "-ds", "--debug-sample",
+        metavar="N",
+        type=int,
+        default=1,
+        help="only log every Nth per-object debug message (default: 1)",
+    )
+
+    argparser.add_argument(
+        "-al", "--audit-log",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="write a JSON line for every object read or written to FILE",
+    )
+
+    argparser.add_argument(
+        "-cc", "--capabilities-cache",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="cache phpIPAM API controller capabilities per endpoint in FILE",
+    )
+
+    argparser.add_argument(
+        "-hc", "--http-cache",
+        metavar="DIR",
+        type=str,
+        default=None,
+        help="cache input API responses in DIR, and revalidate them on later runs",
+    )
+
+    argparser.add_argument(
+        "-m", "--metrics",
+        metavar="FILE",
+        type=str,
+        default=None,
+        help="write run phase timing and API request metrics to FILE in JSON format",
+    )
+
+    argparser.add_argument(
+        "-mp", "--metrics-port",
+        metavar="PORT",
+        type=int,
+        default=None,
+        help="expose run metrics in Prometheus text format on PORT while running",
+    )
+
+    argparser.add_argument(
+        "-pi", "--progress-interval",
+        metavar="SECONDS",
+        type=float,
+        default=10.0,
+        help="report read and write progress every SECONDS seconds, 0 to disable (default: 10)",
+    )
+
+    argparser.add_argument(
+        "-r", "--api-retries",
+        metavar="N",
+        type=int,
+        default=None,
+        help="retry failed API requests up to N times (default: 0), "
+             "only retrying writes which could not be sent",
+    )
+
+    argparser.add_argument(
+        "-wcs", "--write-chunk-size",
+        metavar="N",
+        type=int,
+        default=None,
+        help="write at most N objects per bulk request to NetBox, reduced "
+             "automatically if requests are slow (default: {})".format(Chunker.SIZE),
+    )
+
+    argparser.add_argument(
+        "-wcb", "--write-chunk-bytes",
+        metavar="N",
+        type=int,
+        default=None,
+        help="write at most N bytes of objects per bulk request to NetBox, "
+             "0 for no limit (default: {})".format(Chunker.BYTES),
+    )
+
     arg_input_ssl_verify = argparser.add_mutually_exclusive_group(required=False)
     arg_input_ssl_verify.add_argument(
         "-iasv", "--input-api-ssl-verify",
@@ -104,6 +392,30 @@ def main():
 
     args = vars(argparser.parse_args())
 
+    # Read the configuration file, and use its pipeline options
+    # as the defaults for the command line options.
+    try:
+        config = Config.load(args["config"]) if args["config"] else Config()
+    except ConfigError as err:
+        argparser.error(str(err))
+    if config.pipeline:
+        # List options are appended to their default values by argparse,
+        # so they are only taken from the file if not given at all.
+        list_options = {
+            option: value
+            for option, value in config.pipeline.items()
+            if Config.PIPELINE_OPTIONS[option] in Config.LIST_TYPES
+        }
+        argparser.set_defaults(**{
+            option: value
+            for option, value in config.pipeline.items()
+            if option not in list_options
+        })
+        args = vars(argparser.parse_args())
+        for option, value in list_options.items():
+            if args[option] is None:
+                args[option] = value
+
     # Set up the logger.
     log = args["log"]
     log_level = args["log_level"]
@@ -126,33 +438,68 @@ def main():
 
     logger.debug("started logger")
 
+    # Set up the run metrics.
+    metrics = Metrics()
+    if args["metrics_port"] is not None:
+        try:
+            metrics.server_start(args["metrics_port"])
+        except OSError as err:
+            argparser.error(
+                "unable to serve run metrics on port {}: {}".format(args["metrics_port"], err),
+            )
+        logger.debug("serving run metrics on port %i", args["metrics_port"])
+
+    # Set up the progress reporter.
+    progress = Progress(logger, interval=args["progress_interval"])
+
+    # Set up the per-object trace and audit log.
+    audit_log = AuditLog(args["audit_log"], logger=logger) if args["audit_log"] else None
+    trace = ObjectTrace(logger, sample=args["debug_sample"], audit_log=audit_log)
+
+    # When executing a previously computed write plan, the input database
+    # is not read, so the only database given is the output database.
+    if args["plan_execute"] and args["input_api_data"] and not args["output_api_data"]:
+        args["output_api_data"] = args["input_api_data"]
+        args["input_api_data"] = None
+
     # Start main routine, with exception capture for logging purposes.
     try:
-        input_api_data = api_data_read(logger, args, "input")
-        input_api_endpoint = input_api_data[0]
-        input_api_type = input_api_data[1]
-        input_api_auth_method = input_api_data[2]
-        input_api_auth_data = input_api_data[3]
-        input_api_ssl_verify = input_api_data[4]
-
-        if args["output_api_data"]:
-            use_output = True
-            output_api_data = api_data_read(logger, args, "output")
-            output_api_endpoint = output_api_data[0]
-            output_api_type = output_api_data[1]
-            output_api_auth_method = output_api_data[2]
-            output_api_auth_data = output_api_data[3]
-            output_api_ssl_verify = output_api_data[4]
-        else:
-            use_output = False
+        use_input = not args["plan_execute"]
+        use_output = bool(args["output_api_data"] or config.backend_get("output"))
+
+        # The API data of a database which is not used is all None.
+        (input_api_endpoint, input_api_type,
+         input_api_auth_method, input_api_auth_data,
+         input_api_ssl_verify) = (
+             api_data_read(logger, args, config, "input") if use_input else (None,) * 5
+         )
+        (output_api_endpoint, output_api_type,
+         output_api_auth_method, output_api_auth_data,
+         output_api_ssl_verify) = (
+             api_data_read(logger, args, config, "output") if use_output else (None,) * 5
+         )
+
+        if output_api_type == "phpipam-sql":
+            raise RuntimeError("phpipam-sql is input only, and cannot be used as an output database")
+        if args["plan"] and not use_output:
+            raise RuntimeError("computing a write plan requires an output database")
+        if args["verify"] and not use_output:
+            raise RuntimeError("verifying a migration requires an output database")
+        if args["replicate"]:
+            if input_api_type != "netbox" or output_api_type != "netbox":
+                raise RuntimeError("replication requires NetBox input and output databases")
+            if args["filter_section"] or args["filter_vrf"] or \
+               args["filter_cidr"] or args["filter_vlan_range"]:
+                raise RuntimeError("filters are not supported when replicating")
 
         # Configuration verification.
-        api_data_check(
-            logger, "input",
-            input_api_endpoint, input_api_type,
-            input_api_auth_method, input_api_auth_data,
-            input_api_ssl_verify,
-        )
+        if use_input:
+            api_data_check(
+                logger, "input",
+                input_api_endpoint, input_api_type,
+                input_api_auth_method, input_api_auth_data,
+                input_api_ssl_verify,
+            )
 
         if use_output:
             api_data_check(
@@ -162,34 +509,130 @@ def main():
                 output_api_ssl_verify,
             )
 
-        # Connect to the input API endpoint, and read its database.
-        input_backend = backend_create(
-            logger, "input",
-            input_api_endpoint, input_api_type,
-            input_api_auth_method, input_api_auth_data,
-            input_api_ssl_verify,
-        )
-        input_database = input_backend.database_read()
+        # Connect to the input and output API endpoints.
+        input_backend = None
+        output_backend = None
+
+        if use_input:
+            input_backend = backend_create(
+                logger, "input",
+                input_api_endpoint, input_api_type,
+                input_api_auth_method, input_api_auth_data,
+                input_api_ssl_verify,
+                metrics=metrics,
+                progress=progress,
+                trace=trace,
+                **backend_kwargs(backend_options(args, config, "input"))
+            )
 
-        # If an output database is specified, connect to the output API endpoint,
-        # and write the input database to it.
         if use_output:
             output_backend = backend_create(
                 logger, "output",
                 output_api_endpoint, output_api_type,
                 output_api_auth_method, output_api_auth_data,
                 output_api_ssl_verify,
+                metrics=metrics,
+                progress=progress,
+                trace=trace,
+                **backend_kwargs(backend_options(args, config, "output"))
             )
-            output_backend.database_write(input_database)
 
-        # If not, write the input database to the logger.
+        # When replicating, stream the input database into the output database.
+        if args["replicate"]:
+            id_map = IDMap(input_api_endpoint, output_api_endpoint, path=args["id_map"])
+            obj_types = [
+                obj_type
+                for obj_type, skip in (("vrfs", args["no_vrfs"]),
+                                       ("vlans", args["no_vlans"]),
+                                       ("prefixes", args["no_prefixes"]),
+                                       ("ip-addresses", args["no_ip_addresses"]))
+                if not skip
+            ]
+            with metrics.phase("output", "replicate"):
+                output_backend.replicate(input_backend, id_map, obj_types=obj_types)
+            if args["id_map"]:
+                logger.info("Wrote ID map for %i objects to '%s'.", len(id_map), args["id_map"])
+            input_backend.close()
+            output_backend.close()
+
+        # When verifying, read both databases at the same time, and compare them.
+        elif args["verify"]:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+                input_future = executor.submit(backend_database_read, logger, args, input_backend)
+                output_future = executor.submit(backend_database_read, logger, args, output_backend)
+                input_database = input_future.result()
+                output_database = output_future.result()
+
+            with metrics.phase("output", "verify"):
+                report = database_verify(input_database, output_database)
+            report.log(logger)
+            if args["verify_report"]:
+                with open(args["verify_report"], "w", encoding="UTF-8") as report_file:
+                    report_file.write(report.json())
+                logger.info("Wrote verification report to '%s'.", args["verify_report"])
+
         else:
-            logger.info("Input database:\n%s", input_database)
+            if use_input:
+                input_database = backend_database_read(logger, args, input_backend)
+
+            # Validate the input database before writing it anywhere.
+            if use_input and (args["validate"] or args["validate_report"]):
+                with metrics.phase("input", "validate"):
+                    report = database_validate(input_database)
+                report.log(logger)
+                if args["validate_report"]:
+                    with open(args["validate_report"], "w", encoding="UTF-8") as report_file:
+                        report_file.write(report.json())
+                    logger.info("Wrote validation report to '%s'.", args["validate_report"])
+                if report.errors():
+                    raise ValidationError(
+                        input_database.name,
+                        report.errors(),
+                        report.warnings(),
+                    )
+
+            # If an output database is specified, write the input database to it
+            # (or plan to).
+            if use_output:
+                if args["plan_execute"]:
+                    plan = Plan.load(args["plan_execute"])
+                    plan.log(logger)
+                    with metrics.phase("output", "plan_execute"):
+                        output_backend.plan_execute(plan)
+                elif args["plan"]:
+                    with metrics.phase("output", "plan"):
+                        plan = output_backend.database_plan(input_database)
+                    plan.log(logger, objects=args["plan_objects"])
+                    plan.save(args["plan"])
+                    logger.info("Wrote write plan to '%s'.", args["plan"])
+                else:
+                    output_backend.database_write(input_database)
+                output_backend.close()
+
+            # If not, write the input database to the logger.
+            else:
+                logger.info("Input database:\n%s", input_database)
 
     # pylint: disable=broad-except
     except Exception as exc:
         logger.exception(exc)
 
+    if audit_log:
+        try:
+            audit_log.close()
+        except AuditLogError as exc:
+            logger.error(str(exc))
+
+    # Write out the run metrics.
+    metrics.finish()
+    if args["metrics"]:
+        try:
+            with open(args["metrics"], "w", encoding="UTF-8") as metrics_file:
+                metrics_file.write(metrics.json())
+            logger.info("Wrote run metrics to '%s'.", args["metrics"])
+        except OSError as exc:
+            logger.exception(exc)
+
     # Main routine shutdown.
     logger.debug("stopping logger")
     logger.removeHandler(logger_streamhandler)
@@ -197,22 +640,33 @@ def main():
         logger.removeHandler(logger_filehandler)
 
 
-def api_data_read(logger, args, name):
+def api_data_read(logger, args, config, name):
     '''
-    Read the API data for the given target name.
+    Read the API data for the given target name, from the command line
+    if it was given there, or from the configuration file.
     '''
 
     # pylint: disable=unused-argument
 
-    api_data_list = args["{}_api_data".format(name)].split(",")
-    api_endpoint = api_data_list[0]
-    api_type = api_data_list[1]
-    api_auth_method = api_data_list[2]
-    api_auth_data = api_data_list[3:]
-    if args["{}_api_ssl_verify".format(name)] is False and \
-       args["no_{}_api_ssl_verify".format(name)] is True:
-        api_ssl_verify = True # Default case
+    if args["{}_api_data".format(name)]:
+        api_data_list = args["{}_api_data".format(name)].split(",")
+        api_endpoint = api_data_list[0]
+        api_type = api_data_list[1]
+        api_auth_method = api_data_list[2]
+        api_auth_data = api_data_list[3:]
+        api_ssl_verify = True
+    elif config.backend_get(name):
+        (api_endpoint, api_type,
+         api_auth_method, api_auth_data,
+         api_ssl_verify) = config.api_data_get(name)
     else:
+        raise RuntimeError(
+            "no {} database given on the command line or in the configuration file".format(name),
+        )
+
+    # Either SSL verify option overrides the default (or configured) value.
+    if args["{}_api_ssl_verify".format(name)] is True or \
+       args["no_{}_api_ssl_verify".format(name)] is False:
         api_ssl_verify = args["{}_api_ssl_verify".format(name)]
 
     return (api_endpoint, api_type, api_auth_method, api_auth_data, api_ssl_verify)
@@ -253,11 +707,109 @@ def api_data_check(logger, name,
     logger.debug("- SSL verify: %s", str(api_ssl_verify).lower())
 
 
+def extra_fields_parse(values):
+    '''
+    Parse the given extra field arguments (TYPE=FIELD[,FIELD...])
+    into a dictionary of object type to list of field names.
+    '''
+
+    extra_fields = {}
+
+    for value in values:
+        obj_type, sep, fields = value.partition("=")
+        if not sep or obj_type not in Database.OBJ_TYPES or not fields:
+            raise RuntimeError(
+                "invalid extra fields '{}', expected TYPE=FIELD[,FIELD...] "
+                "with TYPE one of: {}".format(value, ", ".join(Database.OBJ_TYPES)),
+            )
+        type_fields = extra_fields.setdefault(obj_type, [])
+        for field in fields.split(","):
+            if field and field not in type_fields:
+                type_fields.append(field)
+
+    return extra_fields
+
+
+def backend_options(args, config, name):
+    '''
+    Get the tuning options for the backend with the given target name,
+    from the configuration file, overridden by the command line options
+    which were given.
+    '''
+
+    options = dict(config.backend_get(name) or {})
+
+    for option, names in BACKEND_ARGS.items():
+        if name in names and args[option] is not None:
+            options[option] = args[option]
+
+    return options
+
+
+def backend_kwargs(options):
+    '''
+    Get the backend constructor keyword arguments for the given
+    backend tuning options.
+    '''
+
+    for option, minimum in (("api_retries", 0),
+                            ("pool_size", 1),
+                            ("rate_limit", 0),
+                            ("concurrency", 1),
+                            ("write_chunk_size", 1),
+                            ("write_chunk_bytes", 0)):
+        if options.get(option) is not None and options[option] < minimum:
+            raise RuntimeError("{} must be at least {}".format(option, minimum))
+
+    return {
+        "api_retries": options.get("api_retries", 0),
+        "pool_size": options.get("pool_size"),
+        "rate_limit": options.get("rate_limit"),
+        "write_concurrency": options.get("concurrency"),
+        "chunker": Chunker(options.get("write_chunk_size"), options.get("write_chunk_bytes")),
+        "capabilities_cache": options.get("capabilities_cache"),
+        "http_cache": HTTPCache(options["http_cache"]) if options.get("http_cache") else None,
+        "transform": Transform.load(options["transform"]) if options.get("transform") else None,
+        "extra_fields": extra_fields_parse(options.get("extra_fields") or []),
+    }
+
+
+def backend_database_read(logger, args, backend):
+    '''
+    Read the database from the given backend, using the filters and
+    object types given in the arguments, and close the backend.
+    '''
+
+    filters = Filter(
+        sections=args["filter_section"],
+        vrfs=args["filter_vrf"],
+        cidrs=args["filter_cidr"],
+        vlan_ranges=args["filter_vlan_range"],
+    )
+    if filters:
+        logger.info("Filtering %s database by %s", backend.name, filters)
+
+    database = backend.database_read(
+        read_ip_addresses=not args["no_ip_addresses"],
+        read_prefixes=not args["no_prefixes"],
+        read_vlans=not args["no_vlans"],
+        read_vrfs=not args["no_vrfs"],
+        filters=filters,
+    )
+    backend.close()
+
+    return database
+
+
 # pylint: disable=too-many-arguments
 def backend_create(logger, name,
                    api_endpoint, api_type,
                    api_auth_method, api_auth_data,
-                   api_ssl_verify):
+                   api_ssl_verify,
+                   capabilities_cache=None,
+                   write_concurrency=None,
+                   chunker=None,
+                   **kwargs):
     '''
     Read an API backend for the given target name.
     '''
@@ -266,11 +818,21 @@ def backend_create(logger, name,
         return PhpIPAM(logger, name,
                        api_endpoint, api_auth_method,
                        api_auth_data, api_ssl_verify,
+                       capabilities_cache=capabilities_cache,
+                       write_concurrency=write_concurrency,
+                       **kwargs
                       )
+    elif api_type == "phpipam-sql":
+        return PhpIPAMSQL(logger, name,
+                          api_endpoint,
+                          **kwargs
+                         )
     elif api_type == "netbox":
         return NetBox(logger, name,
                       api_endpoint, api_auth_method,
                       api_auth_data, api_ssl_verify,
+                      chunker=chunker,
+                      **kwargs
                      )
     else:
         raise RuntimeError("unknown {} database backend type '{}'".format(name, api_type))
@@ -0,0 +1,434 @@
+#
+# IPAM database migration script
+# ipam_migrator/metrics.py - run phase timing and API request metrics
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Run phase timing and API request metrics.
+'''
+
+
+import contextlib
+import http.server
+import json
+import re
+import threading
+import time
+import urllib.parse
+
+
+class EndpointMetrics(object):
+    '''
+    Request metrics for a single API endpoint and request method.
+    '''
+
+
+    # pylint: disable=too-few-public-methods
+
+
+    def __init__(self, buckets):
+        '''
+        Endpoint metrics object constructor.
+        '''
+
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+    def as_dict(self):
+        '''
+        Dictionary representation of the endpoint metrics.
+        '''
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+
+            "latency_sum": self.latency_sum,
+            "latency_max": self.latency_max,
+            "latency_mean": self.latency_sum / self.requests if self.requests else 0.0,
+            "latency_histogram": {
+                str(bucket): count for bucket, count in zip(self.buckets, self.bucket_counts)
+            },
+
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+        }
+
+
+class Metrics(object):
+    '''
+    Run metrics collector, shared between the input and output backends.
+
+    Records the wall time of each run phase, and the request count,
+    latency histogram, bytes transferred and retries of each API endpoint.
+    All methods are thread-safe.
+    '''
+
+
+    # Latency histogram bucket upper bounds, in seconds.
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    # Path segments which are object IDs, folded into a single
+    # endpoint when recording request metrics.
+    ID_SEGMENT_RE = re.compile("^[0-9]+$")
+
+
+    def __init__(self):
+        '''
+        Metrics object constructor.
+        '''
+
+        self.lock = threading.Lock()
+
+        self.started = time.time()
+        self.finished = None
+
+        # (backend, phase) -> [count, seconds]
+        self.phases = {}
+        # (backend, phase) -> list of start times
+        self.phases_active = {}
+
+        # (backend, method, endpoint) -> EndpointMetrics
+        self.endpoints = {}
+
+        # name -> value
+        self.counters = {}
+
+        self.server = None
+
+
+    #
+    ##
+    #
+
+
+    @contextlib.contextmanager
+    def phase(self, backend, name):
+        '''
+        Context manager recording the wall time spent in the given phase.
+        '''
+
+        key = (backend, name)
+        start = time.time()
+
+        with self.lock:
+            self.phases_active.setdefault(key, []).append(start)
+
+        try:
+            yield
+        finally:
+            end = time.time()
+            with self.lock:
+                self.phases_active[key].remove(start)
+                if not self.phases_active[key]:
+                    del self.phases_active[key]
+                phase = self.phases.setdefault(key, [0, 0.0])
+                phase[0] += 1
+                phase[1] += end - start
+
+
+    def endpoint_get(self, uri, api_endpoint=None):
+        '''
+        Get the endpoint name to record metrics for the given URI under,
+        with object IDs replaced by '{id}' and query parameters removed.
+        '''
+
+        if api_endpoint and uri.startswith(api_endpoint):
+            uri = uri[len(api_endpoint):]
+
+        path = urllib.parse.urlsplit(uri).path.strip("/")
+
+        return "/".join(
+            ("{id}" if self.ID_SEGMENT_RE.match(seg) else seg for seg in path.split("/")),
+        )
+
+
+    # pylint: disable=too-many-arguments
+    def request_record(self,
+                       backend, method, endpoint,
+                       latency,
+                       bytes_sent=0, bytes_received=0,
+                       error=False):
+        '''
+        Record a completed API request.
+        '''
+
+        with self.lock:
+            metrics = self.endpoints_get(backend, method, endpoint)
+
+            metrics.requests += 1
+            if error:
+                metrics.errors += 1
+
+            metrics.latency_sum += latency
+            if latency > metrics.latency_max:
+                metrics.latency_max = latency
+            for i, bucket in enumerate(metrics.buckets):
+                if latency <= bucket:
+                    metrics.bucket_counts[i] += 1
+                    break
+
+            metrics.bytes_sent += bytes_sent
+            metrics.bytes_received += bytes_received
+
+
+    def retry_record(self, backend, method, endpoint):
+        '''
+        Record a retried API request.
+        '''
+
+        with self.lock:
+            self.endpoints_get(backend, method, endpoint).retries += 1
+
+
+    def counter_add(self, name, value=1):
+        '''
+        Add the given value to a named counter.
+        '''
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def endpoints_get(self, backend, method, endpoint):
+        '''
+        Get the metrics object for the given endpoint, creating it if necessary.
+        Must be called with the lock held.
+        '''
+
+        key = (backend, method, endpoint)
+
+        if key not in self.endpoints:
+            self.endpoints[key] = EndpointMetrics(self.LATENCY_BUCKETS)
+
+        return self.endpoints[key]
+
+
+    def finish(self):
+        '''
+        Mark the end of the run.
+        '''
+
+        self.finished = time.time()
+        self.server_stop()
+
+
+    #
+    ##
+    #
+
+
+    def as_dict(self):
+        '''
+        Dictionary representation of the current run metrics.
+        '''
+
+        with self.lock:
+            now = self.finished if self.finished else time.time()
+
+            phases = {}
+            for (backend, name), (count, seconds) in sorted(self.phases.items()):
+                phases.setdefault(backend, {})[name] = {"count": count, "seconds": seconds}
+            for (backend, name), starts in sorted(self.phases_active.items()):
+                phase = phases.setdefault(backend, {}).setdefault(
+                    name,
+                    {"count": 0, "seconds": 0.0},
+                )
+                phase["active"] = len(starts)
+                phase["seconds"] += sum((now - start for start in starts))
+
+            endpoints = {}
+            for (backend, method, endpoint), metrics in sorted(self.endpoints.items()):
+                endpoints.setdefault(backend, {})["{} {}".format(method, endpoint)] = \
+                    metrics.as_dict()
+
+            return {
+                "started": self.started,
+                "finished": self.finished,
+                "seconds": now - self.started,
+                "phases": phases,
+                "endpoints": endpoints,
+                "counters": dict(self.counters),
+            }
+
+
+    def json(self):
+        '''
+        JSON representation of the current run metrics.
+        '''
+
+        return json.dumps(self.as_dict(), sort_keys=True, indent=4)
+
+
+    def prometheus(self):
+        '''
+        Prometheus text format representation of the current run metrics.
+        '''
+
+        # pylint: disable=too-many-locals
+
+        data = self.as_dict()
+        lines = []
+
+        def metric(name, metric_type, description):
+            lines.append("# HELP ipam_migrator_{} {}".format(name, description))
+            lines.append("# TYPE ipam_migrator_{} {}".format(name, metric_type))
+
+        def sample(name, labels, value):
+            lines.append("ipam_migrator_{}{{{}}} {}".format(
+                name,
+                ",".join(('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels)),
+                value,
+            ))
+
+        metric("run_seconds", "gauge", "Wall time elapsed since the start of the run.")
+        lines.append("ipam_migrator_run_seconds {}".format(data["seconds"]))
+
+        metric("phase_seconds", "gauge", "Wall time spent in each run phase.")
+        for backend, phases in sorted(data["phases"].items()):
+            for name, phase in sorted(phases.items()):
+                sample("phase_seconds", (("backend", backend), ("phase", name)), phase["seconds"])
+
+        metric("phase_active", "gauge", "Number of currently running instances of each phase.")
+        for backend, phases in sorted(data["phases"].items()):
+            for name, phase in sorted(phases.items()):
+                sample(
+                    "phase_active",
+                    (("backend", backend), ("phase", name)),
+                    phase.get("active", 0),
+                )
+
+        endpoints = [
+            (backend, key.split(" ", 1), metrics)
+            for backend, backend_endpoints in sorted(data["endpoints"].items())
+            for key, metrics in sorted(backend_endpoints.items())
+        ]
+
+        metric("requests_total", "counter", "Number of API requests sent.")
+        for backend, (method, endpoint), metrics in endpoints:
+            labels = (("backend", backend), ("method", method), ("endpoint", endpoint))
+            sample("requests_total", labels, metrics["requests"])
+
+        metric("request_errors_total", "counter", "Number of failed API requests.")
+        for backend, (method, endpoint), metrics in endpoints:
+            labels = (("backend", backend), ("method", method), ("endpoint", endpoint))
+            sample("request_errors_total", labels, metrics["errors"])
+
+        metric("request_retries_total", "counter", "Number of retried API requests.")
+        for backend, (method, endpoint), metrics in endpoints:
+            labels = (("backend", backend), ("method", method), ("endpoint", endpoint))
+            sample("request_retries_total", labels, metrics["retries"])
+
+        metric("request_bytes_total", "counter", "Number of bytes transferred by API requests.")
+        for backend, (method, endpoint), metrics in endpoints:
+            labels = (("backend", backend), ("method", method), ("endpoint", endpoint))
+            sample("request_bytes_total", labels + (("direction", "sent"),), metrics["bytes_sent"])
+            sample(
+                "request_bytes_total",
+                labels + (("direction", "received"),),
+                metrics["bytes_received"],
+            )
+
+        metric("request_duration_seconds", "histogram", "API request latency.")
+        for backend, (method, endpoint), metrics in endpoints:
+            labels = (("backend", backend), ("method", method), ("endpoint", endpoint))
+            cumulative = 0
+            for bucket in self.LATENCY_BUCKETS:
+                cumulative += metrics["latency_histogram"][str(bucket)]
+                sample("request_duration_seconds_bucket", labels + (("le", bucket),), cumulative)
+            sample("request_duration_seconds_bucket", labels + (("le", "+Inf"),), metrics["requests"])
+            sample("request_duration_seconds_sum", labels, metrics["latency_sum"])
+            sample("request_duration_seconds_count", labels, metrics["requests"])
+
+        metric("events_total", "counter", "Number of occurrences of named run events.")
+        for name, value in sorted(data["counters"].items()):
+            sample("events_total", (("event", name),), value)
+
+        return "\n".join(lines) + "\n"
+
+
+    #
+    ##
+    #
+
+
+    def server_start(self, port, address=""):
+        '''
+        Start a background HTTP server exposing the run metrics
+        in Prometheus text format on the given port.
+        '''
+
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            '''
+            Prometheus metrics request handler.
+            '''
+
+            def do_GET(self):
+                '''
+                Return the current run metrics.
+                '''
+
+                # pylint: disable=invalid-name
+
+                body = metrics.prometheus().encode("UTF-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                '''
+                Suppress request logging to stderr.
+                '''
+
+                # pylint: disable=arguments-differ
+
+                pass
+
+        self.server = http.server.HTTPServer((address, port), Handler)
+
+        thread = threading.Thread(target=self.server.serve_forever, name="metrics-server")
+        thread.daemon = True
+        thread.start()
+
+
+    def server_stop(self):
+        '''
+        Stop the background HTTP server, if it is running.
+        '''
+
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
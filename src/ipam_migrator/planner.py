@@ -0,0 +1,184 @@
+#
+# IPAM database migration script
+# ipam_migrator/planner.py - offline write plans
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Offline write plans.
+'''
+
+
+import collections
+import json
+import time
+
+from ipam_migrator.exception import PlanError
+
+
+class Plan(object):
+    '''
+    Write plan for a database, listing the action to take for each object
+    and the payload to send, computed by a backend from a single bulk read
+    of its current objects. The plan can be saved and executed later
+    without comparing the objects again.
+
+    Each plan entry is a dictionary with the following keys:
+
+    * obj_type: the backend object type (e.g. "prefixes")
+    * action: one of "create", "update", "skip" or "conflict"
+    * source_id: the ID of the object in the source database
+    * target_id: the ID of the existing object on the backend, if any
+    * data: the payload to write (only the changed fields for updates)
+    * refs: payload fields referencing objects to be created by the plan,
+      as a mapping of field name to [object type, source ID]
+    * message: a description of the entry, used for conflicts
+
+    Entries are ordered so that referenced objects come first.
+    '''
+
+
+    # Plan file format version.
+    VERSION = 1
+
+    ACTIONS = ("create", "update", "skip", "conflict")
+
+
+    def __init__(self, source, target, created=None, entries=None):
+        '''
+        Plan object constructor.
+        '''
+
+        self.source = source
+        self.target = target
+        self.created = created if created is not None else time.time()
+        self.entries = entries if entries is not None else []
+
+
+    # pylint: disable=too-many-arguments
+    def add(self,
+            obj_type, action, source_id,
+            target_id=None, data=None, refs=None, message=None):
+        '''
+        Add an entry to the plan.
+        '''
+
+        if action not in self.ACTIONS:
+            raise PlanError("unknown plan action '{}'".format(action))
+
+        self.entries.append({
+            "obj_type": obj_type,
+            "action": action,
+            "source_id": source_id,
+            "target_id": target_id,
+            "data": data if data is not None else {},
+            "refs": refs if refs is not None else {},
+            "message": message,
+        })
+
+
+    def counts(self):
+        '''
+        Get the number of entries for each object type and action.
+        '''
+
+        counts = collections.OrderedDict()
+        for entry in self.entries:
+            obj_counts = counts.setdefault(
+                entry["obj_type"],
+                collections.OrderedDict(((action, 0) for action in self.ACTIONS)),
+            )
+            obj_counts[entry["action"]] += 1
+        return counts
+
+
+    def log(self, logger, objects=False):
+        '''
+        Log a summary of the plan, and optionally every entry in it
+        other than the objects left alone.
+        '''
+
+        logger.info("Write plan for %s to %s:", self.source, self.target)
+        for obj_type, obj_counts in self.counts().items():
+            logger.info(
+                "- %s: %s",
+                obj_type,
+                ", ".join(("{} {}".format(c, a) for a, c in obj_counts.items())),
+            )
+
+        for entry in self.entries:
+            if entry["action"] == "conflict":
+                logger.warning(
+                    "conflict: %s %s: %s",
+                    entry["obj_type"], entry["source_id"], entry["message"],
+                )
+            elif objects and entry["action"] != "skip":
+                logger.info(
+                    "%s: %s %s%s: %s",
+                    entry["action"], entry["obj_type"], entry["source_id"],
+                    " (ID {})".format(entry["target_id"]) if entry["target_id"] else "",
+                    ", ".join((
+                        "{}={}".format(k, v) if k not in entry["refs"] else
+                        "{}=<new {} {}>".format(k, *entry["refs"][k])
+                        for k, v in sorted(entry["data"].items())
+                    )),
+                )
+
+
+    def as_dict(self):
+        '''
+        Dictionary representation of the plan.
+        '''
+
+        return {
+            "version": self.VERSION,
+            "source": self.source,
+            "target": self.target,
+            "created": self.created,
+            "counts": self.counts(),
+            "entries": self.entries,
+        }
+
+
+    def save(self, path):
+        '''
+        Write the plan to the given file, in JSON format.
+        '''
+
+        with open(path, "w", encoding="UTF-8") as plan_file:
+            json.dump(self.as_dict(), plan_file, indent=4)
+
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Read a plan from the given file.
+        '''
+
+        with open(path, "r", encoding="UTF-8") as plan_file:
+            data = json.load(plan_file)
+
+        if data.get("version") != cls.VERSION:
+            raise PlanError(
+                "unsupported plan file version '{}' in '{}', expected {}".format(
+                    data.get("version"),
+                    path,
+                    cls.VERSION,
+                ),
+            )
+
+        return cls(data["source"], data["target"], data["created"], data["entries"])
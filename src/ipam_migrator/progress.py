@@ -0,0 +1,184 @@
+#
+# IPAM database migration script
+# ipam_migrator/progress.py - progress reporting for long reads and writes
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Progress reporting for long reads and writes.
+'''
+
+
+import datetime
+import threading
+import time
+
+
+class ProgressPhase(object):
+    '''
+    Progress of a single run phase, counting completed units of work
+    against an (optionally) known total, and the objects processed.
+    All methods are thread-safe.
+    '''
+
+
+    # pylint: disable=too-many-instance-attributes
+
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, logger, backend, name, total, interval):
+        '''
+        Progress phase object constructor.
+        '''
+
+        self.logger = logger
+        self.backend = backend
+        self.name = name
+        self.total = total
+        self.interval = interval
+
+        self.lock = threading.Lock()
+
+        self.done = 0
+        self.objects = 0
+
+        self.started = time.monotonic()
+        self.report_next = self.started + interval if interval else None
+
+
+    def __enter__(self):
+        '''
+        Progress phase context manager entry method.
+        '''
+
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        '''
+        Progress phase context manager exit method.
+        '''
+
+        if exc_type is None:
+            self.finish()
+
+
+    def update(self, done=1, objects=None):
+        '''
+        Record the given number of completed units of work, and the
+        number of objects processed by them (by default, the same number).
+        Reports progress if the reporting interval has elapsed.
+        '''
+
+        with self.lock:
+            self.done += done
+            self.objects += objects if objects is not None else done
+
+            if self.report_next is None:
+                return
+            now = time.monotonic()
+            if now < self.report_next:
+                return
+            self.report_next = now + self.interval
+            done = self.done
+            objects = self.objects
+
+        self.report(now, done, objects)
+
+
+    def finish(self):
+        '''
+        Report the final progress of the phase.
+        '''
+
+        with self.lock:
+            done = self.done
+            objects = self.objects
+            self.report_next = None
+
+        if self.interval:
+            self.report(time.monotonic(), done, objects, final=True)
+
+
+    def report(self, now, done, objects, final=False):
+        '''
+        Log the given progress of the phase.
+        '''
+
+        # pylint: disable=too-many-arguments
+
+        elapsed = now - self.started
+        rate = objects / elapsed if elapsed > 0 else 0.0
+
+        if final:
+            self.logger.info(
+                "%s: %s: finished, %i objects in %s (%.1f objects/sec)",
+                self.backend, self.name,
+                objects, self.duration_format(elapsed), rate,
+            )
+        elif self.total:
+            eta = (self.total - done) * elapsed / done if done else None
+            self.logger.info(
+                "%s: %s: %i/%i (%.1f%%), %i objects, %.1f objects/sec, ETA %s",
+                self.backend, self.name,
+                done, self.total, done * 100.0 / self.total,
+                objects, rate,
+                self.duration_format(eta) if eta is not None else "unknown",
+            )
+        else:
+            self.logger.info(
+                "%s: %s: %i objects, %.1f objects/sec",
+                self.backend, self.name,
+                objects, rate,
+            )
+
+
+    @staticmethod
+    def duration_format(seconds):
+        '''
+        Format the given number of seconds as a duration.
+        '''
+
+        return str(datetime.timedelta(seconds=int(seconds)))
+
+
+class Progress(object):
+    '''
+    Progress reporter, creating a ProgressPhase for each run phase.
+    Progress is logged at most once per reporting interval,
+    and not at all if the interval is 0.
+    '''
+
+
+    # pylint: disable=too-few-public-methods
+
+
+    def __init__(self, logger, interval=0):
+        '''
+        Progress reporter object constructor.
+        '''
+
+        self.logger = logger
+        self.interval = interval
+
+
+    def phase(self, backend, name, total=None):
+        '''
+        Start tracking the progress of the given phase.
+        '''
+
+        return ProgressPhase(self.logger, backend, name, total, self.interval)
@@ -0,0 +1,72 @@
+#
+# IPAM database migration script
+# ipam_migrator/ratelimit.py - API request rate limiting
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+API request rate limiting.
+'''
+
+
+import threading
+import time
+
+
+class RateLimiter(object):
+    '''
+    Token bucket limiting the rate of requests to an API endpoint.
+
+    The bucket holds up to a burst of tokens, and is refilled at the given
+    rate of tokens per second. Each request takes a token, waiting for one
+    to be added if the bucket is empty. Waiting requests reserve their
+    tokens in turn, so concurrent requests are spread out evenly.
+    '''
+
+
+    def __init__(self, rate, burst=None):
+        '''
+        Rate limiter object constructor. The burst defaults to one
+        second's worth of requests.
+        '''
+
+        self.rate = float(rate)
+        self.burst = float(burst) if burst else max(1.0, self.rate)
+
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+        self.lock = threading.Lock()
+
+
+    def acquire(self):
+        '''
+        Take a token from the bucket, waiting until one is available.
+        Returns the time spent waiting, in seconds.
+        '''
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1.0
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
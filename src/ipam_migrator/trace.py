@@ -0,0 +1,182 @@
+#
+# IPAM database migration script
+# ipam_migrator/trace.py - per-object debug trace and audit log
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Per-object debug trace and audit log.
+'''
+
+
+import itertools
+import json
+import logging
+import os
+import queue
+import stat
+import threading
+import time
+
+from ipam_migrator.exception import AuditLogError
+
+
+class AuditLog(object):
+    '''
+    Per-object audit log, written to a file as JSON lines by a
+    background thread. Recording an object serialises it and queues the
+    line, so the caller does not wait on file I/O unless the queue is full,
+    in which case it waits for the writer to catch up.
+
+    If the file cannot be written, the error is logged, later entries are
+    discarded, and the error is raised when the audit log is closed.
+    '''
+
+
+    # Maximum number of entries waiting to be written.
+    QUEUE_SIZE = 10000
+
+
+    def __init__(self, path, logger=None):
+        '''
+        Audit log object constructor.
+        '''
+
+        self.path = path
+        self.logger = logger
+
+        self.queue = queue.Queue(maxsize=self.QUEUE_SIZE)
+
+        # Exception raised by the writer thread, if any.
+        self.error = None
+
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self.file = open(path, "w", encoding="UTF-8")
+        os.chmod(path, stat.S_IRUSR|stat.S_IWUSR|stat.S_IRGRP)
+
+        self.thread = threading.Thread(target=self.run, name="audit-log")
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def record(self, backend, action, obj):
+        '''
+        Queue an audit log entry for the given object.
+        '''
+
+        if self.error is not None:
+            return
+
+        self.queue.put(json.dumps(
+            {
+                "time": time.time(),
+                "backend": backend,
+                "action": action,
+                "object": obj.as_dict(),
+            },
+            sort_keys=True,
+        ))
+
+
+    def run(self):
+        '''
+        Audit log writer thread main loop.
+        '''
+
+        while True:
+            line = self.queue.get()
+            if line is None:
+                break
+            if self.error is not None:
+                continue
+
+            try:
+                self.file.write(line)
+                self.file.write("\n")
+            # pylint: disable=broad-except
+            except Exception as err:
+                self.error = err
+                if self.logger is not None:
+                    self.logger.error(
+                        "Unable to write audit log '%s', discarding later entries: %s",
+                        self.path, err,
+                    )
+
+        try:
+            self.file.close()
+        # pylint: disable=broad-except
+        except Exception as err:
+            if self.error is None:
+                self.error = err
+
+
+    def close(self):
+        '''
+        Write out all queued entries and close the audit log. Raises an
+        AuditLogError if any entries could not be written.
+        '''
+
+        self.queue.put(None)
+        self.thread.join()
+
+        if self.error is not None:
+            raise AuditLogError(
+                "unable to write audit log '{}': {}".format(self.path, self.error),
+            ) from self.error
+
+
+class ObjectTrace(object):
+    '''
+    Per-object trace for the backend read and write loops.
+
+    Debug messages are only formatted if debug logging is enabled,
+    and then only for every Nth object if sampling is configured.
+    Every object is recorded to the audit log, if one is configured.
+    '''
+
+
+    # pylint: disable=too-few-public-methods
+
+
+    def __init__(self, logger, sample=1, audit_log=None):
+        '''
+        Object trace constructor.
+        '''
+
+        self.logger = logger
+        self.sample = max(1, sample)
+        self.audit_log = audit_log
+
+        self.counter = itertools.count()
+
+
+    def record(self, backend, action, obj):
+        '''
+        Trace the given action on the given object.
+        '''
+
+        if self.audit_log is not None:
+            self.audit_log.record(backend, action, obj)
+
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
+        if self.sample > 1 and next(self.counter) % self.sample:
+            return
+
+        self.logger.debug("%s: %s %s", backend, action, obj)
@@ -0,0 +1,268 @@
+#
+# IPAM database migration script
+# ipam_migrator/transform.py - declarative field mappings between systems
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Declarative field mappings between systems.
+
+A transform configuration is a JSON object, keyed by object type
+("ip_addresses", "prefixes", "vlans" or "vrfs"), of objects mapping output
+fields to rules for getting their values from the raw input records.
+Output fields can be nested using dots (e.g. "custom_fields.note").
+
+Each rule is an object with one of the following keys:
+
+* field: the input field to copy (nested using dots, e.g. "tenant.slug")
+* value: a constant value
+
+and optionally:
+
+* map: an object mapping input values (as strings) to output values
+* default: the value to use if the input field is unset, or its value
+  is not in the map
+
+Unset input fields (missing, null or empty strings) with no default are
+left out of the output. For example:
+
+    {
+        "ip_addresses": {
+            "dns_name": {"field": "hostname"},
+            "status": {"field": "tag", "map": {"2": "active", "3": "reserved"},
+                       "default": "active"},
+            "custom_fields.note": {"field": "note"}
+        }
+    }
+
+The configuration is compiled once into a mapper function for each object
+type, so the rules are not interpreted again for every object.
+'''
+
+
+import json
+
+from ipam_migrator.exception import TransformError
+
+
+class Transform(object):
+    '''
+    Compiled transform configuration.
+    '''
+
+
+    OBJ_TYPES = ("ip_addresses", "prefixes", "vlans", "vrfs")
+
+    RULE_KEYS = frozenset(("field", "value", "map", "default"))
+
+
+    def __init__(self, config):
+        '''
+        Transform object constructor, compiling the given configuration.
+        '''
+
+        if not isinstance(config, dict):
+            raise TransformError("transform configuration must be a JSON object")
+
+        # Object type -> mapper function.
+        self.mappers = {}
+        # Object type -> input fields used by the mapper.
+        self.fields = {}
+        # Object type -> output fields set by the mapper.
+        self.targets = {}
+
+        for obj_type, rules in config.items():
+            if obj_type not in self.OBJ_TYPES:
+                raise TransformError(
+                    "unknown object type '{}' in transform configuration, "
+                    "expected one of: {}".format(obj_type, ", ".join(self.OBJ_TYPES)),
+                )
+            if not isinstance(rules, dict):
+                raise TransformError("rules for {} must be a JSON object".format(obj_type))
+            if rules:
+                self.mappers[obj_type] = self.mapper_compile(obj_type, rules)
+                self.fields[obj_type] = frozenset((
+                    rule["field"].split(".")[0] for rule in rules.values() if "field" in rule
+                ))
+                self.targets[obj_type] = frozenset((target.split(".")[0] for target in rules))
+
+
+    def __bool__(self):
+        '''
+        Return True if the transform changes any object type.
+        '''
+
+        return bool(self.mappers)
+
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Read and compile a transform configuration from the given JSON file.
+        '''
+
+        try:
+            with open(path, "r", encoding="UTF-8") as config_file:
+                config = json.load(config_file)
+        except (OSError, ValueError) as err:
+            raise TransformError(
+                "unable to read transform file '{}': {}".format(path, err),
+            ) from err
+
+        return cls(config)
+
+
+    def apply(self, obj_type, data, obj):
+        '''
+        Set the overrides of the given object of the given type from its
+        raw input record, returning the object.
+        '''
+
+        mapper = self.mappers.get(obj_type)
+        if mapper is not None:
+            obj.overrides = mapper(data)
+        return obj
+
+
+    def fields_get(self, obj_type):
+        '''
+        Get the input fields used by the mapper for the given object type.
+        '''
+
+        return self.fields.get(obj_type, frozenset())
+
+
+    def targets_get(self, obj_type):
+        '''
+        Get the output fields set by the mapper for the given object type.
+        '''
+
+        return self.targets.get(obj_type, frozenset())
+
+
+    #
+    ##
+    #
+
+
+    def mapper_compile(self, obj_type, rules):
+        '''
+        Compile the rules for an object type into a mapper function, which
+        returns the overrides for a raw input record (or None if there are
+        none).
+        '''
+
+        steps = [
+            (tuple(target.split(".")), self.rule_compile(obj_type, target, rule))
+            for target, rule in sorted(rules.items())
+        ]
+
+        def mapper(data):
+            '''
+            Get the overrides for a raw input record.
+            '''
+            overrides = {}
+            for path, getter in steps:
+                value = getter(data)
+                if value is None:
+                    continue
+                parent = overrides
+                for key in path[:-1]:
+                    parent = parent.setdefault(key, {})
+                parent[path[-1]] = value
+            return overrides if overrides else None
+
+        return mapper
+
+
+    def rule_compile(self, obj_type, target, rule):
+        '''
+        Compile a rule into a getter function, which returns the value of
+        the output field for a raw input record (or None if it is unset).
+        '''
+
+        if not isinstance(rule, dict) or not rule.keys() <= self.RULE_KEYS or \
+           ("field" in rule) == ("value" in rule):
+            raise TransformError(
+                "invalid rule for {} field '{}': expected an object with either "
+                "'field' or 'value', and optionally 'map' and 'default'".format(obj_type, target),
+            )
+
+        if "value" in rule:
+            value = rule["value"]
+            return lambda data: value
+
+        getter = self.field_getter_compile(rule["field"])
+
+        default = rule.get("default")
+
+        if "map" in rule:
+            if not isinstance(rule["map"], dict):
+                raise TransformError(
+                    "invalid map for {} field '{}': expected an object".format(obj_type, target),
+                )
+            table = {str(k): v for k, v in rule["map"].items()}
+            def map_getter(data):
+                '''
+                Get a mapped input field value.
+                '''
+                value = getter(data)
+                return table.get(str(value), default) if value is not None else default
+            return map_getter
+
+        if default is not None:
+            def default_getter(data):
+                '''
+                Get an input field value, or the default if it is unset.
+                '''
+                value = getter(data)
+                return value if value is not None else default
+            return default_getter
+
+        return getter
+
+
+    @staticmethod
+    def field_getter_compile(field):
+        '''
+        Compile an input field name into a getter function, which returns
+        the value of the field in a raw input record, or None if it is unset.
+        '''
+
+        path = tuple(field.split("."))
+
+        if len(path) == 1:
+            key = path[0]
+            def getter(data):
+                '''
+                Get an input field value.
+                '''
+                value = data.get(key)
+                return value if value != "" else None
+            return getter
+
+        def nested_getter(data):
+            '''
+            Get a nested input field value.
+            '''
+            value = data
+            for key in path:
+                if not isinstance(value, dict):
+                    return None
+                value = value.get(key)
+            return value if value != "" else None
+        return nested_getter
@@ -0,0 +1,317 @@
+#
+# IPAM database migration script
+# ipam_migrator/validate.py - database validation before writing
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Database validation before writing.
+'''
+
+
+import bisect
+import collections
+import json
+
+
+ValidationIssue = collections.namedtuple(
+    "ValidationIssue",
+    ("check", "severity", "obj_type", "obj_id", "message"),
+)
+
+
+class ValidationReport(object):
+    '''
+    Report of the issues found by validating a database.
+    '''
+
+
+    # Severity of the issues found by each check. Errors are issues which
+    # would cause objects to be rejected or merged together when written,
+    # warnings are issues which would cause information to be lost.
+    CHECKS = collections.OrderedDict((
+        ("duplicate_ip_address", "error"),
+        ("duplicate_prefix", "error"),
+        ("duplicate_vlan_vid", "error"),
+        ("dangling_vlan_reference", "warning"),
+        ("dangling_vrf_reference", "warning"),
+        ("ip_address_outside_prefix", "warning"),
+    ))
+
+
+    def __init__(self, name):
+        '''
+        Validation report object constructor.
+        '''
+
+        self.name = name
+        self.issues = []
+        self.counts = collections.Counter()
+
+
+    def __bool__(self):
+        '''
+        Return True if any issues were found.
+        '''
+
+        return bool(self.issues)
+
+
+    def add(self, check, obj_type, obj, message):
+        '''
+        Add an issue found by the given check for the given object.
+        '''
+
+        self.issues.append(ValidationIssue(
+            check,
+            self.CHECKS[check],
+            obj_type,
+            obj.id_get(),
+            message,
+        ))
+        self.counts[check] += 1
+
+
+    def errors(self):
+        '''
+        Get the number of errors found.
+        '''
+
+        return sum((c for k, c in self.counts.items() if self.CHECKS[k] == "error"))
+
+
+    def warnings(self):
+        '''
+        Get the number of warnings found.
+        '''
+
+        return sum((c for k, c in self.counts.items() if self.CHECKS[k] == "warning"))
+
+
+    def as_dict(self):
+        '''
+        Dictionary representation of the validation report.
+        '''
+
+        return {
+            "name": self.name,
+            "errors": self.errors(),
+            "warnings": self.warnings(),
+            "counts": {check: self.counts[check] for check in self.CHECKS},
+            "issues": [issue._asdict() for issue in self.issues],
+        }
+
+
+    def json(self):
+        '''
+        JSON representation of the validation report.
+        '''
+
+        return json.dumps(self.as_dict(), sort_keys=True, indent=4)
+
+
+    def log(self, logger, examples=10):
+        '''
+        Log a summary of the validation report, with up to the given
+        number of example issues for each check.
+        '''
+
+        logger.info(
+            "Validated %s database: %i errors, %i warnings.",
+            self.name, self.errors(), self.warnings(),
+        )
+
+        logged = collections.Counter()
+        for issue in self.issues:
+            if logged[issue.check] >= examples:
+                continue
+            logged[issue.check] += 1
+            log_func = logger.error if issue.severity == "error" else logger.warning
+            log_func("%s: %s", issue.check, issue.message)
+
+        for check, count in self.counts.items():
+            if count > examples:
+                logger.info("%s: %i more not shown", check, count - examples)
+
+
+class IntervalIndex(object):
+    '''
+    Index of the address ranges covered by a set of IP prefixes, merged into
+    sorted non-overlapping intervals for O(log n) containment lookups.
+    '''
+
+
+    def __init__(self, networks):
+        '''
+        Interval index object constructor.
+        '''
+
+        intervals = sorted(
+            (int(n.network_address), int(n.broadcast_address)) for n in networks
+        )
+
+        self.starts = []
+        self.ends = []
+
+        for start, end in intervals:
+            if self.ends and start <= self.ends[-1] + 1:
+                if end > self.ends[-1]:
+                    self.ends[-1] = end
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+
+    def __contains__(self, address):
+        '''
+        Check whether the given address is inside any of the indexed prefixes.
+        '''
+
+        value = int(address)
+        i = bisect.bisect_right(self.starts, value) - 1
+        return i >= 0 and value <= self.ends[i]
+
+
+def database_validate(database):
+    '''
+    Validate the given database, returning a ValidationReport.
+
+    Reference and containment checks are skipped for object types not
+    read into the database (e.g. when VLANs are not being migrated),
+    as every reference would be reported otherwise.
+    '''
+
+    report = ValidationReport(database.name)
+
+    duplicates_check(
+        report, "duplicate_ip_address", "ip_address",
+        database.ip_addresses.values(),
+        lambda a: (vrf_id_get(a.vrf_id), a.address),
+        lambda a, o: "{} (ID {}) duplicates ID {} in {}".format(
+            a, a.id_get(), o.id_get(), vrf_describe(database, a.vrf_id),
+        ),
+    )
+
+    duplicates_check(
+        report, "duplicate_prefix", "prefix",
+        database.prefixes.values(),
+        lambda p: (vrf_id_get(p.vrf_id), p.prefix),
+        lambda p, o: "{} (ID {}) duplicates ID {} in {}".format(
+            p, p.id_get(), o.id_get(), vrf_describe(database, p.vrf_id),
+        ),
+    )
+
+    duplicates_check(
+        report, "duplicate_vlan_vid", "vlan",
+        database.vlans.values(),
+        lambda v: v.vid,
+        lambda v, o: "{} (ID {}) duplicates ID {}".format(
+            v, v.id_get(), o.id_get(),
+        ),
+    )
+
+    if database.vlans:
+        for prefix in database.prefixes.values():
+            if prefix.vlan_id and prefix.vlan_id not in database.vlans:
+                report.add(
+                    "dangling_vlan_reference", "prefix", prefix,
+                    "{} references unknown VLAN {}".format(prefix, prefix.vlan_id),
+                )
+
+    if database.vrfs:
+        for obj_type, objs in (("prefix", database.prefixes.values()),
+                               ("ip_address", database.ip_addresses.values())):
+            for obj in objs:
+                if obj.vrf_id and obj.vrf_id not in database.vrfs:
+                    report.add(
+                        "dangling_vrf_reference", obj_type, obj,
+                        "{} references unknown VRF {}".format(obj, obj.vrf_id),
+                    )
+
+    if database.prefixes:
+        containment_check(report, database)
+
+    return report
+
+
+def duplicates_check(report, check, obj_type, objs, key_func, message_func):
+    '''
+    Report objects with the same key as an earlier object,
+    using a hash index of the keys seen so far.
+    '''
+
+    # pylint: disable=too-many-arguments
+
+    seen = {}
+
+    for obj in sorted(objs, key=lambda o: o.id_get()):
+        key = key_func(obj)
+        other = seen.get(key)
+        if other is not None:
+            report.add(check, obj_type, obj, message_func(obj, other))
+        else:
+            seen[key] = obj
+
+
+def containment_check(report, database):
+    '''
+    Report IP addresses not inside any prefix in their VRF. IP addresses
+    without a VRF may be inside a prefix in any VRF, as some backends
+    (e.g. phpIPAM) only assign VRFs to prefixes.
+    '''
+
+    networks = collections.defaultdict(list)
+    for prefix in database.prefixes.values():
+        version = prefix.prefix.version
+        networks[(vrf_id_get(prefix.vrf_id), version)].append(prefix.prefix)
+        networks[(False, version)].append(prefix.prefix)
+
+    indexes = {key: IntervalIndex(nets) for key, nets in networks.items()}
+    empty = IntervalIndex(())
+
+    for ip_address in database.ip_addresses.values():
+        vrf_id = vrf_id_get(ip_address.vrf_id)
+        key = (vrf_id if vrf_id is not None else False, ip_address.address.version)
+        if ip_address.address not in indexes.get(key, empty):
+            report.add(
+                "ip_address_outside_prefix", "ip_address", ip_address,
+                "{} is not inside any prefix in {}".format(
+                    ip_address,
+                    vrf_describe(database, ip_address.vrf_id) if vrf_id else "any VRF",
+                ),
+            )
+
+
+def vrf_id_get(vrf_id):
+    '''
+    Get the VRF ID to index an object by, with None for objects without
+    a VRF (some backends use 0 for no VRF).
+    '''
+
+    return vrf_id if vrf_id else None
+
+
+def vrf_describe(database, vrf_id):
+    '''
+    Describe the given VRF for validation messages.
+    '''
+
+    if not vrf_id:
+        return "the global table"
+    if vrf_id in database.vrfs:
+        return str(database.vrfs[vrf_id])
+    return "VRF {}".format(vrf_id)
@@ -0,0 +1,253 @@
+#
+# IPAM database migration script
+# ipam_migrator/verify.py - cross-system verification of migrated databases
+#
+# Copyright (c) 2017 Catalyst.net Ltd
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+'''
+Cross-system verification of migrated databases.
+'''
+
+
+import collections
+import json
+
+from ipam_migrator.db.database import Database
+
+
+class VerifyReport(object):
+    '''
+    Report of the differences between a source and a target database.
+
+    For each object type, counts the objects which match, are missing from
+    the target, are extra on the target, or differ between the two, and
+    keeps up to a fixed number of examples of each kind of difference.
+    '''
+
+
+    OBJ_TYPES = ("vrfs", "vlans", "prefixes", "ip_addresses")
+
+    RESULTS = ("matched", "missing", "extra", "differing")
+
+
+    def __init__(self, source, target, examples=10):
+        '''
+        Verification report object constructor.
+        '''
+
+        self.source = source
+        self.target = target
+        self.examples_max = examples
+
+        self.counts = collections.OrderedDict(
+            (obj_type, collections.OrderedDict(((r, 0) for r in self.RESULTS)))
+            for obj_type in self.OBJ_TYPES
+        )
+        self.examples = collections.OrderedDict(
+            (obj_type, collections.OrderedDict(((r, []) for r in self.RESULTS[1:])))
+            for obj_type in self.OBJ_TYPES
+        )
+
+
+    def __bool__(self):
+        '''
+        Return True if any differences were found.
+        '''
+
+        return any((
+            counts["missing"] or counts["extra"] or counts["differing"]
+            for counts in self.counts.values()
+        ))
+
+
+    def add(self, obj_type, result, example=None, count=1):
+        '''
+        Count objects with the given verification result,
+        keeping the given example if there is room for it.
+        '''
+
+        self.counts[obj_type][result] += count
+        if example is not None and len(self.examples[obj_type][result]) < self.examples_max:
+            self.examples[obj_type][result].append(example)
+
+
+    def as_dict(self):
+        '''
+        Dictionary representation of the verification report.
+        '''
+
+        return {
+            "source": self.source,
+            "target": self.target,
+            "counts": self.counts,
+            "examples": self.examples,
+        }
+
+
+    def json(self):
+        '''
+        JSON representation of the verification report.
+        '''
+
+        return json.dumps(self.as_dict(), indent=4)
+
+
+    def log(self, logger):
+        '''
+        Log the verification report.
+        '''
+
+        logger.info(
+            "Verified %s against %s: %s.",
+            self.target, self.source,
+            "differences found" if self else "no differences found",
+        )
+
+        for obj_type, counts in self.counts.items():
+            logger.info(
+                "- %s: %s",
+                obj_type,
+                ", ".join(("{} {}".format(c, r) for r, c in counts.items())),
+            )
+
+        for obj_type, examples in self.examples.items():
+            for key in examples["missing"]:
+                logger.warning("%s missing from %s: %s", obj_type, self.target, key)
+            for key in examples["extra"]:
+                logger.warning("%s extra on %s: %s", obj_type, self.target, key)
+            for example in examples["differing"]:
+                logger.warning(
+                    "%s differing on %s: %s: %s",
+                    obj_type, self.target, example["key"],
+                    ", ".join((
+                        "{} {!r} != {!r}".format(field, source, target)
+                        for field, (source, target) in sorted(example["fields"].items())
+                    )),
+                )
+
+
+def database_verify(source, target, examples=10):
+    '''
+    Compare the given source and target databases, returning a VerifyReport.
+
+    Objects are matched by their keys across systems (see
+    Database.obj_key_get), and compared by their digests, which cover their
+    content fingerprints and the keys of the objects they reference.
+    The rollups of both databases are compared first, and only the objects
+    in buckets which differ are merged, as sorted (key, digest, ID) lists.
+
+    Both databases are compared as a whole, and so need to be read
+    into memory in full first.
+    '''
+
+    report = VerifyReport(source.name, target.name, examples=examples)
+
+    for obj_type in VerifyReport.OBJ_TYPES:
+        source_digests = source.digests_get(obj_type)
+        target_digests = target.digests_get(obj_type)
+
+        source_rollup = source.rollup(obj_type, source_digests)
+        target_rollup = target.rollup(obj_type, target_digests)
+
+        buckets_differing = set(Database.rollup_diff(source_rollup, target_rollup))
+
+        for bucket in sorted(set(source_rollup) | set(target_rollup)):
+            if bucket not in buckets_differing:
+                report.add(obj_type, "matched", count=source_rollup[bucket][1])
+                continue
+            merge(
+                report, obj_type,
+                source, target,
+                source_digests.get(bucket, []),
+                target_digests.get(bucket, []),
+            )
+
+    return report
+
+
+def merge(report, obj_type, source, target, source_digests, target_digests):
+    '''
+    Merge the given sorted (key, digest, ID) lists of a source and target
+    database, adding the results to the report.
+    '''
+
+    # pylint: disable=too-many-arguments
+
+    i = 0
+    j = 0
+
+    while i < len(source_digests) or j < len(target_digests):
+        if j >= len(target_digests) or \
+           (i < len(source_digests) and source_digests[i][0] < target_digests[j][0]):
+            report.add(obj_type, "missing", key_format(source_digests[i][0]))
+            i += 1
+
+        elif i >= len(source_digests) or source_digests[i][0] > target_digests[j][0]:
+            report.add(obj_type, "extra", key_format(target_digests[j][0]))
+            j += 1
+
+        else:
+            key, source_digest, source_id = source_digests[i]
+            _, target_digest, target_id = target_digests[j]
+            if source_digest == target_digest:
+                report.add(obj_type, "matched")
+            elif len(report.examples[obj_type]["differing"]) < report.examples_max:
+                # Only normalise the objects for reported examples.
+                source_data = obj_normalise(source, getattr(source, obj_type)[source_id])
+                target_data = obj_normalise(target, getattr(target, obj_type)[target_id])
+                report.add(obj_type, "differing", {
+                    "key": key_format(key),
+                    "fields": {
+                        field: (source_data.get(field), target_data.get(field))
+                        for field in sorted(set(source_data) | set(target_data))
+                        if source_data.get(field) != target_data.get(field)
+                    },
+                })
+            else:
+                report.add(obj_type, "differing")
+            i += 1
+            j += 1
+
+
+def obj_normalise(database, obj):
+    '''
+    Get the normalised dictionary representation of the given object, with
+    its fingerprinted fields, and references replaced by the keys of the
+    referenced objects.
+    '''
+
+    data = obj.fingerprint_fields()
+
+    if hasattr(obj, "vrf_id"):
+        data["vrf"] = database.vrf_key_get(obj.vrf_id)
+    if hasattr(obj, "vlan_id"):
+        data["vlan"] = database.vlan_key_get(obj.vlan_id)
+
+    # Unset text fields are empty strings on some backends.
+    for key, value in data.items():
+        if value == "":
+            data[key] = None
+
+    return data
+
+
+def key_format(key):
+    '''
+    Format an object key for reports.
+    '''
+
+    return " ".join((part for part in key if part))